@@ -1,108 +1,148 @@
+import io
 import os
+import time
+import uuid
 import logging
-from flask import Flask, request, jsonify
+from tempfile import SpooledTemporaryFile
+from flask import Flask, Request, request, jsonify, Response
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import google.genai as genai
-from dotenv import load_dotenv  # Import the load_dotenv function
+from google.genai import types
+from shared import (
+    COALESCE_REQUESTS,
+    FILE_REGISTRY_SETTINGS,
+    GENAI_API_KEY,
+    GENAI_STUB,
+    GENAI_TIMEOUT_S,
+    HEDGE_ANALYSIS,
+    HEDGE_DEADLINE_S,
+    HEDGE_DELAY_S,
+    HEDGE_LOCAL_URL,
+    HEDGE_MAX_CONNECTIONS,
+    HEDGE_WORKERS,
+    SCHEDULER_SETTINGS,
+    UPLOAD_SPOOL_MAX_BYTES,
+    allowed_file,
+    check_api_key,
+    create_chat_cache,
+    create_image_prep,
+    generate_prompt,
+    get_chat_prompt,
+    get_mime_type,
+    local_analysis,
+    metrics,
+    profiler,
+    render_metrics,
+    upstream_error_status,
+)
+from utils.file_registry import UploadRegistry, content_key
+from utils.hedging import PRIMARY, Hedger, LocalPredictClient
+from utils.single_flight import SingleFlight
+from utils.scheduler import PRIORITY_CHAT, PRIORITY_IMAGE, SyncScheduler, estimate_tokens
+from utils.streaming import MEDIA_TYPES, STREAM_HEADERS, iter_events, open_stream, stream_format
+
+# Configure logging (set LOG_LEVEL=DEBUG to log full model responses)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
+
+# Configuration and helpers shared with asgi.py live in shared.py; the objects below belong to this app
+check_api_key()
+if profiler is not None:
+    profiler.start()
+
+UPLOAD_FOLDER = "uploads"
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Set UPLOAD_VIA_DISK=1 to save each upload to UPLOAD_FOLDER first (the old path, kept for comparison)
+UPLOAD_VIA_DISK = os.getenv('UPLOAD_VIA_DISK') == '1'
+
+
+class SpooledRequest(Request):
+    """Request whose file parts are buffered in memory up to UPLOAD_SPOOL_MAX_BYTES instead of 500 KB."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES, mode="rb+")
+
+
+image_prep = create_image_prep()
+chat_cache = create_chat_cache()
+file_registry = UploadRegistry(**FILE_REGISTRY_SETTINGS)
+llm_flights = SingleFlight()
+scheduler = SyncScheduler(**SCHEDULER_SETTINGS)
+hedger = Hedger(HEDGE_DELAY_S, workers=HEDGE_WORKERS) if HEDGE_ANALYSIS else None
+local_predict = LocalPredictClient(HEDGE_LOCAL_URL, HEDGE_DEADLINE_S, HEDGE_MAX_CONNECTIONS) if HEDGE_ANALYSIS else None
+
+
+def coalesced(key, fn):
+    """Return fn(), sharing one run among concurrent callers with the same key."""
+    if not COALESCE_REQUESTS:
+        return fn()
+    return llm_flights.do(key, fn)[0]
 
-# Load environment variables from .env file
-load_dotenv()
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 
 # Flask app setup
 app = Flask(__name__)
+app.request_class = SpooledRequest
 CORS(app)  # Allow all origins (for development)
 
-# Configuration
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-# Load API Key from environment variable
-GENAI_API_KEY = os.getenv('GOOGLE_API_KEY')  # Ensure your API key is set in the environment
-print(GENAI_API_KEY)
-if not GENAI_API_KEY:
-    logging.error("No API_KEY found. Please set the GOOGLE_API_KEY environment variable.")
-    raise ValueError("No API_KEY found. Please set the GOOGLE_API_KEY environment variable.")
-
 # Initialize Gemini client lazily
 client = None
 
 def get_genai_client():
     global client
     if client is None:
-        client = genai.Client(api_key=GENAI_API_KEY)
+        if GENAI_STUB:
+            from utils.genai_stub import StubClient
+            client = StubClient()
+        else:
+            client = genai.Client(api_key=GENAI_API_KEY,
+                                  http_options=types.HttpOptions(timeout=int(GENAI_TIMEOUT_S * 1000)))
     return client
 
-ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
-
-MIME_TYPES = {
-    'jpg': 'image/jpeg',
-    'jpeg': 'image/jpeg',
-    'png': 'image/png',
-    'gif': 'image/gif',
-    'webp': 'image/webp',
-}
-
-def allowed_file(filename):
-    """Check if the uploaded file is in an allowed format."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def get_mime_type(filename):
-    """Return the MIME type based on the file extension."""
-    ext = filename.rsplit('.', 1)[1].lower()
-    return MIME_TYPES.get(ext, 'application/octet-stream')
-
-def generate_prompt(user_query, language):
-    """Generate a structured prompt for plant health analysis with numbered, concise responses."""
-
-    if language == 'hi':  # Hindi
-        base_prompt = (
-            "पौधे की छवि का विश्लेषण करें और निम्न प्रारूप में उत्तर दें बिना किसी अतिरिक्त जानकारी और विशेष वर्णों के:\n"
-            "1. वर्तमान स्वास्थ्य स्थिति: पौधे के स्वास्थ्य का विस्तृत विवरण\n"
-            "2. संभावित बीमारियां या समस्याएं: किसी भी संभावित स्वास्थ्य जोखिम का वर्णन\n"
-            "3. तत्काल उपचार सिफारिशें: तुरंत की जाने वाली कार्रवाई\n"
-            "4. दीर्घकालिक देखभाल सुझाव: भविष्य में पौधे की देखभाल के लिए मार्गदर्शन\n"
-            "\n"
-            f"किसान का सवाल: {user_query}\n"
-            "उत्तर स्पष्ट, संक्षिप्त और सटीक होने चाहिए बिना किसी अतिरिक्त विशेष वर्णों के।"
-        )
-
-        if "कीट" in user_query or "कीटों" in user_query:
-            base_prompt += "\n कीट नियंत्रण पर विशेष ध्यान दें।"
-        elif "उर्वरक" in user_query or "खाद" in user_query:
-            base_prompt += "\n पोषण और उर्वरक की आवश्यकताओं पर ध्यान दें।"
-
-        return base_prompt
-
-    else:  # Default to English
-        base_prompt = (
-            "Analyze the plant image and respond in the following format without any extra information and special character:\n"
-            "1. Current health status: Detailed description of the plant's health\n"
-            "2. Potential diseases or issues: Description of any potential health risks\n"
-            "3. Immediate treatment recommendations: Actions to take immediately\n"
-            "4. Long-term care suggestions: Guidance for future plant care\n"
-            "\n"
-            f"Farmer's specific query: {user_query}\n"
-            "Responses must be clear, concise, and precise,without any extra special characters."
-        )
-
-        if "pest" in user_query or "insect" in user_query:
-            base_prompt += "\n Focus specifically on pest control methods."
-        elif "fertilizer" in user_query or "manure" in user_query:
-            base_prompt += "\n Focus specifically on nutritional needs and fertilization."
-
-        return base_prompt
-
 
 @app.route("/", methods=["GET"])
 def home():
     return jsonify({"analysis": "Hello Team"}), 200
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus text exposition of per-stage request latencies."""
+    return Response(render_metrics(chat_cache, file_registry, llm_flights, scheduler, image_prep, hedger),
+                    mimetype="text/plain; version=0.0.4")
+
+@app.route("/metrics/profile", methods=["GET"])
+def profile_endpoint():
+    """Folded stacks from the sampling profiler (enable with PROFILE_SAMPLE_HZ)."""
+    if profiler is None:
+        return jsonify({"error": "Profiler disabled. Set PROFILE_SAMPLE_HZ to enable it."}), 404
+    return Response(profiler.collapsed(reset=request.args.get('reset', '').lower() in ('1', 'true')), mimetype="text/plain")
+
+def stream_response(route, fmt, stream, request_started, on_complete=None, headers=None):
+    """
+    Send an opened model stream (see utils/streaming.py) as SSE or NDJSON.
+
+    The route's 'total' is observed from `request_started` when the stream completes, not when the view returns.
+    """
+    first, iterator = stream
+    started = time.perf_counter()
+
+    def finish(answer):
+        finished = time.perf_counter()
+        metrics.observe(route, 'stream', finished - started)
+        metrics.observe(route, 'total', finished - request_started)
+        if on_complete is not None:
+            on_complete(answer)
+
+    return Response(
+        iter_events(fmt, first, iterator, finish),
+        mimetype=MEDIA_TYPES[fmt],
+        headers={**STREAM_HEADERS, **(headers or {})},
+    )
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Handle file uploads and return analysis results."""
+    """Handle file uploads and return analysis results (streamed with ?stream=sse or ?stream=ndjson)."""
+    started = time.perf_counter()
+    fmt = stream_format(request.args.get('stream'), request.headers.get('Accept'))
     if "file" not in request.files:
         return jsonify({"error": "No file uploaded."}), 400
 
@@ -113,12 +153,15 @@ def upload_file():
     if not allowed_file(file.filename):
         return jsonify({"error": "File type not allowed. Only images are supported."}), 400
 
-    # Securely save the file
-    filename = secure_filename(file.filename)
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(file_path)
-
-    logging.info(f"File saved at: {file_path}")
+    streaming = False
+    file_path = None
+    if UPLOAD_VIA_DISK:
+        # Prefix a random id so concurrent uploads of the same filename do not overwrite each other
+        filename = secure_filename(file.filename)
+        file_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{filename}")
+        with metrics.time('upload', 'disk_save'):
+            file.save(file_path)
+        logging.info(f"File saved at: {file_path}")
 
     try:
         # Prepare the prompt based on user query and selected language
@@ -126,59 +169,107 @@ def upload_file():
         language = request.form.get('language', 'en')  # Get the user's selected language
         prompt = generate_prompt(user_query, language)
 
-        # Upload the file to the Gemini AI API
-        mime_type = get_mime_type(filename)
+        mime_type = get_mime_type(file.filename)
         genai_client = get_genai_client()
-        sample_file = genai_client.files.upload(file=open(file_path, 'rb'), config={"mime_type": mime_type})
+        hedged = hedger is not None and fmt is None
+        deadline = time.monotonic() + (HEDGE_DEADLINE_S if hedged else GENAI_TIMEOUT_S)
+        tokens = estimate_tokens(prompt, images=1)
+        image_bytes = None
+        if hedged:
+            # A hedged Gemini call can outlive the request, so it reads from a copy rather than the request's file
+            file.stream.seek(0)
+            image_bytes = file.stream.read()
+        with metrics.time('upload', 'hash'):
+            image_key = content_key(file.stream, mime_type)
+
+        def upload():
+            # Upload the file to the Gemini AI API (skipped by the registry when this image is already there).
+            # Without UPLOAD_VIA_DISK the spooled request body is read directly: no write, reopen or unlink
+            if image_bytes is not None:
+                source = io.BytesIO(image_bytes)
+            else:
+                source = file.stream if file_path is None else open(file_path, 'rb')
+            try:
+                with metrics.time('upload', 'preprocess'):
+                    body, body_type = image_prep.prepare(source, mime_type)
+
+                def send():
+                    body.seek(0)
+                    return genai_client.files.upload(file=body, config={"mime_type": body_type})
+                with metrics.time('upload', 'gemini_upload'):
+                    # The Files API is not metered by the model quota, so the call only queues and retries
+                    return scheduler.call(send, PRIORITY_IMAGE, tokens=0, requests=0, deadline=deadline)
+            finally:
+                if source is not file.stream:
+                    source.close()
 
         # Call the API with the prompt and the uploaded file
-        response = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[prompt, sample_file],
-        )
+        if fmt is not None:
+            def start_stream(sample_file):
+                with metrics.time('upload', 'first_chunk'):
+                    return scheduler.call(lambda: open_stream(genai_client.models.generate_content_stream(
+                        model="gemini-2.5-flash",
+                        contents=[prompt, sample_file],
+                    )), PRIORITY_IMAGE, tokens=tokens, deadline=deadline)
+            stream = file_registry.run(image_key, upload, start_stream)
+            streaming = True
+            return stream_response('upload', fmt, stream, started)
+
+        def analyze(sample_file):
+            with metrics.time('upload', 'generate_content'):
+                return scheduler.call(lambda: genai_client.models.generate_content(
+                    model="gemini-2.5-flash",
+                    contents=[prompt, sample_file],
+                ), PRIORITY_IMAGE, tokens=tokens, deadline=deadline)
+
+        def ask_gemini():
+            return coalesced(('upload', prompt, image_key), lambda: file_registry.run(image_key, upload, analyze))
+
+        def ask_local():
+            with metrics.time('upload', 'local_predict'):
+                prediction = local_predict.predict(secure_filename(file.filename), image_bytes, mime_type)
+            return local_analysis(prediction, language)
+
+        if hedged:
+            source, response = hedger.run(ask_gemini, ask_local, deadline)
+        else:
+            source, response = PRIMARY, ask_gemini()
 
         if response and hasattr(response, 'text'):
-            logging.info(f"Analysis Result: {response.text}")
-            return jsonify({"analysis": response.text}), 200
+            logging.info(f"Analysis generated ({len(response.text or '')} chars)")
+            logging.debug(f"Analysis Result: {response.text}")
+            return jsonify({"analysis": response.text, "source": source}), 200
         else:
             logging.error("Failed to generate analysis from the AI model.")
             return jsonify({"error": "AI analysis failed. Try again later."}), 429
 
     except Exception as e:
-        logging.error(f"Error during processing: {e}")
-        return jsonify({"error": "Failed to analyze the image. Please try again."}), 500
+        logging.error(f"Error during processing: {e!r}")
+        status, headers = upstream_error_status(e)
+        return jsonify({"error": "Failed to analyze the image. Please try again."}), status, headers
 
     finally:
-        # Clean up the uploaded file
-        try:
-            if os.path.exists(file_path):
+        file.close()
+        if file_path is not None:
+            # Clean up the uploaded file
+            cleanup_started = time.perf_counter()
+            try:
                 os.remove(file_path)
                 logging.info(f"Temporary file {file_path} removed successfully.")
-            else:
+            except FileNotFoundError:
                 logging.warning(f"File {file_path} not found for cleanup.")
-        except Exception as cleanup_error:
-            logging.error(f"Error during file cleanup: {cleanup_error}")
-
-def get_chat_prompt(user_message, language):
-    """Generate prompt for AI chat - farming assistant."""
-    if language == 'hi':
-        system_prompt = (
-            "आप एक विशेषज्ञ कृषि सहायक हैं। किसानों के सभी प्रश्नों का स्पष्ट, संक्षिप्त और सही उत्तर दें। "
-            "कृषि, फसलें, कीट नियंत्रण, उर्वरक, सिंचाई, मौसम और संबंधित विषयों पर मदद करें। "
-            "उत्तर हमेशा हिंदी में दें। अगर प्रश्न कृषि से संबंधित नहीं है तो विनम्रता से बताएं कि आप कृषि विशेषज्ञ हैं।"
-        )
-    else:
-        system_prompt = (
-            "You are an expert farming assistant. Answer all farmer questions clearly, concisely and accurately. "
-            "Help with agriculture, crops, pest control, fertilizers, irrigation, weather and related topics. "
-            "Always respond in English. If the question is not related to farming, politely say you are a farming specialist."
-        )
-    return f"{system_prompt}\n\nUser question: {user_message}"
-
+            except Exception as cleanup_error:
+                logging.error(f"Error during file cleanup: {cleanup_error}")
+            metrics.observe('upload', 'cleanup', time.perf_counter() - cleanup_started)
+        if not streaming:
+            metrics.observe('upload', 'total', time.perf_counter() - started)
 
 @app.route('/chat', methods=['POST'])
 def chat():
-    """AI-powered chatbot for all farming queries using Gemini."""
+    """AI-powered chatbot for all farming queries using Gemini (streamed with ?stream=sse or ?stream=ndjson)."""
+    started = time.perf_counter()
+    fmt = stream_format(request.args.get('stream'), request.headers.get('Accept'))
+    streaming = False
     try:
         data = request.json or {}
         user_message = (data.get('message') or '').strip()
@@ -188,16 +279,47 @@ def chat():
             resp = "Please type your question." if language == 'en' else "कृपया अपना प्रश्न टाइप करें।"
             return jsonify({"response": resp}), 400
 
+        if chat_cache is not None:
+            with metrics.time('chat', 'cache_lookup'):
+                cached = chat_cache.get(user_message, language)
+            if cached is not None:
+                if fmt is not None:
+                    streaming = True
+                    return stream_response('chat', fmt, (cached, None), started, headers={"X-Cache": "HIT"})
+                return jsonify({"response": cached}), 200, {"X-Cache": "HIT"}
+
         genai_client = get_genai_client()
         prompt = get_chat_prompt(user_message, language)
-
-        response = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-        )
+        deadline = time.monotonic() + GENAI_TIMEOUT_S
+        tokens = estimate_tokens(prompt)
+
+        if fmt is not None:
+            with metrics.time('chat', 'first_chunk'):
+                stream = scheduler.call(lambda: open_stream(genai_client.models.generate_content_stream(
+                    model="gemini-2.5-flash",
+                    contents=prompt,
+                )), PRIORITY_CHAT, tokens=tokens, deadline=deadline)
+
+            def cache_answer(answer):
+                if chat_cache is not None and answer.strip():
+                    chat_cache.put(user_message, language, answer.strip())
+
+            streaming = True
+            return stream_response('chat', fmt, stream, started, on_complete=cache_answer)
+
+        def generate():
+            with metrics.time('chat', 'generate_content'):
+                return scheduler.call(lambda: genai_client.models.generate_content(
+                    model="gemini-2.5-flash",
+                    contents=prompt,
+                ), PRIORITY_CHAT, tokens=tokens, deadline=deadline)
+        response = coalesced(('chat', prompt), generate)
 
         if response and hasattr(response, 'text') and response.text:
-            return jsonify({"response": response.text.strip()}), 200
+            answer = response.text.strip()
+            if chat_cache is not None:
+                chat_cache.put(user_message, language, answer)
+            return jsonify({"response": answer}), 200
         else:
             fallback = (
                 "I couldn't generate a response. Please try rephrasing your question."
@@ -207,7 +329,8 @@ def chat():
             return jsonify({"response": fallback}), 200
 
     except Exception as e:
-        logging.error(f"Chat error: {e}")
+        logging.error(f"Chat error: {e!r}")
+        status, headers = upstream_error_status(e)
         try:
             lang = (request.json or {}).get('language', 'en')
         except Exception:
@@ -217,7 +340,11 @@ def chat():
             if lang == 'en' else
             "क्षमा करें, समस्या आ रही है। कृपया बाद में पुनः प्रयास करें।"
         )
-        return jsonify({"response": fallback}), 500
+        return jsonify({"response": fallback}), status, headers
+
+    finally:
+        if not streaming:
+            metrics.observe('chat', 'total', time.perf_counter() - started)
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
@@ -0,0 +1,451 @@
+"""
+Async (ASGI) serving mode for ChatBoat.
+
+Serves the same routes as app.py, but /upload and /chat await the async
+Gemini client instead of blocking a worker thread for the whole generation,
+so one process can hold hundreds of pending model calls. Run it with
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+Settings, prompts, validation, metrics and the profiler are shared with app.py
+through shared.py; the scheduler, clients and caches are created in lifespan.
+
+    GENAI_TIMEOUT_S          total time allowed for the Gemini calls of one request (default 60)
+    GENAI_RPM, GENAI_TPM,    quota scheduler settings, shared with app.py (see SCHEDULER_SETTINGS)
+    GENAI_MAX_RETRIES, ...
+    HEDGE_ANALYSIS, ...      hedged /upload analysis with the local AI service, as in app.py
+    GENAI_CONNECT_TIMEOUT_S  TCP/TLS connect timeout to the Gemini API (default 10)
+    GENAI_MAX_CONNECTIONS    size of the shared HTTP connection pool (default 100)
+    MAX_IN_FLIGHT            requests handled at once on /upload and /chat; beyond it
+                             requests get 503 with Retry-After (default 512)
+"""
+from contextlib import asynccontextmanager
+import asyncio
+import io
+import logging
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import google.genai as genai
+from google.genai import types
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+import httpx
+
+from shared import (
+    COALESCE_REQUESTS,
+    FILE_REGISTRY_SETTINGS,
+    GENAI_API_KEY,
+    GENAI_STUB,
+    GENAI_TIMEOUT_S,
+    HEDGE_ANALYSIS,
+    HEDGE_DEADLINE_S,
+    HEDGE_DELAY_S,
+    HEDGE_LOCAL_URL,
+    HEDGE_MAX_CONNECTIONS,
+    SCHEDULER_SETTINGS,
+    UPLOAD_SPOOL_MAX_BYTES,
+    allowed_file,
+    check_api_key,
+    create_chat_cache,
+    create_image_prep,
+    generate_prompt,
+    get_chat_prompt,
+    get_mime_type,
+    local_analysis,
+    metrics,
+    profiler,
+    render_metrics,
+    upstream_error_status,
+)
+from utils.file_registry import AsyncUploadRegistry, content_key
+from utils.hedging import PRIMARY, AsyncHedger, AsyncLocalPredictClient
+from utils.scheduler import PRIORITY_CHAT, PRIORITY_IMAGE, AsyncScheduler, estimate_tokens
+from utils.single_flight import AsyncSingleFlight
+from utils.streaming import MEDIA_TYPES, STREAM_HEADERS, aiter_events, aopen_stream, stream_format
+
+# Configure logging (set LOG_LEVEL=DEBUG to log full model responses)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
+
+GENAI_CONNECT_TIMEOUT_S = float(os.getenv('GENAI_CONNECT_TIMEOUT_S', 10))
+GENAI_MAX_CONNECTIONS = int(os.getenv('GENAI_MAX_CONNECTIONS', 100))
+MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT', 512))
+
+# Async Gemini client (client.aio) and the pooled transport it sends through, created in lifespan
+aio_client = None
+transport = None
+# Pooled client for the local AI service when HEDGE_ANALYSIS=1, created in lifespan
+local_predict = None
+# This app's scheduler, upload registry, request coalescing, hedger and caches, created in lifespan
+scheduler = None
+file_registry = None
+llm_flights = None
+hedger = None
+image_prep = None
+chat_cache = None
+
+
+def create_async_genai_client():
+    """Return (async client, owned httpx transport or None)."""
+    if GENAI_STUB:
+        from utils.genai_stub import StubClient
+        return StubClient().aio, None
+
+    # One keep-alive pool for every request, instead of a TLS handshake per call
+    pool = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=GENAI_MAX_CONNECTIONS, max_keepalive_connections=GENAI_MAX_CONNECTIONS),
+        timeout=httpx.Timeout(GENAI_TIMEOUT_S, connect=GENAI_CONNECT_TIMEOUT_S),
+    )
+    http_options = types.HttpOptions(httpx_async_client=pool, timeout=int(GENAI_TIMEOUT_S * 1000))
+    return genai.Client(api_key=GENAI_API_KEY, http_options=http_options).aio, pool
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global aio_client, transport, local_predict, scheduler, file_registry, llm_flights, hedger, image_prep, chat_cache
+    check_api_key()
+    aio_client, transport = create_async_genai_client()
+    if HEDGE_ANALYSIS:
+        local_predict = AsyncLocalPredictClient(HEDGE_LOCAL_URL, HEDGE_DEADLINE_S, HEDGE_MAX_CONNECTIONS)
+        hedger = AsyncHedger(HEDGE_DELAY_S)
+    scheduler = AsyncScheduler(**SCHEDULER_SETTINGS)
+    file_registry = AsyncUploadRegistry(**FILE_REGISTRY_SETTINGS)
+    llm_flights = AsyncSingleFlight()
+    image_prep = create_image_prep()
+    chat_cache = create_chat_cache()
+    if profiler is not None:
+        profiler.start()
+    yield
+    if profiler is not None:
+        profiler.stop()
+    await asyncio.to_thread(image_prep.close)
+    if chat_cache is not None:
+        await asyncio.to_thread(chat_cache.close)
+    if local_predict is not None:
+        await local_predict.aclose()
+    await scheduler.aclose()
+    await aio_client.aclose()
+    if transport is not None:
+        await transport.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+class InFlightLimit:
+    """Counts requests in progress and refuses new ones past `limit`."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        # Only touched from the event loop, so no lock is needed
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+in_flight = InFlightLimit(MAX_IN_FLIGHT)
+
+
+class UploadParser(MultiPartParser):
+    """
+    Multipart parser that keeps file parts in memory up to UPLOAD_SPOOL_MAX_BYTES, like the
+    Flask app, instead of starlette's 1 MB. /upload runs it only after admitting the request,
+    so at most MAX_IN_FLIGHT bodies are buffered at once; other forms keep the default.
+    """
+
+    spool_max_size = UPLOAD_SPOOL_MAX_BYTES
+
+
+async def read_upload_form(request):
+    """Parse the /upload body into FormData, or raise ValueError if it is not a valid multipart form."""
+    if not request.headers.get('content-type', '').startswith('multipart/form-data'):
+        raise ValueError("No file uploaded.")
+    try:
+        return await UploadParser(request.headers, request.stream(), max_files=1).parse()
+    except MultiPartException as e:
+        raise ValueError(str(e)) from e
+
+
+async def coalesced(key, fn):
+    """Await fn(), sharing one run among concurrent callers with the same key."""
+    if not COALESCE_REQUESTS:
+        return await fn()
+    return (await llm_flights.do(key, fn))[0]
+
+
+def overloaded_response():
+    return JSONResponse({"error": "Server busy. Please retry shortly."}, status_code=503, headers={"Retry-After": "1"})
+
+
+def stream_response(route, fmt, stream, deadline, request_started, on_complete=None, headers=None):
+    """
+    Send an opened model stream (see utils/streaming.py) as SSE or NDJSON.
+
+    Takes over the caller's in-flight slot and releases it once the stream ends. The route's
+    'total' is observed from `request_started` when the stream completes, not when the view returns.
+    """
+    first, iterator = stream
+    started = time.perf_counter()
+
+    def finish(answer):
+        finished = time.perf_counter()
+        metrics.observe(route, 'stream', finished - started)
+        metrics.observe(route, 'total', finished - request_started)
+        if on_complete is not None:
+            on_complete(answer)
+
+    async def body():
+        try:
+            async for event in aiter_events(fmt, first, iterator, finish, deadline):
+                yield event
+        finally:
+            in_flight.release()
+
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[fmt], headers={**STREAM_HEADERS, **(headers or {})})
+
+
+@app.get("/")
+async def home():
+    return {"analysis": "Hello Team"}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition of per-stage request latencies and in-flight requests."""
+    gauges = (
+        f"# TYPE chatboat_in_flight gauge\nchatboat_in_flight {in_flight.in_flight}\n"
+        f"# TYPE chatboat_rejected_total counter\nchatboat_rejected_total {in_flight.rejected}\n"
+    )
+    text = render_metrics(chat_cache, file_registry, llm_flights, scheduler, image_prep, hedger) + gauges
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/profile")
+async def profile_endpoint(reset: bool = False):
+    """Folded stacks from the sampling profiler (enable with PROFILE_SAMPLE_HZ)."""
+    if profiler is None:
+        return JSONResponse({"error": "Profiler disabled. Set PROFILE_SAMPLE_HZ to enable it."}, status_code=404)
+    return PlainTextResponse(profiler.collapsed(reset=reset))
+
+
+@app.post("/upload")
+async def upload_file(request: Request):
+    """Handle file uploads and return analysis results (streamed with ?stream=sse or ?stream=ndjson)."""
+    started = time.perf_counter()
+    fmt = stream_format(request.query_params.get('stream'), request.headers.get('accept'))
+    # Admit the request before reading its body, which may be buffered in memory
+    if not in_flight.try_acquire():
+        return overloaded_response()
+
+    streaming = False
+    form = None
+    try:
+        try:
+            form = await read_upload_form(request)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        file = form.get('file')
+        query = form.get('query', 'general')
+        language = form.get('language', 'en')
+        if not isinstance(file, UploadFile):
+            return JSONResponse({"error": "No file uploaded."}, status_code=400)
+        if not file.filename:
+            return JSONResponse({"error": "No file selected."}, status_code=400)
+        if not allowed_file(file.filename):
+            return JSONResponse({"error": "File type not allowed. Only images are supported."}, status_code=400)
+
+        prompt = generate_prompt(query, language)
+        hedged = hedger is not None and fmt is None
+        deadline = asyncio.get_running_loop().time() + (HEDGE_DEADLINE_S if hedged else GENAI_TIMEOUT_S)
+        mime_type = get_mime_type(file.filename)
+        tokens = estimate_tokens(prompt, images=1)
+        image_bytes = None
+        if hedged:
+            # A shared Gemini upload can outlive this request's cancelled attempt, so it reads from a copy
+            await file.seek(0)
+            image_bytes = await file.read()
+        with metrics.time('upload', 'hash'):
+            image_key = await asyncio.to_thread(content_key, file.file, mime_type)
+
+        async def upload():
+            # The multipart parser has already spooled the body, so it is uploaded without a copy on disk
+            source = file.file if image_bytes is None else io.BytesIO(image_bytes)
+            with metrics.time('upload', 'preprocess'):
+                body, body_type = await image_prep.aprepare(source, mime_type)
+
+            async def send():
+                body.seek(0)
+                return await aio_client.files.upload(file=body, config={"mime_type": body_type})
+            with metrics.time('upload', 'gemini_upload'):
+                return await scheduler.call(send, PRIORITY_IMAGE, tokens=0, requests=0, deadline=deadline)
+
+        async with asyncio.timeout_at(deadline):
+            if fmt is not None:
+                async def start_stream(sample_file):
+                    async def start():
+                        return await aopen_stream(await aio_client.models.generate_content_stream(
+                            model="gemini-2.5-flash",
+                            contents=[prompt, sample_file],
+                        ))
+                    with metrics.time('upload', 'first_chunk'):
+                        return await scheduler.call(start, PRIORITY_IMAGE, tokens=tokens, deadline=deadline)
+                stream = await file_registry.run(image_key, upload, start_stream)
+                streaming = True
+                return stream_response('upload', fmt, stream, deadline, started)
+
+            async def analyze(sample_file):
+                with metrics.time('upload', 'generate_content'):
+                    return await scheduler.call(lambda: aio_client.models.generate_content(
+                        model="gemini-2.5-flash",
+                        contents=[prompt, sample_file],
+                    ), PRIORITY_IMAGE, tokens=tokens, deadline=deadline)
+            def ask_gemini():
+                return coalesced(('upload', prompt, image_key), lambda: file_registry.run(image_key, upload, analyze))
+
+            async def ask_local():
+                with metrics.time('upload', 'local_predict'):
+                    prediction = await local_predict.predict(file.filename, image_bytes, mime_type)
+                return await asyncio.to_thread(local_analysis, prediction, language)
+
+            if hedged:
+                source, response = await hedger.run(ask_gemini, ask_local, deadline)
+            else:
+                source, response = PRIMARY, await ask_gemini()
+
+        if response and hasattr(response, 'text'):
+            logging.info(f"Analysis generated ({len(response.text or '')} chars)")
+            logging.debug(f"Analysis Result: {response.text}")
+            return {"analysis": response.text, "source": source}
+        logging.error("Failed to generate analysis from the AI model.")
+        return JSONResponse({"error": "AI analysis failed. Try again later."}, status_code=429)
+
+    except TimeoutError:
+        logging.error(f"Analysis timed out after {GENAI_TIMEOUT_S}s")
+        return JSONResponse({"error": "Analysis timed out. Please try again."}, status_code=504)
+
+    except Exception as e:
+        logging.error(f"Error during processing: {e!r}")
+        status, headers = upstream_error_status(e)
+        return JSONResponse({"error": "Failed to analyze the image. Please try again."}, status_code=status,
+                            headers=headers)
+
+    finally:
+        if not streaming:
+            in_flight.release()
+        if form is not None:
+            await form.close()
+        if not streaming:
+            metrics.observe('upload', 'total', time.perf_counter() - started)
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    """AI-powered chatbot for all farming queries using Gemini (streamed with ?stream=sse or ?stream=ndjson)."""
+    started = time.perf_counter()
+    fmt = stream_format(request.query_params.get('stream'), request.headers.get('accept'))
+    language = 'en'
+    acquired = False
+    streaming = False
+    try:
+        try:
+            data = await request.json() or {}
+        except ValueError:
+            data = {}
+        user_message = (data.get('message') or '').strip()
+        language = data.get('language', 'en')
+
+        if not user_message:
+            resp = "Please type your question." if language == 'en' else "कृपया अपना प्रश्न टाइप करें।"
+            return JSONResponse({"response": resp}, status_code=400)
+
+        cached = None
+        if chat_cache is not None:
+            with metrics.time('chat', 'cache_lookup'):
+                cached = await chat_cache.aget(user_message, language)
+            if cached is not None and fmt is None:
+                return JSONResponse({"response": cached}, headers={"X-Cache": "HIT"})
+
+        acquired = in_flight.try_acquire()
+        if not acquired:
+            return overloaded_response()
+
+        deadline = asyncio.get_running_loop().time() + GENAI_TIMEOUT_S
+        if fmt is not None and cached is not None:
+            acquired, streaming = False, True  # handed to the stream
+            return stream_response('chat', fmt, (cached, None), deadline, started, headers={"X-Cache": "HIT"})
+
+        prompt = get_chat_prompt(user_message, language)
+        tokens = estimate_tokens(prompt)
+        if fmt is not None:
+            async def start():
+                return await aopen_stream(await aio_client.models.generate_content_stream(
+                    model="gemini-2.5-flash",
+                    contents=prompt,
+                ))
+            async with asyncio.timeout_at(deadline):
+                with metrics.time('chat', 'first_chunk'):
+                    stream = await scheduler.call(start, PRIORITY_CHAT, tokens=tokens, deadline=deadline)
+
+            def cache_answer(answer):
+                if chat_cache is not None and answer.strip():
+                    chat_cache.put(user_message, language, answer.strip())
+
+            acquired, streaming = False, True  # handed to the stream
+            return stream_response('chat', fmt, stream, deadline, started, on_complete=cache_answer)
+
+        async with asyncio.timeout_at(deadline):
+            async def generate():
+                with metrics.time('chat', 'generate_content'):
+                    return await scheduler.call(lambda: aio_client.models.generate_content(
+                        model="gemini-2.5-flash",
+                        contents=prompt,
+                    ), PRIORITY_CHAT, tokens=tokens, deadline=deadline)
+            response = await coalesced(('chat', prompt), generate)
+
+        if response and hasattr(response, 'text') and response.text:
+            answer = response.text.strip()
+            if chat_cache is not None:
+                chat_cache.put(user_message, language, answer)
+            return {"response": answer}
+        fallback = (
+            "I couldn't generate a response. Please try rephrasing your question."
+            if language == 'en' else
+            "मैं उत्तर नहीं बना पाया। कृपया प्रश्न को दोबारा लिखें।"
+        )
+        return {"response": fallback}
+
+    except Exception as e:
+        status, headers = upstream_error_status(e)
+        logging.error(f"Chat error: {e!r}")
+        fallback = (
+            "Sorry, I'm having trouble. Please try again later."
+            if language == 'en' else
+            "क्षमा करें, समस्या आ रही है। कृपया बाद में पुनः प्रयास करें।"
+        )
+        return JSONResponse({"response": fallback}, status_code=status, headers=headers)
+
+    finally:
+        if acquired:
+            in_flight.release()
+        if not streaming:
+            metrics.observe('chat', 'total', time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.getenv('PORT', 5001))
+    uvicorn.run(app, host='0.0.0.0', port=port)
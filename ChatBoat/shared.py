@@ -0,0 +1,227 @@
+"""
+Configuration and helpers shared by the Flask app (app.py) and the ASGI app (asgi.py).
+
+Importing this module reads the environment and builds nothing else: no
+threads, clients, pools or files. Each app creates its own scheduler,
+registry, caches and clients when it starts, with the factories and
+settings defined here.
+"""
+import logging
+import os
+
+from dotenv import load_dotenv
+from google.genai import errors as genai_errors
+
+from utils.chat_cache import ChatCache
+from utils.hedging import LocalAnalysis, format_prediction
+from utils.image_prep import ImagePreprocessor
+from utils.metrics import SamplingProfiler, StageMetrics, render_gauges
+from utils.scheduler import DeadlineExceeded, QueueFull
+from utils.translate import translate_texts
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Per-stage latency histograms, exported on /metrics. Gemini calls take seconds while
+# disk and prompt work takes microseconds, so the buckets run from 100us to 60s.
+STAGE_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+metrics = StageMetrics('chatboat_stage', 'Latency of each request stage',
+                       labels=('route', 'stage'), buckets=STAGE_BUCKETS)
+
+# Opt-in sampling profiler, exported on /metrics/profile; each app starts it on startup
+PROFILE_SAMPLE_HZ = float(os.getenv('PROFILE_SAMPLE_HZ', 0))
+profiler = SamplingProfiler(hz=PROFILE_SAMPLE_HZ) if PROFILE_SAMPLE_HZ > 0 else None
+
+# Set GENAI_STUB=1 to use the local Gemini stand-in (utils/genai_stub.py) instead of the real API
+GENAI_STUB = os.getenv('GENAI_STUB') == '1'
+GENAI_API_KEY = os.getenv('GOOGLE_API_KEY')
+
+
+def check_api_key():
+    """Raise ValueError unless GOOGLE_API_KEY is set or GENAI_STUB is on."""
+    if not GENAI_API_KEY and not GENAI_STUB:
+        logging.error("No API_KEY found. Please set the GOOGLE_API_KEY environment variable.")
+        raise ValueError("No API_KEY found. Please set the GOOGLE_API_KEY environment variable.")
+
+
+# Total time allowed for the Gemini calls of one request, queueing and retries included
+GENAI_TIMEOUT_S = float(os.getenv('GENAI_TIMEOUT_S', 60))
+
+# Uploads up to this size stay in memory from the request body to the Gemini upload
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv('UPLOAD_SPOOL_MAX_BYTES', 16 * 1024 * 1024))
+
+
+def create_image_prep():
+    """Photos are downscaled and re-encoded on a worker pool before the Gemini upload; IMAGE_PREP=0 bypasses it."""
+    return ImagePreprocessor(
+        enabled=os.getenv('IMAGE_PREP', '1') != '0',
+        max_edge=int(os.getenv('IMAGE_PREP_MAX_EDGE', 1536)),
+        fmt=os.getenv('IMAGE_PREP_FORMAT', 'JPEG').upper(),
+        quality=int(os.getenv('IMAGE_PREP_QUALITY', 85)),
+        workers=int(os.getenv('IMAGE_PREP_WORKERS', 0)) or None,
+    )
+
+
+# /chat answer cache; CHAT_CACHE_ENTRIES=0 disables it, CHAT_CACHE_SIMILARITY > 0 (e.g. 0.85)
+# also matches near-duplicate questions, CHAT_CACHE_DB adds a persistent SQLite tier of at most
+# CHAT_CACHE_DB_ROWS answers
+CHAT_CACHE_ENTRIES = int(os.getenv('CHAT_CACHE_ENTRIES', 2048))
+
+
+def create_chat_cache():
+    """Return the /chat answer cache, or None when CHAT_CACHE_ENTRIES=0."""
+    if CHAT_CACHE_ENTRIES <= 0:
+        return None
+    return ChatCache(
+        max_entries=CHAT_CACHE_ENTRIES,
+        ttl_seconds=float(os.getenv('CHAT_CACHE_TTL', 24 * 3600)),
+        similarity=float(os.getenv('CHAT_CACHE_SIMILARITY', 0)),
+        db_path=os.getenv('CHAT_CACHE_DB') or None,
+        max_db_rows=int(os.getenv('CHAT_CACHE_DB_ROWS', 100000)),
+    )
+
+
+# Gemini file handles reused for identical images until they near expiry; FILE_REGISTRY_ENTRIES=0 disables reuse
+FILE_REGISTRY_SETTINGS = {
+    "max_entries": int(os.getenv('FILE_REGISTRY_ENTRIES', 4096)),
+    "expiry_margin_s": float(os.getenv('FILE_REGISTRY_EXPIRY_MARGIN_S', 3600)),
+}
+
+# Concurrent requests with the same prompt (and image) share one model call; COALESCE_REQUESTS=0 disables it
+COALESCE_REQUESTS = os.getenv('COALESCE_REQUESTS', '1') != '0'
+
+# Every Gemini call waits its turn in a priority queue (image analysis ahead of chat) paced to the
+# project's quota; GENAI_RPM / GENAI_TPM = 0 leave that limit off, GENAI_MAX_RETRIES=0 disables retries
+SCHEDULER_SETTINGS = {
+    "rpm": float(os.getenv('GENAI_RPM', 0)),
+    "tpm": float(os.getenv('GENAI_TPM', 0)),
+    "burst_s": float(os.getenv('GENAI_BURST_S', 5)),
+    "max_queue": int(os.getenv('GENAI_QUEUE_SIZE', 256)),
+    "max_retries": int(os.getenv('GENAI_MAX_RETRIES', 3)),
+    "backoff_base_s": float(os.getenv('GENAI_BACKOFF_BASE_S', 0.5)),
+    "backoff_max_s": float(os.getenv('GENAI_BACKOFF_MAX_S', 8)),
+}
+
+# Retry-After sent with a 429 once the scheduler has used up its retries
+QUOTA_RETRY_AFTER_S = int(os.getenv('QUOTA_RETRY_AFTER_S', 10))
+
+
+def upstream_error_status(error):
+    """Return (status, headers) for an error raised while calling Gemini through the scheduler."""
+    if isinstance(error, QueueFull):
+        return 503, {"Retry-After": "1"}
+    if isinstance(error, (DeadlineExceeded, TimeoutError)):
+        return 504, {}
+    if isinstance(error, genai_errors.APIError) and error.code == 429:
+        return 429, {"Retry-After": str(QUOTA_RETRY_AFTER_S)}
+    return 500, {}
+
+
+# Hedged /upload analysis, HEDGE_ANALYSIS=1: if Gemini has not answered after HEDGE_DELAY_S, the photo also goes to
+# the local AI service's /predict and the first answer within HEDGE_DEADLINE_S wins. Streamed requests are not hedged
+HEDGE_ANALYSIS = os.getenv('HEDGE_ANALYSIS') == '1'
+HEDGE_DELAY_S = float(os.getenv('HEDGE_DELAY_S', 3))
+HEDGE_DEADLINE_S = float(os.getenv('HEDGE_DEADLINE_S', 15))
+HEDGE_LOCAL_URL = os.getenv('HEDGE_LOCAL_URL', 'http://localhost:8001/predict')
+HEDGE_MAX_CONNECTIONS = int(os.getenv('HEDGE_MAX_CONNECTIONS', 32))
+HEDGE_WORKERS = int(os.getenv('HEDGE_WORKERS', 64))
+
+
+def local_analysis(prediction, language):
+    """A local /predict result as an /upload analysis in the user's language."""
+    return LocalAnalysis("\n".join(translate_texts(format_prediction(prediction), language)), prediction)
+
+
+def render_metrics(chat_cache, file_registry, llm_flights, scheduler, image_prep, hedger=None):
+    """Prometheus text for /metrics, from the stage histograms and the calling app's runtime objects."""
+    text = metrics.render()
+    if chat_cache is not None:
+        text += render_gauges("chatboat_chat_cache", chat_cache.stats())
+    text += render_gauges("chatboat_file_registry", file_registry.stats())
+    text += render_gauges("chatboat_coalesce", llm_flights.stats())
+    text += render_gauges("chatboat_scheduler", scheduler.stats())
+    text += render_gauges("chatboat_image_prep", image_prep.stats())
+    if hedger is not None:
+        text += render_gauges("chatboat_hedge", hedger.stats())
+    return text
+
+
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+
+MIME_TYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+def allowed_file(filename):
+    """Check if the uploaded file is in an allowed format."""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def get_mime_type(filename):
+    """Return the MIME type based on the file extension."""
+    ext = filename.rsplit('.', 1)[1].lower()
+    return MIME_TYPES.get(ext, 'application/octet-stream')
+
+def generate_prompt(user_query, language):
+    """Generate a structured prompt for plant health analysis with numbered, concise responses."""
+
+    if language == 'hi':  # Hindi
+        base_prompt = (
+            "पौधे की छवि का विश्लेषण करें और निम्न प्रारूप में उत्तर दें बिना किसी अतिरिक्त जानकारी और विशेष वर्णों के:\n"
+            "1. वर्तमान स्वास्थ्य स्थिति: पौधे के स्वास्थ्य का विस्तृत विवरण\n"
+            "2. संभावित बीमारियां या समस्याएं: किसी भी संभावित स्वास्थ्य जोखिम का वर्णन\n"
+            "3. तत्काल उपचार सिफारिशें: तुरंत की जाने वाली कार्रवाई\n"
+            "4. दीर्घकालिक देखभाल सुझाव: भविष्य में पौधे की देखभाल के लिए मार्गदर्शन\n"
+            "\n"
+            f"किसान का सवाल: {user_query}\n"
+            "उत्तर स्पष्ट, संक्षिप्त और सटीक होने चाहिए बिना किसी अतिरिक्त विशेष वर्णों के।"
+        )
+
+        if "कीट" in user_query or "कीटों" in user_query:
+            base_prompt += "\n कीट नियंत्रण पर विशेष ध्यान दें।"
+        elif "उर्वरक" in user_query or "खाद" in user_query:
+            base_prompt += "\n पोषण और उर्वरक की आवश्यकताओं पर ध्यान दें।"
+
+        return base_prompt
+
+    else:  # Default to English
+        base_prompt = (
+            "Analyze the plant image and respond in the following format without any extra information and special character:\n"
+            "1. Current health status: Detailed description of the plant's health\n"
+            "2. Potential diseases or issues: Description of any potential health risks\n"
+            "3. Immediate treatment recommendations: Actions to take immediately\n"
+            "4. Long-term care suggestions: Guidance for future plant care\n"
+            "\n"
+            f"Farmer's specific query: {user_query}\n"
+            "Responses must be clear, concise, and precise,without any extra special characters."
+        )
+
+        if "pest" in user_query or "insect" in user_query:
+            base_prompt += "\n Focus specifically on pest control methods."
+        elif "fertilizer" in user_query or "manure" in user_query:
+            base_prompt += "\n Focus specifically on nutritional needs and fertilization."
+
+        return base_prompt
+
+
+def get_chat_prompt(user_message, language):
+    """Generate prompt for AI chat - farming assistant."""
+    if language == 'hi':
+        system_prompt = (
+            "आप एक विशेषज्ञ कृषि सहायक हैं। किसानों के सभी प्रश्नों का स्पष्ट, संक्षिप्त और सही उत्तर दें। "
+            "कृषि, फसलें, कीट नियंत्रण, उर्वरक, सिंचाई, मौसम और संबंधित विषयों पर मदद करें। "
+            "उत्तर हमेशा हिंदी में दें। अगर प्रश्न कृषि से संबंधित नहीं है तो विनम्रता से बताएं कि आप कृषि विशेषज्ञ हैं।"
+        )
+    else:
+        system_prompt = (
+            "You are an expert farming assistant. Answer all farmer questions clearly, concisely and accurately. "
+            "Help with agriculture, crops, pest control, fertilizers, irrigation, weather and related topics. "
+            "Always respond in English. If the question is not related to farming, politely say you are a farming specialist."
+        )
+    return f"{system_prompt}\n\nUser question: {user_message}"
@@ -0,0 +1,360 @@
+"""
+Answer cache for /chat.
+
+Farmers ask the same questions over and over, so answers are cached by
+(language, normalized message). Normalization folds case, Unicode forms,
+punctuation and whitespace, so "What fertilizer for wheat?" and
+"what  fertilizer for WHEAT" share an entry. Optionally, near-duplicate
+questions are matched too: each entry gets a MinHash signature of its
+words and word pairs, and an LSH band index finds entries whose estimated
+Jaccard similarity reaches the threshold.
+
+Entries live in an in-process LRU. With a SQLite path they are also
+written to disk, read back on memory misses and used to warm the LRU on
+startup, so a restart does not empty the cache. The disk tier keeps the
+`max_db_rows` most recently used answers: hits refresh a row's used_at (in
+batches, so a hit costs no write of its own) and writes delete expired rows
+and then the least recently used ones once the table grows past the cap.
+
+SQLite never runs under the memory lock. Writes go to a writer thread in
+the background and aget() reads disk in a worker thread, so the async
+app's event loop never waits on the database.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+
+_SEPARATOR = "\x1f"
+
+# used_at refreshes for cache hits are written once this many are pending (or with the next put)
+TOUCH_BATCH = 256
+
+
+def normalize(message):
+    """Fold case, Unicode compatibility forms, punctuation and whitespace."""
+    text = unicodedata.normalize("NFKC", message).casefold()
+    # Drop punctuation and symbols but keep combining marks, which Devanagari needs
+    text = "".join(" " if unicodedata.category(char)[0] in "PS" else char for char in text)
+    return " ".join(text.split())
+
+
+def shingles(text):
+    """Words and word pairs; a changed word (wheat -> rice) moves the score more than with character n-grams."""
+    words = text.split()
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])} or {text}
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, with stable hashes so they survive restarts."""
+
+    def __init__(self, num_perm=64):
+        self.num_perm = num_perm
+        self._unpack = struct.Struct(f"<{num_perm}I").unpack
+
+    def signature(self, text):
+        # One extendable-output hash per shingle yields all num_perm independent 32-bit hash values
+        rows = [self._unpack(hashlib.shake_128(shingle.encode("utf-8")).digest(self.num_perm * 4)) for shingle in shingles(text)]
+        return tuple(map(min, zip(*rows)))
+
+
+def similarity(left, right):
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(1 for x, y in zip(left, right) if x == y) / len(left)
+
+
+class ChatCache:
+    """
+    LRU + TTL cache of chat answers, with optional near-duplicate matching
+    (`similarity` > 0) and an optional SQLite tier (`db_path`) capped at
+    `max_db_rows` least recently used rows. Thread-safe.
+    """
+
+    def __init__(self, max_entries=2048, ttl_seconds=86400, similarity=0.0, db_path=None, num_perm=64, bands=16,
+                 max_db_rows=100000):
+        self.max_entries = max_entries
+        self.max_db_rows = max_db_rows
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.hasher = MinHasher(num_perm) if similarity > 0 else None
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._entries = OrderedDict()  # key -> (answer, expires_at, signature)
+        self._bands = {}  # (language, band, values) -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.db_evictions = 0
+        self._touched = set()  # keys hit since their used_at was last written
+        self._db_rows = 0  # upper bound on the table's row count; replaced rows are counted again
+        self._db = None
+        # SQLite is used without holding the memory lock: reads under _db_lock, writes on one writer thread
+        self._db_lock = threading.Lock()
+        self._writer = None
+        if db_path:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-cache-db")
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_cache (key TEXT PRIMARY KEY, answer TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, used_at REAL NOT NULL DEFAULT 0)"
+            )
+            # Tables written before used_at existed get the column; their rows rank as least recently used
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(chat_cache)")}
+            if "used_at" not in columns:
+                self._db.execute("ALTER TABLE chat_cache ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS chat_cache_used_at ON chat_cache (used_at)")
+            self._warm()
+
+    def _band_keys(self, language, signature):
+        return [(language, band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def _signature(self, key):
+        return self.hasher.signature(key.split(_SEPARATOR, 1)[1]) if self.hasher is not None else None
+
+    def _store(self, key, answer, expires_at, signature):
+        # Caller holds the lock
+        if key in self._entries:
+            self._remove(key)
+        if signature is not None:
+            language = key.split(_SEPARATOR, 1)[0]
+            for band_key in self._band_keys(language, signature):
+                self._bands.setdefault(band_key, set()).add(key)
+        self._entries[key] = (answer, expires_at, signature)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, signature = self._entries.pop(key)
+        if signature is not None:
+            language = key.split(_SEPARATOR, 1)[0]
+            for band_key in self._band_keys(language, signature):
+                keys = self._bands.get(band_key)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._bands[band_key]
+
+    def _flush_touched(self):
+        # Caller holds the database lock and commits
+        with self._lock:
+            touched, self._touched = self._touched, set()
+        if touched:
+            now = time.time()
+            self._db.executemany("UPDATE chat_cache SET used_at = ? WHERE key = ?", [(now, key) for key in touched])
+
+    def _prune(self, now):
+        # Caller holds the database lock and commits. Deletes expired rows, then the least recently used down to
+        # 90% of the cap, so it runs once per 10% of new rows
+        if self._db_rows <= self.max_db_rows:
+            return
+        evicted = self._db.execute("DELETE FROM chat_cache WHERE expires_at <= ?", (now,)).rowcount
+        keep = self.max_db_rows * 9 // 10
+        evicted += self._db.execute(
+            "DELETE FROM chat_cache WHERE key IN (SELECT key FROM chat_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (keep,),
+        ).rowcount
+        self._db_rows = self._db.execute("SELECT COUNT(*) FROM chat_cache").fetchone()[0]
+        with self._lock:
+            self.db_evictions += evicted
+
+    def _warm(self):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("DELETE FROM chat_cache WHERE expires_at <= ?", (now,))
+            self._db_rows = self._db.execute("SELECT COUNT(*) FROM chat_cache").fetchone()[0]
+            self._prune(now)
+            self._db.commit()
+            # Ranked by last use: with a fixed TTL, expires_at only orders rows by when they were written
+            rows = self._db.execute(
+                "SELECT key, answer, expires_at FROM chat_cache ORDER BY used_at DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+        with self._lock:
+            for key, answer, expires_at in reversed(rows):
+                self._store(key, answer, expires_at, self._signature(key))
+
+    def _lookup(self, key, now):
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                if self._db is not None:
+                    self._touched.add(key)
+                    if len(self._touched) == TOUCH_BATCH:
+                        self._writer.submit(self._write_touched)
+                return entry[0]
+            self._remove(key)
+            self.expirations += 1
+        return None
+
+    def _near_lookup(self, language, signature, now):
+        # Caller holds the lock
+        candidates = set()
+        for band_key in self._band_keys(language, signature):
+            candidates.update(self._bands.get(band_key, ()))
+        best, best_score = None, self.similarity
+        for key in candidates:
+            _, expires_at, candidate = self._entries[key]
+            # Expired entries are skipped before ranking, so they cannot shadow a valid match
+            if expires_at <= now:
+                continue
+            score = similarity(signature, candidate)
+            if score >= best_score:
+                best, best_score = key, score
+        return self._lookup(best, now) if best is not None else None
+
+    def _memory_get(self, key, now):
+        with self._lock:
+            answer = self._lookup(key, now)
+            if answer is not None:
+                self.hits += 1
+            return answer
+
+    def _disk_get(self, key, now):
+        # Blocking SQLite read; the async app runs it in a worker thread
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT answer, expires_at FROM chat_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        if row is None:
+            return None
+        signature = self._signature(key)
+        with self._lock:
+            self._store(key, row[0], row[1], signature)
+            self._touched.add(key)
+            self.hits += 1
+            self.disk_hits += 1
+        return row[0]
+
+    def _near_get(self, normalized, language, now):
+        if self.hasher is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        # Hashing takes tens of microseconds, so do it without holding the lock
+        signature = self.hasher.signature(normalized)
+        with self._lock:
+            answer = self._near_lookup(language, signature, now)
+            if answer is not None:
+                self.hits += 1
+                self.near_hits += 1
+                return answer
+            self.misses += 1
+            return None
+
+    def get(self, message, language):
+        """Return the cached answer for `message` in `language`, or None."""
+        normalized = normalize(message)
+        key = f"{language}{_SEPARATOR}{normalized}"
+        now = time.time()
+        answer = self._memory_get(key, now)
+        if answer is None and self._db is not None:
+            answer = self._disk_get(key, now)
+        if answer is None:
+            answer = self._near_get(normalized, language, now)
+        return answer
+
+    async def aget(self, message, language):
+        """get() for the event loop: a memory miss reads SQLite in a worker thread instead of on the loop."""
+        normalized = normalize(message)
+        key = f"{language}{_SEPARATOR}{normalized}"
+        now = time.time()
+        answer = self._memory_get(key, now)
+        if answer is None and self._db is not None:
+            answer = await asyncio.to_thread(self._disk_get, key, now)
+        if answer is None:
+            answer = self._near_get(normalized, language, now)
+        return answer
+
+    def put(self, message, language, answer):
+        """Store an answer. The SQLite write happens on the cache's writer thread, so put() never blocks on it."""
+        key = f"{language}{_SEPARATOR}{normalize(message)}"
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        signature = self._signature(key)
+        with self._lock:
+            self._store(key, answer, expires_at, signature)
+        if self._db is not None:
+            self._writer.submit(self._write, key, answer, expires_at, now)
+
+    def _write(self, key, answer, expires_at, now):
+        try:
+            with self._db_lock:
+                if self._db is None:
+                    return
+                self._flush_touched()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO chat_cache (key, answer, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                    (key, answer, expires_at, now),
+                )
+                self._db_rows += 1
+                self._prune(now)
+                self._db.commit()
+        except sqlite3.Error:
+            logging.exception("Chat cache write failed")
+
+    def _write_touched(self):
+        try:
+            with self._db_lock:
+                if self._db is not None:
+                    self._flush_touched()
+                    self._db.commit()
+        except sqlite3.Error:
+            logging.exception("Chat cache write failed")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+            self._touched.clear()
+        if self._db is not None:
+            self._writer.submit(self._clear_db).result()
+
+    def _clear_db(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM chat_cache")
+                self._db.commit()
+                self._db_rows = 0
+
+    def close(self):
+        """Finish pending writes, write pending used_at refreshes and close the SQLite tier."""
+        if self._db is None:
+            return
+        self._writer.shutdown(wait=True)
+        with self._db_lock:
+            self._flush_touched()
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "db_evictions": self.db_evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,167 @@
+"""
+Reuse of Gemini Files API uploads across requests.
+
+The same photo is often analyzed several times with a different query or
+language. The Files API keeps an upload for 48 hours, so the registry maps
+the image's SHA-256 (and MIME type) to the returned file handle and hands
+it out again until shortly before it expires. Concurrent requests for an
+image that is still uploading wait for that upload instead of starting
+their own (single-flight). If a call using a reused handle fails because
+the remote file is gone, the entry is dropped and the request uploads
+again once.
+
+get_or_upload reports where a handle came from: CACHED for a live handle
+from the registry, COALESCED when the call joined another request's
+upload in progress, UPLOADED when it ran the upload itself.
+"""
+from collections import OrderedDict
+import datetime
+import hashlib
+import threading
+import time
+
+from google.genai import errors
+
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+
+# HTTP codes the API returns when a referenced file was deleted, expired or is not ours
+STALE_FILE_CODES = (403, 404)
+
+# Where get_or_upload found the file handle
+CACHED = "cached"
+COALESCED = "coalesced"
+UPLOADED = "uploaded"
+
+
+def content_key(stream, mime_type):
+    """SHA-256 of a seekable binary stream plus its MIME type; leaves the stream at offset 0."""
+    stream.seek(0)
+    digest = hashlib.file_digest(stream, "sha256").hexdigest()
+    stream.seek(0)
+    return f"{digest}:{mime_type}"
+
+
+def is_stale_file_error(error):
+    return isinstance(error, errors.ClientError) and error.code in STALE_FILE_CODES
+
+
+class _Registry:
+    def __init__(self, max_entries=4096, expiry_margin_s=3600, default_ttl_s=47 * 3600):
+        self.max_entries = max_entries
+        self.expiry_margin_s = expiry_margin_s
+        self.default_ttl_s = default_ttl_s
+        self._entries = OrderedDict()  # key -> (file, reuse_until)
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.reuses = 0
+        self.invalidations = 0
+
+    def _reuse_until(self, file):
+        expires = getattr(file, "expiration_time", None)
+        if isinstance(expires, datetime.datetime):
+            return expires.timestamp() - self.expiry_margin_s
+        return time.time() + self.default_ttl_s
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.reuses += 1
+            return entry[0]
+
+    def _remember(self, key, file):
+        with self._lock:
+            self.uploads += 1
+            if self.max_entries <= 0:
+                return
+            self._entries[key] = (file, self._reuse_until(file))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key, file=None):
+        """Forget `key`, or only its entry for `file` so a newer upload is kept."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (file is None or entry[0] is file):
+                del self._entries[key]
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "uploads": self.uploads,
+                "reuses": self.reuses,
+                "coalesced": self._flights.followers,
+                "invalidations": self.invalidations,
+            }
+
+
+class UploadRegistry(_Registry):
+    """Registry for threaded servers (app.py)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._flights = SingleFlight()
+
+    def get_or_upload(self, key, upload):
+        """Return (file, source) with source CACHED, COALESCED or UPLOADED; `upload()` runs only for UPLOADED."""
+        file = self._lookup(key)
+        if file is not None:
+            return file, CACHED
+
+        def upload_and_remember():
+            uploaded = upload()
+            self._remember(key, uploaded)
+            return uploaded
+        file, shared = self._flights.do(key, upload_and_remember)
+        return file, COALESCED if shared else UPLOADED
+
+    def run(self, key, upload, use):
+        """Return use(file) for the registered or uploaded file, re-uploading once if a cached one went stale."""
+        file, source = self.get_or_upload(key, upload)
+        try:
+            return use(file)
+        except Exception as e:
+            self.invalidate(key, file)
+            if not (source == CACHED and is_stale_file_error(e)):
+                raise
+        file, _ = self.get_or_upload(key, upload)
+        return use(file)
+
+
+class AsyncUploadRegistry(_Registry):
+    """Registry for the asyncio server (asgi.py); `upload` and `use` return awaitables."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._flights = AsyncSingleFlight()
+
+    async def get_or_upload(self, key, upload):
+        file = self._lookup(key)
+        if file is not None:
+            return file, CACHED
+
+        async def upload_and_remember():
+            uploaded = await upload()
+            self._remember(key, uploaded)
+            return uploaded
+        file, shared = await self._flights.do(key, upload_and_remember)
+        return file, COALESCED if shared else UPLOADED
+
+    async def run(self, key, upload, use):
+        file, source = await self.get_or_upload(key, upload)
+        try:
+            return await use(file)
+        except Exception as e:
+            self.invalidate(key, file)
+            if not (source == CACHED and is_stale_file_error(e)):
+                raise
+        file, _ = await self.get_or_upload(key, upload)
+        return await use(file)
@@ -0,0 +1,265 @@
+"""
+Local stand-in for the Gemini client, for load tests and offline development.
+
+Enable it in app.py and asgi.py with GENAI_STUB=1. It implements the parts
+of google.genai.Client that ChatBoat uses (including the client.aio async
+surface), sleeps to simulate network and generation time, and fails a configurable fraction of calls with the same
+APIError subclasses the real SDK raises.
+
+    GENAI_STUB_LATENCY_MS         mean generate_content latency (default 1500)
+    GENAI_STUB_FIRST_CHUNK_MS     mean time to the first generate_content_stream chunk (default 300);
+                                  the remaining chunks are spread over the rest of the latency
+    GENAI_STUB_UPLOAD_LATENCY_MS  mean files.upload latency (default 300)
+    GENAI_STUB_UPLOAD_MBPS        uplink bandwidth; adds size / bandwidth to every upload (default 0, unlimited)
+    GENAI_STUB_JITTER             +/- fraction applied to every latency (default 0.2)
+    GENAI_STUB_SLOW_RATE          fraction of model calls that are stragglers (default 0)
+    GENAI_STUB_SLOW_MS            extra latency of a straggler, before its first chunk (default 10000)
+    GENAI_STUB_ERROR_RATE         fraction of calls that fail (default 0)
+    GENAI_STUB_ERROR_CODES        comma separated HTTP codes to fail with (default 429,503)
+    GENAI_STUB_RPM                model calls allowed per sliding minute before answering 429,
+                                  like a real per-project quota (default 0, unlimited)
+"""
+import asyncio
+import collections
+import datetime
+import hashlib
+import itertools
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from google.genai import errors, types
+
+ERROR_STATUS = {
+    400: "INVALID_ARGUMENT",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+    504: "DEADLINE_EXCEEDED",
+}
+
+
+class StubConfig:
+    def __init__(self, latency_ms=1500, upload_latency_ms=300, jitter=0.2, error_rate=0.0, error_codes=(429, 503), seed=None,
+                 first_chunk_ms=300, rpm=0, upload_mbps=0.0, slow_rate=0.0, slow_ms=10000):
+        self.latency_ms = latency_ms
+        self.first_chunk_ms = first_chunk_ms
+        self.upload_latency_ms = upload_latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.seed = seed
+        self.rpm = rpm
+        self.upload_mbps = upload_mbps
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency_ms=float(os.getenv('GENAI_STUB_LATENCY_MS', 1500)),
+            upload_latency_ms=float(os.getenv('GENAI_STUB_UPLOAD_LATENCY_MS', 300)),
+            first_chunk_ms=float(os.getenv('GENAI_STUB_FIRST_CHUNK_MS', 300)),
+            jitter=float(os.getenv('GENAI_STUB_JITTER', 0.2)),
+            error_rate=float(os.getenv('GENAI_STUB_ERROR_RATE', 0)),
+            error_codes=[int(code) for code in os.getenv('GENAI_STUB_ERROR_CODES', '429,503').split(',') if code],
+            rpm=int(os.getenv('GENAI_STUB_RPM', 0)),
+            upload_mbps=float(os.getenv('GENAI_STUB_UPLOAD_MBPS', 0)),
+            slow_rate=float(os.getenv('GENAI_STUB_SLOW_RATE', 0)),
+            slow_ms=float(os.getenv('GENAI_STUB_SLOW_MS', 10000)),
+        )
+
+
+class _Behaviour:
+    """Latency and failure injection shared by the stub's sub-APIs."""
+
+    def __init__(self, config):
+        self.config = config
+        self._random = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.quota_rejections = 0
+        self._window = collections.deque()  # start times of the model calls in the last minute
+
+    def delay(self, mean_ms):
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.config.jitter, self.config.jitter)
+        return max(0.0, mean_ms * factor / 1000)
+
+    def straggle(self):
+        """Extra delay for the occasional straggling model call."""
+        with self._lock:
+            slow = self._random.random() < self.config.slow_rate
+        return self.config.slow_ms / 1000 if slow else 0.0
+
+    def upload_delay(self, size):
+        transfer = size * 8 / (self.config.upload_mbps * 1e6) if self.config.upload_mbps > 0 else 0.0
+        return self.delay(self.config.upload_latency_ms) + transfer
+
+    def maybe_fail(self, quota=False):
+        """Raise an injected error; `quota` calls also count against GENAI_STUB_RPM."""
+        with self._lock:
+            self.calls += 1
+            if quota and self.config.rpm > 0:
+                now = time.monotonic()
+                while self._window and self._window[0] <= now - 60:
+                    self._window.popleft()
+                if len(self._window) >= self.config.rpm:
+                    self.quota_rejections += 1
+                    raise errors.ClientError(429, {"error": {
+                        "code": 429, "message": "Quota exceeded (stub)", "status": "RESOURCE_EXHAUSTED"}})
+                self._window.append(now)
+            if self._random.random() >= self.config.error_rate or not self.config.error_codes:
+                return
+            self.failures += 1
+            code = self._random.choice(self.config.error_codes)
+        body = {"error": {"code": code, "message": "Injected by the Gemini stub", "status": ERROR_STATUS.get(code, "UNKNOWN")}}
+        if code >= 500:
+            raise errors.ServerError(code, body)
+        raise errors.ClientError(code, body)
+
+
+def _prompt_text(contents):
+    if isinstance(contents, str):
+        return contents
+    return " ".join(part if isinstance(part, str) else getattr(part, "name", "") or "" for part in contents)
+
+
+def canned_answer(contents):
+    """Deterministic, plausible-looking answer for a prompt."""
+    digest = hashlib.sha256(_prompt_text(contents).encode("utf-8")).hexdigest()[:8]
+    return (
+        f"1. Current health status: The plant looks moderately healthy (stub {digest}).\n"
+        "2. Potential diseases or issues: Early signs of leaf spot are possible.\n"
+        "3. Immediate treatment recommendations: Remove affected leaves and apply a copper fungicide.\n"
+        "4. Long-term care suggestions: Rotate crops, avoid overhead watering and monitor weekly."
+    )
+
+
+def _file_size(file):
+    if isinstance(file, (str, os.PathLike)):
+        return os.path.getsize(file)
+    return len(file.read())
+
+
+def _upload_config_mime_type(config):
+    if isinstance(config, dict):
+        return config.get("mime_type")
+    return getattr(config, "mime_type", None)
+
+
+def stub_response(contents):
+    answer = canned_answer(contents)
+    usage = SimpleNamespace(total_token_count=(len(_prompt_text(contents)) + len(answer)) // 4)
+    return SimpleNamespace(text=answer, usage_metadata=usage)
+
+
+def answer_chunks(answer):
+    """Split an answer into stream chunks of a few words, like the real API does."""
+    words = answer.split(" ")
+    return [" ".join(words[i:i + 6]) + (" " if i + 6 < len(words) else "") for i in range(0, len(words), 6)]
+
+
+class StubFiles:
+    def __init__(self, behaviour):
+        self._behaviour = behaviour
+        self._ids = itertools.count(1)
+
+    def _uploaded(self, size, config):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return types.File(
+            name=f"files/stub-{next(self._ids)}",
+            mime_type=_upload_config_mime_type(config),
+            size_bytes=size,
+            create_time=now,
+            expiration_time=now + datetime.timedelta(hours=48),
+            state=types.FileState.ACTIVE,
+        )
+
+    def upload(self, *, file, config=None):
+        started = time.perf_counter()
+        size = _file_size(file)
+        self._behaviour.maybe_fail()
+        remaining = self._behaviour.upload_delay(size) - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+        return self._uploaded(size, config)
+
+
+class StubModels:
+    def __init__(self, behaviour):
+        self._behaviour = behaviour
+
+    def generate_content(self, *, model, contents, config=None):
+        self._behaviour.maybe_fail(quota=True)
+        time.sleep(self._behaviour.delay(self._behaviour.config.latency_ms) + self._behaviour.straggle())
+        return stub_response(contents)
+
+    def _stream_schedule(self, contents):
+        # (delay before chunk, chunk) pairs: first chunk after first_chunk_ms, the rest spread over the latency
+        config = self._behaviour.config
+        chunks = answer_chunks(canned_answer(contents))
+        first = self._behaviour.delay(min(config.first_chunk_ms, config.latency_ms))
+        rest = max(0.0, self._behaviour.delay(config.latency_ms) - first) / max(1, len(chunks) - 1)
+        first += self._behaviour.straggle()
+        return [(first if i == 0 else rest, chunk) for i, chunk in enumerate(chunks)]
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        self._behaviour.maybe_fail(quota=True)
+        schedule = self._stream_schedule(contents)
+
+        def stream():
+            for delay, chunk in schedule:
+                time.sleep(delay)
+                yield SimpleNamespace(text=chunk)
+        return stream()
+
+
+class AsyncStubFiles(StubFiles):
+    async def upload(self, *, file, config=None):
+        size = _file_size(file)
+        self._behaviour.maybe_fail()
+        await asyncio.sleep(self._behaviour.upload_delay(size))
+        return self._uploaded(size, config)
+
+
+class AsyncStubModels(StubModels):
+    async def generate_content(self, *, model, contents, config=None):
+        self._behaviour.maybe_fail(quota=True)
+        await asyncio.sleep(self._behaviour.delay(self._behaviour.config.latency_ms) + self._behaviour.straggle())
+        return stub_response(contents)
+
+    async def generate_content_stream(self, *, model, contents, config=None):
+        self._behaviour.maybe_fail(quota=True)
+        schedule = self._stream_schedule(contents)
+
+        async def stream():
+            for delay, chunk in schedule:
+                await asyncio.sleep(delay)
+                yield SimpleNamespace(text=chunk)
+        return stream()
+
+
+class AsyncStubClient:
+    """Stand-in for client.aio; sleeps on the event loop instead of blocking a thread."""
+
+    def __init__(self, behaviour):
+        self.files = AsyncStubFiles(behaviour)
+        self.models = AsyncStubModels(behaviour)
+
+    async def aclose(self):
+        pass
+
+
+class StubClient:
+    """Drop-in replacement for google.genai.Client(api_key=...) in ChatBoat."""
+
+    def __init__(self, config=None):
+        self.config = config or StubConfig.from_env()
+        self.behaviour = _Behaviour(self.config)
+        self.files = StubFiles(self.behaviour)
+        self.models = StubModels(self.behaviour)
+        self.aio = AsyncStubClient(self.behaviour)
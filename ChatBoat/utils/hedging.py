@@ -0,0 +1,177 @@
+"""
+Hedged image analysis: Gemini first, the local AI service as a backup.
+
+Each hedged request starts the Gemini analysis. If no answer arrives
+within the hedge delay, or Gemini fails first, the photo also goes to the
+local crop health service (backend/ai_service, POST /predict) through a
+pooled HTTP client. The first successful answer wins and is tagged with
+its source. If nothing has answered by the request's total deadline, the
+request fails with TimeoutError.
+
+The local service returns a structured prediction. format_prediction
+turns it into the same four numbered points that Gemini is asked for.
+"""
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import asyncio
+import threading
+import time
+
+import httpx
+
+PRIMARY = "gemini"
+FALLBACK = "local"
+
+# Answer from the local service, shaped like a Gemini response where the routes read it (.text)
+LocalAnalysis = namedtuple("LocalAnalysis", ["text", "prediction"])
+
+
+def format_prediction(prediction):
+    """The /upload analysis text for a /predict response, as a list of its four lines."""
+    recommendations = prediction.get("recommendations") or []
+    long_term = " ".join(filter(None, [prediction.get("prevention", "")] + list(recommendations)))
+    return [
+        f"1. Current health status: {prediction.get('description', '')}",
+        f"2. Potential diseases or issues: {prediction.get('disease', 'Unknown')} on {prediction.get('crop_type', 'Unknown')}",
+        f"3. Immediate treatment recommendations: {prediction.get('treatment', '')}",
+        f"4. Long-term care suggestions: {long_term}",
+    ]
+
+
+def _limits(max_connections):
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+class LocalPredictClient:
+    """Keep-alive client for the local /predict endpoint, shared by all threads."""
+
+    def __init__(self, url, timeout_s=10.0, max_connections=32):
+        self.url = url
+        self._client = httpx.Client(limits=_limits(max_connections), timeout=timeout_s)
+
+    def predict(self, filename, data, mime_type):
+        response = self._client.post(self.url, files={"file": (filename, data, mime_type)})
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self._client.close()
+
+
+class AsyncLocalPredictClient:
+    """Async counterpart of LocalPredictClient; create and close it on the serving loop."""
+
+    def __init__(self, url, timeout_s=10.0, max_connections=32):
+        self.url = url
+        self._client = httpx.AsyncClient(limits=_limits(max_connections), timeout=timeout_s)
+
+    async def predict(self, filename, data, mime_type):
+        response = await self._client.post(self.url, files={"file": (filename, data, mime_type)})
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class _Counters:
+    def __init__(self, hedge_delay_s):
+        self.hedge_delay_s = hedge_delay_s
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.gemini_wins = 0
+        self.local_wins = 0
+        self.deadline_misses = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "gemini_wins": self.gemini_wins,
+                "local_wins": self.local_wins,
+                "deadline_misses": self.deadline_misses,
+            }
+
+
+class Hedger(_Counters):
+    """
+    Hedging for threaded code. Both calls run on a worker pool, so the
+    request thread can return as soon as one answers; a call that loses
+    keeps running to completion in the background.
+    """
+
+    def __init__(self, hedge_delay_s=2.0, workers=64):
+        super().__init__(hedge_delay_s)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+
+    def run(self, primary, fallback, deadline):
+        """
+        Return (source, result) from primary() or fallback(), whichever
+        succeeds first. `deadline` is a time.monotonic() value. If both
+        fail, raises the primary's error.
+        """
+        self._count("requests")
+        pending = {self._executor.submit(primary): PRIMARY}
+        hedge_at = time.monotonic() + self.hedge_delay_s
+        hedged = False
+        errors = {}
+        while True:
+            if not hedged and (not pending or time.monotonic() >= hedge_at):
+                hedged = True
+                self._count("hedged")
+                pending[self._executor.submit(fallback)] = FALLBACK
+            if not pending:
+                raise errors.get(PRIMARY) or errors[FALLBACK]
+            until = deadline if hedged else min(hedge_at, deadline)
+            done, _ = wait(pending, timeout=max(0.0, until - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                source = pending.pop(future)
+                if future.exception() is None:
+                    self._count(f"{source}_wins")
+                    return source, future.result()
+                errors[source] = future.exception()
+            if not done and time.monotonic() >= deadline:
+                self._count("deadline_misses")
+                raise TimeoutError("No analysis before the deadline")
+
+
+class AsyncHedger(_Counters):
+    """Hedging for coroutines; the losing call is cancelled."""
+
+    async def run(self, primary, fallback, deadline):
+        """Async counterpart of Hedger.run; `primary` and `fallback` return awaitables, `deadline` is a loop.time() value."""
+        loop = asyncio.get_running_loop()
+        self._count("requests")
+        pending = {asyncio.ensure_future(primary()): PRIMARY}
+        hedge_at = loop.time() + self.hedge_delay_s
+        hedged = False
+        errors = {}
+        try:
+            while True:
+                if not hedged and (not pending or loop.time() >= hedge_at):
+                    hedged = True
+                    self._count("hedged")
+                    pending[asyncio.ensure_future(fallback())] = FALLBACK
+                if not pending:
+                    raise errors.get(PRIMARY) or errors[FALLBACK]
+                until = deadline if hedged else min(hedge_at, deadline)
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, until - loop.time()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    source = pending.pop(task)
+                    if task.exception() is None:
+                        self._count(f"{source}_wins")
+                        return source, task.result()
+                    errors[source] = task.exception()
+                if not done and loop.time() >= deadline:
+                    self._count("deadline_misses")
+                    raise TimeoutError("No analysis before the deadline")
+        finally:
+            for task in pending:
+                task.cancel()
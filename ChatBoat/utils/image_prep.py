@@ -0,0 +1,150 @@
+"""
+Downscaling and re-encoding of uploaded photos before they go to Gemini.
+
+Phone photos arrive at up to 12 MP and several megabytes. A diagnosis does
+not need that resolution, and Gemini bills images per 768 px tile, so each
+photo is decoded, turned upright from its EXIF orientation, shrunk to a
+maximum edge and re-encoded before the upload. JPEGs use draft mode, which
+has the decoder skip most of the work by scaling by 1/2, 1/4 or 1/8 as it
+decodes. EXIF metadata, GPS position included, is not carried over.
+
+The work runs on a thread pool (Pillow releases the GIL while decoding,
+resizing and encoding). Animated images, files Pillow cannot read and
+results that would not be smaller are uploaded as they came.
+
+    IMAGE_PREP            0 to upload originals as they are (default 1)
+    IMAGE_PREP_MAX_EDGE   longest side after downscaling, in pixels (default 1536)
+    IMAGE_PREP_FORMAT     JPEG (default) or WEBP
+    IMAGE_PREP_QUALITY    encoder quality, 1-100 (default 85)
+    IMAGE_PREP_WORKERS    worker threads (default: CPU count)
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import logging
+import os
+import threading
+import time
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it originals are uploaded unchanged
+    Image = None
+
+FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+ORIENTATION_TAG = 0x0112
+
+
+def prepare_image(stream, max_edge=1536, fmt="JPEG", quality=85):
+    """
+    Return a BytesIO with the downscaled, re-encoded image and its MIME type,
+    or (None, None) if the original should be sent. Reads `stream` from offset 0.
+    """
+    stream.seek(0)
+    with Image.open(stream) as image:
+        if getattr(image, "is_animated", False):
+            return None, None
+        scale = max_edge / max(image.size)
+        upright = image.getexif().get(ORIENTATION_TAG, 1) == 1
+        if scale >= 1 and upright and image.format == fmt:
+            # Already small enough and in the target format: re-encoding would only lose quality
+            return None, None
+        if scale < 1:
+            # Decode JPEGs at the smallest 1/2^n scale that still covers the target size
+            image.draft("RGB", (round(image.width * scale), round(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if fmt == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif fmt == "WEBP" and image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        output = io.BytesIO()
+        image.save(output, format=fmt, quality=quality)
+    output.seek(0)
+    return output, FORMATS[fmt]
+
+
+class ImagePreprocessor:
+    """Runs prepare_image on a thread pool and counts the bytes it saves. Thread-safe."""
+
+    def __init__(self, enabled=True, max_edge=1536, fmt="JPEG", quality=85, workers=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown image format {fmt!r}. Use one of {', '.join(FORMATS)}.")
+        if enabled and Image is None:
+            logging.warning("Pillow is not installed; uploading images without preprocessing.")
+        self.enabled = enabled and Image is not None
+        self.max_edge = max_edge
+        self.fmt = fmt
+        self.quality = quality
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+        self.images = 0
+        self.kept_original = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-prep")
+            return self._executor
+
+    def _prepare(self, stream, mime_type):
+        started = time.perf_counter()
+        original_size = stream.seek(0, io.SEEK_END)
+        result = (None, None)
+        failed = False
+        try:
+            result = prepare_image(stream, self.max_edge, self.fmt, self.quality)
+        except Exception as e:
+            failed = True
+            logging.warning(f"Image preprocessing failed, uploading the original: {e!r}")
+        prepared, prepared_type = result
+        if prepared is not None and prepared.getbuffer().nbytes >= original_size:
+            prepared = None
+        stream.seek(0)
+        with self._lock:
+            self.images += 1
+            self.failures += failed
+            self.kept_original += prepared is None
+            self.bytes_in += original_size
+            self.bytes_out += original_size if prepared is None else prepared.getbuffer().nbytes
+            self.seconds += time.perf_counter() - started
+        return (stream, mime_type) if prepared is None else (prepared, prepared_type)
+
+    def prepare(self, stream, mime_type):
+        """Return (stream, MIME type) to upload: a prepared copy, or `stream` itself at offset 0."""
+        if not self.enabled:
+            return stream, mime_type
+        return self._get_executor().submit(self._prepare, stream, mime_type).result()
+
+    async def aprepare(self, stream, mime_type):
+        """Async counterpart of prepare."""
+        if not self.enabled:
+            return stream, mime_type
+        return await asyncio.wrap_future(self._get_executor().submit(self._prepare, stream, mime_type))
+
+    def close(self):
+        """Shut the worker pool down once in-flight images are done; a later prepare() starts a new one."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": int(self.enabled),
+                "images": self.images,
+                "kept_original": self.kept_original,
+                "failures": self.failures,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "saved_ratio": round(1 - self.bytes_out / self.bytes_in, 4) if self.bytes_in else 0.0,
+                "seconds": round(self.seconds, 3),
+            }
@@ -0,0 +1,170 @@
+# Kept identical in backend/ai_service/metrics.py and ChatBoat/utils/metrics.py, so both
+# services export comparable /metrics series and /metrics/profile stacks. The services
+# share no package; `python check_shared.py` at the repository root fails if the copies differ.
+from collections import Counter
+import bisect
+import sys
+import threading
+import time
+
+# Latency buckets in seconds, from 50us to 10s
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram. observe() is a bisect and two additions under a lock."""
+
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class StageMetrics:
+    """
+    Per-stage latency histograms rendered in the Prometheus text format.
+
+    Each histogram is one series of `<name>_seconds` with one value per label
+    in `labels`, `stage` by default. Series are created on first use, so
+    recording a new stage needs no registration.
+    """
+
+    def __init__(self, name, description, labels=("stage",), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *values_and_seconds):
+        """observe(*label_values, seconds), e.g. observe("hash", 0.002) or observe("chat", "total", 1.5)."""
+        *values, seconds = values_and_seconds
+        key = tuple(values)
+        histogram = self._series.get(key)
+        if histogram is None:
+            if len(key) != len(self.labels):
+                raise ValueError(f"{self.name} takes {len(self.labels)} label values ({', '.join(self.labels)})")
+            with self._lock:
+                histogram = self._series.setdefault(key, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+    def time(self, *values):
+        """Context manager recording the duration of its block, including when it raises."""
+        return _StageTimer(self, values)
+
+    def render(self):
+        metric = f"{self.name}_seconds"
+        lines = [f"# HELP {metric} {self.description}", f"# TYPE {metric} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, histogram in series:
+            labels = ",".join(f'{label}="{value}"' for label, value in zip(self.labels, key))
+            counts, total = histogram.snapshot()
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{labels}}} {total}')
+            lines.append(f'{metric}_count{{{labels}}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+
+class _StageTimer:
+    # A plain class is cheaper to enter and exit than a @contextmanager generator
+    __slots__ = ("metrics", "values", "started")
+
+    def __init__(self, metrics, values):
+        self.metrics = metrics
+        self.values = values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(*self.values, time.perf_counter() - self.started)
+
+
+def render_gauges(prefix, values):
+    """Render a flat dict of numeric stats as Prometheus gauges, skipping non-numeric values."""
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {prefix}_{key} gauge")
+        lines.append(f"{prefix}_{key} {value}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+class SamplingProfiler:
+    """
+    Opt-in wall-clock sampling profiler for hot-path analysis.
+
+    A daemon thread snapshots every thread's stack `hz` times per second, at
+    most `max_depth` frames from the innermost, and counts identical stacks.
+    Frames read `function (file:line)`. collapsed() returns the counts in the
+    folded "frame;frame;frame count" format read by flamegraph.pl and
+    speedscope. The profiler can be stopped and started again; samples are
+    kept until collapsed(reset=True).
+    """
+
+    def __init__(self, hz=100, max_depth=64):
+        self.interval = 1.0 / hz
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(stack)))
+            with self._lock:
+                self.samples.update(stacks)
+
+    def collapsed(self, reset=False):
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+            if reset:
+                self.samples.clear()
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,311 @@
+"""
+Scheduler in front of every Gemini call.
+
+Calls wait in a bounded priority queue (image analysis ahead of chat) and
+are admitted in priority order as two token buckets allow: requests per
+minute and model tokens per minute. Token use is estimated from the prompt
+before the call and corrected from usage_metadata afterwards. A call that
+fails with a retryable status (429, 500, 503, 504) is retried with
+exponential backoff and full jitter, re-entering the queue each time. Every
+call carries the request's deadline: a call still queued when the client
+has given up is dropped instead of spending quota on an answer nobody will
+read, and no retry is started that could not finish in time.
+
+SyncScheduler is for the threaded Flask app, AsyncScheduler for asgi.py.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from google.genai import errors
+
+PRIORITY_IMAGE = 0
+PRIORITY_CHAT = 1
+
+RETRYABLE_CODES = (429, 500, 503, 504)
+
+# Rough cost of one image and of a typical answer, in model tokens
+IMAGE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+
+
+class QueueFull(Exception):
+    """The scheduler queue is at capacity."""
+
+
+class DeadlineExceeded(Exception):
+    """The caller's deadline passed before the call could be made."""
+
+
+def estimate_tokens(prompt, images=0, output_tokens=600):
+    return len(prompt) // CHARS_PER_TOKEN + images * IMAGE_TOKENS + output_tokens
+
+
+def is_retryable(error):
+    return isinstance(error, errors.APIError) and error.code in RETRYABLE_CODES
+
+
+def used_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None)
+
+
+class TokenBucket:
+    """Refills at `per_minute` / 60 per second up to `burst_s` seconds' worth. Not thread-safe on its own."""
+
+    def __init__(self, per_minute, burst_s=5.0):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_s)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken. A request larger than the bucket waits for a full bucket."""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount):
+        # May go negative: the debt delays later calls
+        self.level -= amount
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "tokens", "requests", "deadline", "cancelled", "waiter")
+
+    def __init__(self, priority, seq, tokens, requests, deadline, waiter):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.requests = requests
+        self.deadline = deadline
+        self.cancelled = False
+        self.waiter = waiter
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _SchedulerCore:
+    def __init__(self, rpm=0, tpm=0, burst_s=5.0, max_queue=256, max_retries=3, backoff_base_s=0.5,
+                 backoff_max_s=8.0):
+        self.requests_bucket = TokenBucket(rpm, burst_s) if rpm > 0 else None
+        self.tokens_bucket = TokenBucket(tpm, burst_s) if tpm > 0 else None
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._heap = []
+        self._seq = itertools.count()
+        self._queued = 0
+        self.admitted = 0
+        self.retries = 0
+        self.rejected = 0
+        self.expired = 0
+        self.throttled_s = 0.0
+
+    def _push(self, priority, tokens, requests, deadline, waiter):
+        # Caller holds the lock
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull()
+        ticket = _Ticket(priority, next(self._seq), tokens, requests, deadline, waiter)
+        heapq.heappush(self._heap, ticket)
+        self._queued += 1
+        return ticket
+
+    def _cancel(self, ticket):
+        # Caller holds the lock; the dispatcher skips cancelled tickets lazily
+        if not ticket.cancelled:
+            ticket.cancelled = True
+            self._queued -= 1
+
+    def _next(self, now):
+        """Return (ticket, 0) to admit now, (None, wait) to retry later, or (None, None) when idle. Lock held."""
+        while self._heap and self._heap[0].cancelled:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None, None
+        ticket = self._heap[0]
+        wait = 0.0
+        if self.requests_bucket is not None and ticket.requests:
+            wait = max(wait, self.requests_bucket.wait_time(ticket.requests, now))
+        if self.tokens_bucket is not None and ticket.tokens:
+            wait = max(wait, self.tokens_bucket.wait_time(ticket.tokens, now))
+        if wait > 0:
+            return None, wait
+        heapq.heappop(self._heap)
+        self._queued -= 1
+        ticket.cancelled = True  # no longer in the queue
+        if self.requests_bucket is not None:
+            self.requests_bucket.take(ticket.requests)
+        if self.tokens_bucket is not None:
+            self.tokens_bucket.take(ticket.tokens)
+        self.admitted += 1
+        return ticket, 0
+
+    def _settle(self, estimated, actual):
+        # Caller holds the lock
+        if self.tokens_bucket is not None and actual is not None:
+            self.tokens_bucket.take(actual - estimated)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt))
+
+    def _stats(self):
+        return {
+            "queued": self._queued,
+            "admitted": self.admitted,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "throttled_seconds": round(self.throttled_s, 3),
+        }
+
+
+class SyncScheduler(_SchedulerCore):
+    """Scheduler for threads; a dispatcher thread admits queued callers in priority order."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._dispatch, name="genai-scheduler", daemon=True)
+        self._thread.start()
+
+    def _dispatch(self):
+        with self._cond:
+            while True:
+                ticket, wait = self._next(time.monotonic())
+                if ticket is not None:
+                    ticket.waiter.set()
+                else:
+                    self._cond.wait(wait)
+
+    def _admit(self, priority, tokens, requests, deadline):
+        admitted = threading.Event()
+        with self._cond:
+            ticket = self._push(priority, tokens, requests, deadline, admitted)
+            self._cond.notify()
+        queued_at = time.monotonic()
+        timeout = None if deadline is None else max(0.0, deadline - queued_at)
+        if not admitted.wait(timeout):
+            with self._cond:
+                if not admitted.is_set():
+                    self._cancel(ticket)
+                    self.expired += 1
+                    raise DeadlineExceeded()
+        with self._cond:
+            self.throttled_s += time.monotonic() - queued_at
+
+    def call(self, fn, priority=PRIORITY_CHAT, tokens=0, requests=1, deadline=None):
+        """
+        Return fn() once admitted, retrying retryable API errors with backoff.
+
+        `deadline` is a time.monotonic() value. Raises QueueFull,
+        DeadlineExceeded or the last error from fn.
+        """
+        for attempt in itertools.count():
+            self._admit(priority, tokens, requests, deadline)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._backoff(attempt)
+                if (not is_retryable(e) or attempt >= self.max_retries
+                        or (deadline is not None and time.monotonic() + delay >= deadline)):
+                    raise
+                with self._cond:
+                    self.retries += 1
+                time.sleep(delay)
+                continue
+            with self._cond:
+                self._settle(tokens, used_tokens(result))
+            return result
+
+    def stats(self):
+        with self._cond:
+            return self._stats()
+
+
+class AsyncScheduler(_SchedulerCore):
+    """Scheduler for one event loop; the dispatcher task starts with the first call."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+
+    async def _dispatch(self):
+        while True:
+            ticket, wait = self._next(time.monotonic())
+            if ticket is not None:
+                if not ticket.waiter.done():
+                    ticket.waiter.set_result(None)
+                continue
+            self._wakeup.clear()
+            try:
+                async with asyncio.timeout(wait):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+
+    async def _admit(self, priority, tokens, requests, deadline):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        admitted = asyncio.get_running_loop().create_future()
+        ticket = self._push(priority, tokens, requests, deadline, admitted)
+        self._wakeup.set()
+        queued_at = time.monotonic()
+        try:
+            async with asyncio.timeout_at(deadline):
+                await admitted
+        except TimeoutError:
+            self._cancel(ticket)
+            self.expired += 1
+            raise DeadlineExceeded() from None
+        except asyncio.CancelledError:
+            # The client went away: give the slot to the next caller
+            self._cancel(ticket)
+            raise
+        self.throttled_s += time.monotonic() - queued_at
+
+    async def call(self, fn, priority=PRIORITY_CHAT, tokens=0, requests=1, deadline=None):
+        """Async counterpart of SyncScheduler.call; `fn` returns an awaitable and `deadline` is a loop.time() value."""
+        loop = asyncio.get_running_loop()
+        for attempt in itertools.count():
+            await self._admit(priority, tokens, requests, deadline)
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._backoff(attempt)
+                if (not is_retryable(e) or attempt >= self.max_retries
+                        or (deadline is not None and loop.time() + delay >= deadline)):
+                    raise
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            self._settle(tokens, used_tokens(result))
+            return result
+
+    async def aclose(self):
+        """Stop the dispatcher task; callers still queued are cancelled."""
+        dispatcher, self._dispatcher = self._dispatcher, None
+        if dispatcher is None:
+            return
+        dispatcher.cancel()
+        try:
+            await dispatcher
+        except asyncio.CancelledError:
+            pass
+        for ticket in self._heap:
+            if not ticket.cancelled and not ticket.waiter.done():
+                ticket.waiter.cancel()
+
+    def stats(self):
+        return self._stats()
@@ -0,0 +1,90 @@
+"""
+Single-flight execution: concurrent calls with the same key share one run.
+
+The first caller for a key (the leader) runs the function; callers that
+arrive while it is running (followers) wait for and receive the same
+result or exception. Nothing is cached: once the run finishes, the next
+call for the key starts a new one.
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+
+class _Counters:
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+
+    def stats(self):
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_ratio": round(self.followers / calls, 4) if calls else 0.0,
+        }
+
+
+class SingleFlight(_Counters):
+    """Single-flight for threaded code."""
+
+    def __init__(self):
+        super().__init__()
+        self._calls = {}  # key -> concurrent.futures.Future
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return (fn() result, shared), where `shared` is True for followers."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight(_Counters):
+    """
+    Single-flight for coroutines on one event loop; `fn` returns an awaitable.
+
+    The shared run is a task of its own, so a caller that times out or is
+    cancelled, the leader included, does not cancel it for the others.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._calls = {}  # key -> asyncio.Task
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Retrieve the exception so it is not logged when every caller gave up
+            task.exception()
@@ -0,0 +1,113 @@
+"""
+Streaming of model output as server-sent events or newline-delimited JSON.
+
+A client opts in per request with `?stream=sse` / `?stream=ndjson` or an
+Accept header of text/event-stream / application/x-ndjson. Without either,
+routes keep returning a single JSON document.
+
+Events, in order:
+
+    {"text": "..."}    one per model chunk (SSE: "data: ...")
+    {"done": true}     after the last chunk (SSE: "event: done")
+    {"error": "..."}   if generation fails mid-stream (SSE: "event: error")
+
+The first chunk is awaited before the response starts, so upstream errors
+such as 429 still map to a status code instead of an in-band error.
+"""
+import asyncio
+import json
+import logging
+
+MEDIA_TYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+# Stop proxies such as nginx from buffering the stream
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+STREAM_ERROR = "Generation was interrupted. Please try again."
+
+
+def stream_format(query_value, accept):
+    """Return "sse", "ndjson" or None from a ?stream= value and an Accept header."""
+    if query_value in MEDIA_TYPES:
+        return query_value
+    accept = accept or ""
+    for fmt, media_type in MEDIA_TYPES.items():
+        if media_type in accept:
+            return fmt
+    return None
+
+
+def encode_event(fmt, payload, event=None):
+    data = json.dumps(payload, ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {data}\n\n" if event else f"data: {data}\n\n"
+    return data + "\n"
+
+
+def _text(chunk):
+    return getattr(chunk, "text", None) or ""
+
+
+def open_stream(chunks):
+    """Start a generate_content_stream iterator; returns (first chunk text, iterator)."""
+    iterator = iter(chunks)
+    first = next(iterator, None)
+    return _text(first), iterator
+
+
+def iter_events(fmt, first, iterator, on_complete=None):
+    """
+    Encode the chunks of an opened stream; on_complete(answer) runs after the
+    last one. `iterator` may be None to send `first` as the whole answer.
+    """
+    parts = [first] if first else []
+    if first:
+        yield encode_event(fmt, {"text": first})
+    try:
+        for chunk in iterator or ():
+            text = _text(chunk)
+            if text:
+                parts.append(text)
+                yield encode_event(fmt, {"text": text})
+    except Exception as e:
+        logging.error(f"Stream error: {e}")
+        yield encode_event(fmt, {"error": STREAM_ERROR}, event="error")
+        return
+    if on_complete is not None:
+        on_complete("".join(parts))
+    yield encode_event(fmt, {"done": True}, event="done")
+
+
+async def aopen_stream(chunks):
+    """Async counterpart of open_stream for client.aio streams."""
+    iterator = aiter(chunks)
+    first = await anext(iterator, None)
+    return _text(first), iterator
+
+
+async def aiter_events(fmt, first, iterator, on_complete=None, deadline=None):
+    """Async counterpart of iter_events; stops with an error event at the loop time `deadline`."""
+    parts = [first] if first else []
+    if first:
+        yield encode_event(fmt, {"text": first})
+    try:
+        while iterator is not None:
+            # Bound only the wait for the model, never the time spent sending to the client
+            async with asyncio.timeout_at(deadline):
+                chunk = await anext(iterator, None)
+            if chunk is None:
+                break
+            text = _text(chunk)
+            if text:
+                parts.append(text)
+                yield encode_event(fmt, {"text": text})
+    except Exception as e:
+        logging.error(f"Stream error: {e!r}")
+        yield encode_event(fmt, {"error": STREAM_ERROR}, event="error")
+        return
+    if on_complete is not None:
+        on_complete("".join(parts))
+    yield encode_event(fmt, {"done": True}, event="done")
@@ -1,14 +1,402 @@
-from googletrans import Translator
+"""
+Translation service for ChatBoat.
+
+Strings are translated in batches: a call with many strings looks each one
+up in a memoized cache keyed on (text, target language) and sends only the
+misses to the backend, deduplicated and in chunks of `max_batch`, as one
+request per chunk. The cache is an in-process LRU; with a SQLite path it is
+also written to disk, read back on memory misses and used to warm the LRU on
+startup, like the /chat answer cache. The disk tier keeps the `max_db_rows`
+most recently used translations: hits refresh a row's used_at (in batches,
+so a hit costs no write of its own) and the least recently used rows are
+deleted once the table grows past the cap.
+
+Backends are pluggable. GoogleTransBackend keeps a pool of googletrans
+Translator instances (they are not safe to share between threads), so each
+thread checks one out for the duration of a call. DictionaryBackend
+translates from a local table and never touches the network, for tests,
+benchmarks and offline development. The service creates its backend on the
+first string it has to send, so a process that only ever serves English, or
+whose strings are all cached, never opens a googletrans pool.
+
+    TRANSLATE_BACKEND        googletrans (default) or dictionary
+    TRANSLATE_DICTIONARY     JSON file of {target: {text: translation}} for the dictionary backend
+    TRANSLATE_POOL_SIZE      pooled googletrans translators (default 4)
+    TRANSLATE_MAX_BATCH      strings sent to the backend per request (default 32)
+    TRANSLATE_CACHE_ENTRIES  in-memory cache size (default 8192)
+    TRANSLATE_CACHE_DB       SQLite file for the persistent cache tier (default off)
+    TRANSLATE_CACHE_DB_ROWS  rows kept in the SQLite tier (default 100000)
+"""
+from collections import OrderedDict
+import asyncio
+import inspect
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Source strings are English, so translating into it is a no-op
+SOURCE_LANGUAGE = "en"
+
+_SEPARATOR = "\x1f"
+
+# used_at refreshes for cache hits are written once this many are pending (or with the next put)
+TOUCH_BATCH = 256
+
+
+class TranslationError(Exception):
+    """The backend could not translate a batch."""
+
+
+class TranslationBackend:
+    """Translates a batch of strings into one target language."""
+
+    name = "backend"
+
+    def translate_batch(self, texts, target_language):
+        """Return the translations of `texts`, in order."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class DictionaryBackend(TranslationBackend):
+    """
+    Offline backend looking strings up in a {target: {text: translation}}
+    table; unknown strings come back unchanged. `latency_s` adds a fixed
+    delay per batch to stand in for a remote call in benchmarks.
+    """
+
+    name = "dictionary"
+
+    def __init__(self, table=None, latency_s=0.0):
+        self.table = table or {}
+        self.latency_s = latency_s
+        self.calls = 0
+
+    @classmethod
+    def from_file(cls, path, latency_s=0.0):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), latency_s)
+
+    def translate_batch(self, texts, target_language):
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        entries = self.table.get(target_language, {})
+        return [entries.get(text, text) for text in texts]
+
+
+class GoogleTransBackend(TranslationBackend):
+    """
+    googletrans through a pool of `pool_size` Translator instances.
+
+    googletrans 4.x makes translate() a coroutine; each pooled translator
+    then gets an event loop of its own to run it on, so callers stay
+    synchronous.
+    """
+
+    name = "googletrans"
+
+    def __init__(self, pool_size=4, timeout_s=10.0):
+        import googletrans
+        import httpx
+
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            translator = googletrans.Translator(timeout=httpx.Timeout(timeout_s))
+            self._pool.put((translator, None))
+
+    def translate_batch(self, texts, target_language):
+        translator, loop = self._pool.get()
+        try:
+            result = translator.translate(list(texts), dest=target_language)
+            if inspect.isawaitable(result):
+                if loop is None:
+                    loop = asyncio.new_event_loop()
+                result = loop.run_until_complete(result)
+        except Exception as e:
+            raise TranslationError(str(e)) from e
+        finally:
+            self._pool.put((translator, loop))
+        return [translated.text for translated in result]
+
+    def close(self):
+        while not self._pool.empty():
+            _, loop = self._pool.get_nowait()
+            if loop is not None:
+                loop.close()
+
+
+class TranslationCache:
+    """
+    LRU of translations keyed on (text, target language), with an optional
+    SQLite tier capped at `max_db_rows` least recently used rows. Thread-safe.
+    """
+
+    def __init__(self, max_entries=8192, db_path=None, max_db_rows=100000):
+        self.max_entries = max_entries
+        self.max_db_rows = max_db_rows
+        self._entries = OrderedDict()  # key -> translation
+        self._lock = threading.Lock()
+        self._touched = set()  # keys hit since their used_at was last written
+        self._db_rows = 0  # upper bound on the table's row count; replaced rows are counted again
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db_evictions = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, translation TEXT NOT NULL, "
+                "used_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS translations_used_at ON translations (used_at)")
+            self._db_rows = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            with self._lock:
+                self._prune()
+                self._db.commit()
+            self._warm()
+
+    @staticmethod
+    def _key(text, target_language):
+        return f"{target_language}{_SEPARATOR}{text}"
+
+    def _store(self, key, translation):
+        # Caller holds the lock
+        self._entries[key] = translation
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _flush_touched(self):
+        # Caller holds the lock and commits
+        if self._touched:
+            now = time.time()
+            self._db.executemany(
+                "UPDATE translations SET used_at = ? WHERE key = ?", [(now, key) for key in self._touched]
+            )
+            self._touched.clear()
+
+    def _prune(self):
+        # Caller holds the lock and commits. Deletes down to 90% of the cap, so it runs once per 10% of new rows
+        if self._db_rows <= self.max_db_rows:
+            return
+        keep = self.max_db_rows * 9 // 10
+        self.db_evictions += self._db.execute(
+            "DELETE FROM translations WHERE key IN "
+            "(SELECT key FROM translations ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (keep,)
+        ).rowcount
+        self._db_rows = min(self._db_rows, keep)
+
+    def _warm(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, translation FROM translations ORDER BY used_at DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+            for key, translation in reversed(rows):
+                self._store(key, translation)
+
+    def get_many(self, texts, target_language):
+        """Return {text: translation} for the texts that are cached."""
+        found = {}
+        with self._lock:
+            missing = []
+            for text in texts:
+                key = self._key(text, target_language)
+                translation = self._entries.get(key)
+                if translation is None:
+                    missing.append(key)
+                    continue
+                self._entries.move_to_end(key)
+                found[text] = translation
+                if self._db is not None:
+                    self._touched.add(key)
+            if missing and self._db is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, translation FROM translations WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, translation in rows:
+                        self._store(key, translation)
+                        found[key.split(_SEPARATOR, 1)[1]] = translation
+                        self._touched.add(key)
+                        self.disk_hits += 1
+            if len(self._touched) >= TOUCH_BATCH:
+                self._flush_touched()
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, translations, target_language):
+        """Store {text: translation}."""
+        now = time.time()
+        rows = [(self._key(text, target_language), translation, now) for text, translation in translations.items()]
+        with self._lock:
+            for key, translation, _ in rows:
+                self._store(key, translation)
+            if self._db is not None:
+                self._flush_touched()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO translations (key, translation, used_at) VALUES (?, ?, ?)", rows
+                )
+                self._db_rows += len(rows)
+                self._prune()
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM translations")
+                self._db.commit()
+                self._db_rows = 0
+
+    def close(self):
+        """Write pending used_at refreshes and close the SQLite tier."""
+        with self._lock:
+            if self._db is not None:
+                self._flush_touched()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "db_evictions": self.db_evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class TranslationService:
+    """
+    Cached, batched translation through a backend. Thread-safe.
+
+    `backend` is a TranslationBackend, or a function returning one that is
+    called when the first batch has to be sent.
+    """
+
+    def __init__(self, backend, cache=None, max_batch=32):
+        self._backend = backend if isinstance(backend, TranslationBackend) else None
+        self._backend_factory = None if self._backend is not None else backend
+        self.cache = cache
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self.backend_calls = 0
+        self.errors = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._backend_factory()
+        return self._backend
+
+    def translate_many(self, texts, target_language):
+        """
+        Return the translations of `texts`, in order. Strings the backend
+        fails on come back untranslated and are not cached.
+        """
+        texts = list(texts)
+        if target_language == SOURCE_LANGUAGE or not texts:
+            return texts
+        # Blank strings need no translation, repeats only one
+        wanted = list(dict.fromkeys(text for text in texts if text.strip()))
+        translated = self.cache.get_many(wanted, target_language) if self.cache is not None else {}
+        missing = [text for text in wanted if text not in translated]
+        for start in range(0, len(missing), self.max_batch):
+            batch = missing[start:start + self.max_batch]
+            with self._lock:
+                self.backend_calls += 1
+            try:
+                backend = self.backend
+                results = backend.translate_batch(batch, target_language)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                name = self._backend.name if self._backend is not None else "backend"
+                logging.error(f"Translation error ({name}, {len(batch)} strings): {e!r}")
+                continue
+            fresh = dict(zip(batch, results))
+            if self.cache is not None:
+                self.cache.put_many(fresh, target_language)
+            translated.update(fresh)
+        return [translated.get(text, text) for text in texts]
+
+    def translate(self, text, target_language):
+        return self.translate_many([text], target_language)[0]
+
+    def stats(self):
+        with self._lock:
+            stats = {"backend_calls": self.backend_calls, "errors": self.errors}
+        if self.cache is not None:
+            stats.update({f"cache_{name}": value for name, value in self.cache.stats().items()})
+        return stats
+
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def create_backend():
+    """Backend selected by TRANSLATE_BACKEND."""
+    backend = os.getenv('TRANSLATE_BACKEND', 'googletrans')
+    if backend == 'dictionary':
+        path = os.getenv('TRANSLATE_DICTIONARY')
+        return DictionaryBackend.from_file(path) if path else DictionaryBackend()
+    if backend == 'googletrans':
+        return GoogleTransBackend(pool_size=int(os.getenv('TRANSLATE_POOL_SIZE', 4)))
+    raise ValueError(f"Unknown TRANSLATE_BACKEND: {backend}")
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    """The process-wide service, configured from the environment on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            entries = int(os.getenv('TRANSLATE_CACHE_ENTRIES', 8192))
+            cache = TranslationCache(
+                entries,
+                os.getenv('TRANSLATE_CACHE_DB') or None,
+                max_db_rows=int(os.getenv('TRANSLATE_CACHE_DB_ROWS', 100000)),
+            ) if entries > 0 else None
+            # The backend is created on the first cache miss in a language other than English
+            _service = TranslationService(create_backend, cache, int(os.getenv('TRANSLATE_MAX_BATCH', 32)))
+        return _service
 
-translator = Translator()
 
 def translate_text(text, target_language):
-    try:
-        if target_language == "en":  # No need to translate if it's already English
-            return text
-
-        translation = translator.translate(text, dest=target_language)
-        return translation.text
-    except Exception as e:
-        print(f"Translation error: {str(e)}")
-        return text  # Return original text if translation fails
+    """Translate one string; returns it unchanged if translation fails."""
+    return get_service().translate(text, target_language)
+
+
+def translate_texts(texts, target_language):
+    """Translate many strings in one pass; failed ones come back unchanged."""
+    return get_service().translate_many(texts, target_language)
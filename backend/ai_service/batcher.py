@@ -0,0 +1,102 @@
+from collections import deque
+import asyncio
+import time
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests into batches for a single vectorized call.
+
+    The first queued item opens a batch; the batch is dispatched once it holds
+    `max_batch_size` items or `max_wait_ms` have passed, whichever comes first.
+    `run_batch(items)` must return one result per item and runs on `executor`
+    (None means the loop's default thread pool) so it never blocks the loop.
+    """
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=5.0, executor=None, history=1000):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.executor = executor
+        self._queue = None
+        self._worker = None
+        self.batches = 0
+        self.items = 0
+        self._latencies = deque(maxlen=history)
+        self._sizes = deque(maxlen=history)
+
+    async def submit(self, item):
+        """Queue one item and wait for its result."""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Callers that gave up while waiting do not need a forward pass
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self.run_batch, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self._latencies.append(time.perf_counter() - started)
+                self._sizes.append(len(batch))
+                self.batches += 1
+                self.items += len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def ms(pct):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))] * 1000, 3)
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(sum(self._sizes) / len(self._sizes), 2) if self._sizes else None,
+            "batch_latency_ms": {
+                "p50": ms(50),
+                "p99": ms(99),
+                "last": round(self._latencies[-1] * 1000, 3) if self._latencies else None,
+            },
+        }
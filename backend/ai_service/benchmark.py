@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the AI crop health service.
+
+Runs against the in-process app by default, or against a live server with --url.
+
+    python benchmark.py batch --images 64 --size 1024
+    python benchmark.py concurrency --modes inline,thread,process
+    python benchmark.py microbatch --model model.npz --batch-sizes 1,8,32
+    python benchmark.py serialize
+    python benchmark.py near-duplicates --sizes 10000,100000,1000000 --distributions uniform,clustered
+    python benchmark.py workers --workers 1,2,4 --launchers serve,uvicorn
+    python benchmark.py prediction-log --records 20000000
+"""
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from PIL import Image
+
+
+def make_image(size, seed, fmt="JPEG"):
+    """Generate a noisy RGB image so every payload hashes differently."""
+    rng = random.Random(seed)
+    image = Image.effect_noise((size, size), 64).convert("RGB")
+    tint = Image.new("RGB", (size, size), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    image = Image.blend(image, tint, 0.5)
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, quality=90)
+    return buffer.getvalue()
+
+
+def get_client(url):
+    """Return an object with .post(path, **kwargs) for either a live server or the local app."""
+    if url:
+        import requests
+
+        session = requests.Session()
+
+        class LiveClient:
+            def post(self, path, **kwargs):
+                return session.post(url.rstrip("/") + path, **kwargs)
+
+        return LiveClient()
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    client.__enter__()
+    return client
+
+
+def bench_batch(args):
+    """Compare images/sec of N single /predict calls against one /predict/batch call."""
+    client = get_client(args.url)
+    images = [make_image(args.size, i) for i in range(args.images)]
+    total_bytes = sum(len(b) for b in images)
+    print(f"{args.images} images, {args.size}x{args.size} JPEG, {total_bytes / 1e6:.1f} MB total")
+
+    # Warm up the process pool so worker start-up is not measured
+    client.post("/predict/batch", files=[("files", ("warmup.jpg", images[0], "image/jpeg"))])
+
+    for run in range(args.repeat):
+        started = time.perf_counter()
+        for i, image_bytes in enumerate(images):
+            response = client.post("/predict", files={"file": (f"{i}.jpg", image_bytes, "image/jpeg")})
+            response.raise_for_status()
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        files = [("files", (f"{i}.jpg", image_bytes, "image/jpeg")) for i, image_bytes in enumerate(images)]
+        response = client.post("/predict/batch", files=files)
+        response.raise_for_status()
+        batch = time.perf_counter() - started
+
+        print(
+            f"run {run + 1}: /predict {args.images / single:8.1f} img/s | "
+            f"/predict/batch {args.images / batch:8.1f} img/s | "
+            f"speedup x{single / batch:.2f}"
+        )
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb(pid):
+    """Peak resident set size of a process in MB (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def start_server(port, env, command=None):
+    """Start the service (under uvicorn unless `command` is given) in a subprocess and wait until /health answers."""
+    import requests
+
+    process = subprocess.Popen(
+        command or [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, **env},
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Service did not start")
+
+
+def bench_concurrency(args):
+    """
+    p50/p99 latency of /health and /predict under mixed load for each executor mode.
+    "inline" is the pre-executor behaviour where hashing ran on the event loop.
+    """
+    import requests
+
+    images = [make_image(args.size, i, args.format) for i in range(args.images)]
+    mime = f"image/{args.format.lower()}"
+    print(f"{len(images)} distinct {args.format} images, ~{sum(map(len, images)) / len(images) / 1e6:.1f} MB each, "
+          f"{args.clients} upload clients, {args.duration}s per mode")
+
+    for mode in args.modes.split(","):
+        env = {
+            "IMAGE_EXECUTOR": mode,
+            "IMAGE_EXECUTOR_QUEUE": str(args.queue),
+            # Every upload must do the full work, so disable the response caches
+            "PREDICTION_CACHE_ENTRIES": "0",
+            "NEAR_DUPLICATE_CAPACITY": "0",
+        }
+        server = start_server(args.port, env)
+        base = f"http://127.0.0.1:{args.port}"
+        stop = threading.Event()
+        predict_latency, health_latency, statuses = [], [], {}
+
+        def uploader(worker):
+            session = requests.Session()
+            n = worker
+            while not stop.is_set():
+                image_bytes = images[n % len(images)]
+                n += args.clients
+                started = time.perf_counter()
+                response = session.post(f"{base}/predict", files={"file": ("leaf", image_bytes, mime)})
+                predict_latency.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        def prober():
+            session = requests.Session()
+            while not stop.is_set():
+                started = time.perf_counter()
+                session.get(f"{base}/health")
+                health_latency.append(time.perf_counter() - started)
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=uploader, args=(i,)) for i in range(args.clients)]
+        threads.append(threading.Thread(target=prober))
+        try:
+            for thread in threads:
+                thread.start()
+            time.sleep(args.duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            rss = peak_rss_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+        def ms(value):
+            return f"{value * 1000:8.1f}" if value is not None else "     n/a"
+
+        rss = f"{rss:.0f} MB" if rss is not None else "n/a"
+
+        print(
+            f"{mode:>8}: /health p50 {ms(percentile(health_latency, 50))} ms p99 {ms(percentile(health_latency, 99))} ms | "
+            f"/predict p50 {ms(percentile(predict_latency, 50))} ms p99 {ms(percentile(predict_latency, 99))} ms | "
+            f"{len(predict_latency) / args.duration:6.1f} req/s | statuses {statuses} | "
+            f"peak RSS {rss}"
+        )
+
+
+def bench_microbatch(args):
+    """Throughput and per-batch latency of the NumPy classifier for several micro-batch sizes."""
+    import requests
+
+    images = [make_image(args.size, i) for i in range(args.images)]
+    print(f"{len(images)} distinct {args.size}x{args.size} JPEGs, {args.clients} clients, {args.duration}s per setting")
+
+    for batch_size in args.batch_sizes.split(","):
+        env = {
+            "CLASSIFIER_MODEL": os.path.abspath(args.model),
+            "MICROBATCH_MAX_SIZE": batch_size,
+            "MICROBATCH_MAX_WAIT_MS": str(args.max_wait_ms),
+            "PREDICTION_CACHE_ENTRIES": "0",
+            "NEAR_DUPLICATE_CAPACITY": "0",
+        }
+        server = start_server(args.port, env)
+        base = f"http://127.0.0.1:{args.port}"
+        stop = threading.Event()
+        latency = []
+
+        def client(worker):
+            session = requests.Session()
+            n = worker
+            while not stop.is_set():
+                started = time.perf_counter()
+                session.post(f"{base}/predict", files={"file": ("leaf.jpg", images[n % len(images)], "image/jpeg")})
+                latency.append(time.perf_counter() - started)
+                n += args.clients
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+        try:
+            for thread in threads:
+                thread.start()
+            time.sleep(args.duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            stats = requests.get(f"{base}/health").json()["microbatch"]
+        finally:
+            server.terminate()
+            server.wait()
+
+        print(
+            f"max batch {batch_size:>3}: {len(latency) / args.duration:7.1f} req/s | "
+            f"request p50 {percentile(latency, 50) * 1000:7.1f} ms p99 {percentile(latency, 99) * 1000:7.1f} ms | "
+            f"avg batch {stats['avg_batch_size']} | batch p50 {stats['batch_latency_ms']['p50']} ms "
+            f"p99 {stats['batch_latency_ms']['p99']} ms"
+        )
+
+
+def bench_serialize(args):
+    """Per-request cost of building and encoding a /predict body, legacy dict path vs ResponseIndex."""
+    import timeit
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    import main as service
+
+    predictions = [service.pick_from_digest(f"{i:064x}") for i in range(1, 257)]
+
+    def legacy(prediction):
+        # What /predict did before: build a dict, then FastAPI's generic encoder and JSONResponse
+        disease = prediction["disease"]
+        treatment_info = service.TREATMENT_LIBRARY.get(disease, service.DEFAULT_TREATMENT)
+        response = {
+            "crop_type": prediction["crop_type"],
+            "disease": disease,
+            "confidence": round(prediction["confidence"], 2),
+            "description": f"Detected {disease} on {prediction['crop_type']} crop with {int(prediction['confidence'] * 100)}% confidence",
+            "treatment": treatment_info["treatment"],
+            "prevention": treatment_info["prevention"],
+            "recommendations": treatment_info["recommendations"]
+        }
+        return JSONResponse(content=jsonable_encoder(response)).body
+
+    for name, render in (("legacy dict + JSONResponse", legacy), ("ResponseIndex.render", service.response_index.render)):
+        runs = timeit.repeat(lambda: [render(p) for p in predictions], number=args.number, repeat=5)
+        per_request = min(runs) / (args.number * len(predictions))
+        print(f"{name:>28}: {per_request * 1e6:7.2f} us/request")
+
+
+def memory_mb(pid):
+    """(RSS, PSS) in MB summed over a process and its descendants; PSS splits shared pages between sharers (Linux only)."""
+    pids, rss, pss = [pid], 0, 0
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as children:
+                pids.extend(int(child) for child in children.read().split())
+            with open(f"/proc/{current}/smaps_rollup") as rollup:
+                for line in rollup:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            continue
+    return rss / 1024, pss / 1024
+
+
+def worker_client(base, images, duration, offset, step, results):
+    """One load-generating process: posts images back to back and reports its latencies."""
+    import requests
+
+    session = requests.Session()
+    latency, errors = [], 0
+    n = offset
+    stop_at = time.monotonic() + duration
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        response = session.post(f"{base}/predict", files={"file": ("leaf.jpg", images[n % len(images)], "image/jpeg")})
+        latency.append(time.perf_counter() - started)
+        errors += response.status_code != 200
+        n += step
+    results.put((latency, errors))
+
+
+def bench_workers(args):
+    """
+    Throughput scaling with the number of worker processes, for the pre-forking
+    launcher (serve.py, shared-memory cache) and for uvicorn --workers (one
+    private cache per process). Load comes from separate client processes so
+    the client GIL is not the limit.
+    """
+    import multiprocessing
+
+    import requests
+
+    images = [make_image(args.size, i) for i in range(args.images)]
+    print(f"{len(images)} distinct {args.size}x{args.size} JPEGs, {args.clients} client processes, "
+          f"{args.duration}s per setting, {os.cpu_count()} CPUs")
+    env = {
+        "PREDICTION_CACHE_ENTRIES": str(args.cache_entries),
+        "NEAR_DUPLICATE_CAPACITY": "0",
+        "IMAGE_EXECUTOR_WORKERS": "1",
+    }
+    base = f"http://127.0.0.1:{args.port}"
+    baseline = None
+    for launcher in args.launchers.split(","):
+        for workers in (int(w) for w in args.workers.split(",")):
+            if launcher == "serve":
+                command = [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port),
+                           "--log-level", "warning"]
+            else:
+                command = [sys.executable, "-m", "uvicorn", "main:app", "--workers", str(workers),
+                           "--port", str(args.port), "--log-level", "warning"]
+            server = start_server(args.port, env, command)
+            try:
+                time.sleep(1)  # let every worker finish starting
+                results = multiprocessing.Queue()
+                clients = [
+                    multiprocessing.Process(target=worker_client, args=(base, images, args.duration, i, args.clients, results))
+                    for i in range(args.clients)
+                ]
+                for client in clients:
+                    client.start()
+                collected = [results.get() for _ in clients]
+                for client in clients:
+                    client.join()
+                rss, pss = memory_mb(server.pid)
+                cache = requests.get(f"{base}/health").json()["cache"] if launcher == "serve" else None
+            finally:
+                server.terminate()
+                server.wait()
+
+            latency = [value for values, _ in collected for value in values]
+            errors = sum(count for _, count in collected)
+            throughput = len(latency) / args.duration
+            baseline = baseline or throughput
+            hit_rate = f"{cache['hit_rate']:.3f}" if cache else "  n/a"
+            print(
+                f"{launcher:>7} x{workers}: {throughput:7.1f} req/s ({throughput / baseline:4.2f}x) | "
+                f"p50 {percentile(latency, 50) * 1000:6.1f} ms p99 {percentile(latency, 99) * 1000:6.1f} ms | "
+                f"errors {errors} | shared cache hit rate {hit_rate} | RSS {rss:.0f} MB PSS {pss:.0f} MB"
+            )
+
+
+def bench_near_duplicates(args):
+    """
+    Insert and lookup cost of the perceptual-hash index at several sizes.
+    "uniform" hashes are random; "clustered" ones look more like real dHashes:
+    a fifth are 0 (flat images) and the rest are a few bit flips away from
+    one of 256 scene hashes.
+    """
+    import numpy as np
+
+    from near_duplicates import HammingIndex
+
+    rng = np.random.default_rng(0)
+
+    def flip(values, max_bits):
+        flips = rng.integers(0, 64, size=(len(values), max_bits))
+        return [value ^ sum(1 << int(bit) for bit in set(bits)) for value, bits in zip(values, flips)]
+
+    def draw(distribution, n):
+        if distribution == "uniform":
+            return rng.integers(0, 2**64, size=n, dtype=np.uint64).tolist()
+        centers = rng.integers(0, 2**64, size=256, dtype=np.uint64)
+        values = flip(centers[rng.integers(0, len(centers), n)].tolist(), 8)
+        return [0 if flat else value for value, flat in zip(values, rng.random(n) < 0.2)]
+
+    for distribution in args.distributions.split(","):
+        for size in (int(s) for s in args.sizes.split(",")):
+            hashes = draw(distribution, size)
+            index = HammingIndex(capacity=size, max_distance=args.max_distance)
+            started = time.perf_counter()
+            for i, value in enumerate(hashes):
+                index.add(value, i)
+            insert = (time.perf_counter() - started) / size
+
+            # Half the queries are near-duplicates of stored hashes, half are fresh draws
+            queries = flip([hashes[i] for i in rng.integers(0, size, args.queries // 2)], args.max_distance // 2)
+            queries += draw(distribution, args.queries - len(queries))
+            started = time.perf_counter()
+            found = sum(index.lookup(query) is not None for query in queries)
+            lookup = (time.perf_counter() - started) / len(queries)
+
+            print(
+                f"{distribution:>9} {size:>9} hashes: insert {insert * 1e6:5.2f} us | "
+                f"lookup {lookup * 1e6:8.1f} us ({found}/{len(queries)} matched)"
+            )
+
+
+def bench_prediction_log(args):
+    """
+    Ingestion rate of the prediction log and /stats query latency against a
+    full scan of the records, at args.records records spread over args.days days.
+    """
+    import struct
+    import tempfile
+    import timeit
+
+    import numpy as np
+
+    import main as service
+    from prediction_log import COUNT_OFFSET, DAY_SECONDS, RECORD, PredictionLog
+
+    rng = np.random.default_rng(0)
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "predictions.log")
+        log = PredictionLog(path, service.LABELS, service.response_index.parse, max_batch=args.batch)
+
+        # Request path: record() a rendered body per prediction, writer thread parses and appends in batches
+        payloads = [service.response_index.render(service.pick_from_digest(f"{i:064x}")) for i in range(1, 1025)]
+        started = time.perf_counter()
+        for i in range(args.request_records):
+            log.record(payloads[i % len(payloads)])
+        queued = time.perf_counter() - started
+        log.flush()
+        drained = time.perf_counter() - started
+        print(f"record(): {queued / args.request_records * 1e6:.2f} us on the request path, "
+              f"{args.request_records / drained / 1e3:.0f}k records/s parsed and written")
+
+        # Bulk ingestion of pre-encoded batches
+        crops = np.array([service.CROP_TYPES.index(c) for c, _ in service.LABELS], dtype=np.uint8)
+        diseases = np.array([service.DISEASE_LIBRARY[c].index(d) for c, d in service.LABELS], dtype=np.uint8)
+        start_ts = now - args.days * DAY_SECONDS
+        written, append_seconds = 0, 0.0
+        while written < args.records:
+            n = min(args.batch, args.records - written)
+            records = np.empty(n, dtype=RECORD)
+            # Timestamps advance steadily from `days` ago to now, as a live log's would
+            records["timestamp"] = start_ts + np.arange(written, written + n) * (now - start_ts) // args.records
+            labels = rng.integers(0, len(service.LABELS), n)
+            records["crop"], records["disease"] = crops[labels], diseases[labels]
+            records["confidence"] = rng.integers(5000, 10000, n)
+            started = time.perf_counter()
+            log.append(records)
+            append_seconds += time.perf_counter() - started
+            written += n
+        size = os.path.getsize(path)
+        print(f"append(): {args.records} records in batches of {args.batch}: {append_seconds:.2f} s, "
+              f"{args.records / append_seconds / 1e6:.2f}M records/s, file {size / 1e6:.0f} MB")
+
+        def time_query(fn):
+            runs = timeit.repeat(fn, number=args.queries, repeat=3)
+            return min(runs) / args.queries
+
+        since_week = now - 7 * DAY_SECONDS
+        since_all = now - args.days * DAY_SECONDS
+        queries = [
+            ("all time, all crops", lambda: log.summary()),
+            ("crop=Tomato, since 7 days", lambda: log.summary("Tomato", since_week)),
+            (f"since {args.days} days", lambda: log.summary(None, since_all)),
+        ]
+        for name, query in queries:
+            print(f"summary {name:>28}: {time_query(query) * 1e6:9.1f} us")
+
+        records = log._records[:log.stats()["records"]]
+        tomato = service.CROP_TYPES.index("Tomato")
+
+        def scan():
+            selected = records[(records["timestamp"] >= since_week) & (records["crop"] == tomato)]
+            return np.bincount(selected["disease"], minlength=4)
+
+        scan_seconds = min(timeit.repeat(scan, number=1, repeat=3))
+        print(f"full scan crop=Tomato, since 7 days: {scan_seconds * 1e6:9.1f} us")
+        del records
+        log.close()
+
+        # Reopen with the aggregates marked stale to time a rebuild from the records
+        with open(path, "r+b") as f:
+            f.seek(COUNT_OFFSET + 8)
+            f.write(struct.pack("<Q", 0))
+        started = time.perf_counter()
+        log = PredictionLog(path, service.LABELS, service.response_index.parse)
+        print(f"rebuild of the aggregates on open: {time.perf_counter() - started:.2f} s")
+        log.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running service (default: in-process app)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="single /predict vs /predict/batch throughput")
+    batch.add_argument("--images", type=int, default=64)
+    batch.add_argument("--size", type=int, default=1024, help="edge length of generated images in pixels")
+    batch.add_argument("--repeat", type=int, default=3)
+    batch.set_defaults(func=bench_batch)
+
+    concurrency = subparsers.add_parser("concurrency", help="/health and /predict latency under mixed load")
+    concurrency.add_argument("--modes", default="inline,thread,process", help="comma separated IMAGE_EXECUTOR modes")
+    concurrency.add_argument("--clients", type=int, default=16)
+    concurrency.add_argument("--duration", type=float, default=10.0)
+    concurrency.add_argument("--images", type=int, default=8)
+    concurrency.add_argument("--size", type=int, default=1600)
+    concurrency.add_argument("--format", default="PNG")
+    concurrency.add_argument("--queue", type=int, default=64, help="IMAGE_EXECUTOR_QUEUE for the server")
+    concurrency.add_argument("--port", type=int, default=8765)
+    concurrency.set_defaults(func=bench_concurrency)
+
+    microbatch = subparsers.add_parser("microbatch", help="NumPy classifier throughput per micro-batch size")
+    microbatch.add_argument("--model", required=True, help=".npz weights (python classifier.py model.npz writes random ones)")
+    microbatch.add_argument("--batch-sizes", default="1,8,32")
+    microbatch.add_argument("--max-wait-ms", type=float, default=5.0)
+    microbatch.add_argument("--clients", type=int, default=32)
+    microbatch.add_argument("--duration", type=float, default=10.0)
+    microbatch.add_argument("--images", type=int, default=32)
+    microbatch.add_argument("--size", type=int, default=512)
+    microbatch.add_argument("--port", type=int, default=8765)
+    microbatch.set_defaults(func=bench_microbatch)
+
+    serialize = subparsers.add_parser("serialize", help="response build + encode cost per request")
+    serialize.add_argument("--number", type=int, default=200)
+    serialize.set_defaults(func=bench_serialize)
+
+    near_duplicates = subparsers.add_parser("near-duplicates", help="perceptual-hash index insert/lookup cost")
+    near_duplicates.add_argument("--sizes", default="10000,100000,1000000")
+    near_duplicates.add_argument("--queries", type=int, default=2000)
+    near_duplicates.add_argument("--max-distance", type=int, default=6)
+    near_duplicates.add_argument("--distributions", default="uniform,clustered")
+    near_duplicates.set_defaults(func=bench_near_duplicates)
+
+    workers = subparsers.add_parser("workers", help="throughput scaling from 1 to N worker processes")
+    workers.add_argument("--workers", default="1,2,4", help="comma separated worker counts")
+    workers.add_argument("--launchers", default="serve,uvicorn", help="serve (pre-fork, shared cache) and/or uvicorn")
+    workers.add_argument("--clients", type=int, default=8, help="load-generating client processes")
+    workers.add_argument("--duration", type=float, default=10.0)
+    workers.add_argument("--images", type=int, default=64)
+    workers.add_argument("--size", type=int, default=512)
+    workers.add_argument("--cache-entries", type=int, default=10000, help="PREDICTION_CACHE_ENTRIES for the server")
+    workers.add_argument("--port", type=int, default=8765)
+    workers.set_defaults(func=bench_workers)
+
+    prediction_log = subparsers.add_parser("prediction-log", help="prediction log ingestion and /stats query cost")
+    prediction_log.add_argument("--records", type=int, default=20_000_000)
+    prediction_log.add_argument("--request-records", type=int, default=500_000, help="records sent through record()")
+    prediction_log.add_argument("--days", type=int, default=365, help="days the records are spread over")
+    prediction_log.add_argument("--batch", type=int, default=8192)
+    prediction_log.add_argument("--queries", type=int, default=1000)
+    prediction_log.set_defaults(func=bench_prediction_log)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache mapping an image SHA-256 digest to its serialized /predict response.
+
+    Entries expire after `ttl_seconds` and the cache evicts least recently used
+    entries once either `max_entries` or `max_bytes` (sum of cached payload sizes)
+    is exceeded. Safe to share between threads.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=32 * 1024 * 1024, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # digest -> (expires_at, payload)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, digest):
+        """Return the cached payload for `digest`, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, payload = entry
+            if expires_at <= now:
+                self._remove(digest)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return payload
+
+    def put(self, digest, payload):
+        """Store `payload` (bytes) under `digest`, evicting old entries as needed."""
+        size = len(payload)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            if digest in self._entries:
+                self._remove(digest)
+            self._entries[digest] = (time.monotonic() + self.ttl_seconds, payload)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, digest):
+        _, payload = self._entries.pop(digest)
+        self._bytes -= len(payload)
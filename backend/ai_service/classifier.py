@@ -0,0 +1,160 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+
+class Classifier:
+    """
+    Interface for disease classifiers used by /predict.
+
+    predict_batch() takes a list of inputs and returns one
+    {"crop_type", "disease", "confidence"} dict per input. When `needs_pixels`
+    is False the inputs are image SHA-256 hex digests, otherwise they are
+    float32 arrays of shape (height, width, 3) produced by load_pixels().
+    """
+
+    needs_pixels = False
+    input_size = None
+
+    def predict_batch(self, inputs):
+        raise NotImplementedError
+
+
+class HashClassifier(Classifier):
+    """Placeholder classifier that derives a label deterministically from the image hash."""
+
+    def __init__(self, pick):
+        self.pick = pick
+
+    def predict_batch(self, inputs):
+        return [self.pick(digest) for digest in inputs]
+
+
+def load_pixels(source, input_size):
+    """
+    Decode an image into a float32 (height, width, 3) array scaled to [0, 1].
+
+    `source` is raw bytes or a seekable binary file object. JPEGs are decoded
+    at reduced scale via draft() when the target size allows it.
+    """
+    stream = io.BytesIO(source) if isinstance(source, bytes) else source
+    stream.seek(0)
+    width, height = input_size[1], input_size[0]
+    with Image.open(stream) as image:
+        image.draft("RGB", (width, height))
+        image = image.convert("RGB").resize((width, height), Image.BILINEAR)
+        return np.asarray(image, dtype=np.float32) / 255.0
+
+
+class NumpyClassifier(Classifier):
+    """
+    Small CNN evaluated with vectorized NumPy, loaded from an .npz file.
+
+    The archive holds:
+      input_size          [height, width]
+      mean, std           per-channel normalization, shape (3,)
+      conv{i}_w, conv{i}_b  (out_channels, in_channels, k, k) and (out_channels,);
+                          each conv uses same padding, ReLU and 2x2 max pooling
+      dense{i}_w, dense{i}_b  (in_features, out_features) and (out_features,);
+                          ReLU between dense layers, softmax after the last
+
+    The last dense layer has one output per (crop, disease) label.
+    """
+
+    needs_pixels = True
+
+    def __init__(self, path, labels):
+        with np.load(path) as archive:
+            self.input_size = tuple(int(v) for v in archive["input_size"])
+            self.mean = archive["mean"].astype(np.float32)
+            self.std = archive["std"].astype(np.float32)
+            self.convs = self._layers(archive, "conv")
+            self.denses = self._layers(archive, "dense")
+        self.labels = labels
+
+        if not self.denses:
+            raise ValueError(f"{path} has no dense layers")
+        outputs = self.denses[-1][0].shape[1]
+        if outputs != len(labels):
+            raise ValueError(f"{path} predicts {outputs} classes but there are {len(labels)} labels")
+
+    @staticmethod
+    def _layers(archive, prefix):
+        layers = []
+        while f"{prefix}{len(layers)}_w" in archive:
+            i = len(layers)
+            layers.append((archive[f"{prefix}{i}_w"].astype(np.float32), archive[f"{prefix}{i}_b"].astype(np.float32)))
+        return layers
+
+    @staticmethod
+    def _conv(x, weight, bias):
+        # im2col via a strided view: (N, H, W, C, k, k) windows contracted with (O, C, k, k)
+        k = weight.shape[-1]
+        pad = k // 2
+        x = np.pad(x, ((0, 0), (pad, pad), (pad, pad), (0, 0)))
+        windows = np.lib.stride_tricks.sliding_window_view(x, (k, k), axis=(1, 2))
+        out = np.tensordot(windows, weight, axes=([3, 4, 5], [1, 2, 3]))
+        return out + bias
+
+    @staticmethod
+    def _max_pool(x):
+        n, h, w, c = x.shape
+        x = x[:, : h - h % 2, : w - w % 2]
+        return x.reshape(n, h // 2, 2, w // 2, 2, c).max(axis=(2, 4))
+
+    def forward(self, batch):
+        """Run the network on a (N, H, W, 3) batch and return (N, classes) probabilities."""
+        x = (batch - self.mean) / self.std
+        for weight, bias in self.convs:
+            x = self._max_pool(np.maximum(self._conv(x, weight, bias), 0))
+        x = x.reshape(x.shape[0], -1)
+        for i, (weight, bias) in enumerate(self.denses):
+            x = x @ weight + bias
+            if i < len(self.denses) - 1:
+                x = np.maximum(x, 0)
+        x = np.exp(x - x.max(axis=1, keepdims=True))
+        return x / x.sum(axis=1, keepdims=True)
+
+    def predict_batch(self, inputs):
+        probabilities = self.forward(np.stack(inputs))
+        best = probabilities.argmax(axis=1)
+        predictions = []
+        for index, confidence in zip(best, probabilities[np.arange(len(best)), best]):
+            crop_type, disease = self.labels[index]
+            predictions.append({"crop_type": crop_type, "disease": disease, "confidence": float(confidence)})
+        return predictions
+
+
+def write_random_model(path, num_classes, input_size=(64, 64), channels=(8, 16), hidden=64, seed=0):
+    """
+    Write an .npz with randomly initialised weights in the NumpyClassifier layout.
+    Useful for smoke tests and benchmarks before trained weights exist.
+    """
+    rng = np.random.default_rng(seed)
+    arrays = {
+        "input_size": np.array(input_size),
+        "mean": np.array([0.5, 0.5, 0.5], dtype=np.float32),
+        "std": np.array([0.25, 0.25, 0.25], dtype=np.float32),
+    }
+    in_channels, height, width = 3, input_size[0], input_size[1]
+    for i, out_channels in enumerate(channels):
+        arrays[f"conv{i}_w"] = rng.normal(0, np.sqrt(2 / (in_channels * 9)), (out_channels, in_channels, 3, 3)).astype(np.float32)
+        arrays[f"conv{i}_b"] = np.zeros(out_channels, dtype=np.float32)
+        in_channels, height, width = out_channels, height // 2, width // 2
+    features = in_channels * height * width
+    for i, (fan_in, fan_out) in enumerate(((features, hidden), (hidden, num_classes))):
+        arrays[f"dense{i}_w"] = rng.normal(0, np.sqrt(2 / fan_in), (fan_in, fan_out)).astype(np.float32)
+        arrays[f"dense{i}_b"] = np.zeros(fan_out, dtype=np.float32)
+    np.savez(path, **arrays)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from main import LABELS
+
+    if len(sys.argv) != 2:
+        sys.exit("usage: python classifier.py <output.npz>")
+    write_random_model(sys.argv[1], len(LABELS))
+    print(f"Wrote random model with {len(LABELS)} classes to {sys.argv[1]}")
@@ -1,11 +1,78 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from PIL import Image
+import asyncio
+import base64
 import hashlib
 import io
+import json
+import os
+import time
 
-app = FastAPI()
+from batcher import MicroBatcher
+from cache import PredictionCache
+from near_duplicates import HammingIndex, dhash
+from prediction_log import PredictionLog, parse_since
+from responses import ResponseIndex, encode
+from classifier import HashClassifier, NumpyClassifier, load_pixels
+from metrics import SamplingProfiler, StageMetrics, render_gauges
+from uploads import close_files, read_multipart
+from workers import ConcurrencyLimit, StageOverloaded, WorkerStage
+
+# Per-stage latency of /predict, exported on /metrics
+predict_metrics = StageMetrics("predict_stage", "Latency of each /predict pipeline stage")
+
+# Opt-in sampling profiler, exported on /metrics/profile
+PROFILE_SAMPLE_HZ = float(os.getenv("PROFILE_SAMPLE_HZ", 0))
+profiler = SamplingProfiler(hz=PROFILE_SAMPLE_HZ) if PROFILE_SAMPLE_HZ > 0 else None
+
+@asynccontextmanager
+async def lifespan(app):
+    if profiler is not None:
+        profiler.start()
+    open_prediction_log()
+    yield
+    if profiler is not None:
+        profiler.stop()
+    await micro_batcher.close()
+    close_prediction_log()
+    shutdown_batch_pool()
+    image_stage.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# Upload limits for /predict
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+HEADER_BYTES = 256 * 1024
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+# Upload limits for /predict/batch
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", 64))
+# A batch is held in memory while it is processed, so this and BATCH_MAX_CONCURRENT bound the memory batches can use
+BATCH_MAX_BODY_BYTES = int(os.getenv("BATCH_MAX_BODY_BYTES", 64 * 1024 * 1024))
+BATCH_MAX_CONCURRENT = int(os.getenv("BATCH_MAX_CONCURRENT", 2))
+# One NDJSON line: the base64 image plus the JSON around it
+NDJSON_MAX_LINE_BYTES = 4 * -(-MAX_UPLOAD_BYTES // 3) + MULTIPART_OVERHEAD_BYTES
+
+@app.middleware("http")
+async def reject_oversized_uploads(request, call_next):
+    # Marks the start of body parsing for the body_read stage
+    request.state.received_at = time.perf_counter()
+
+    # Refuse declared oversized bodies before reading them; undeclared (chunked) ones are cut off by limited_body
+    if request.method == "POST" and request.url.path in ("/predict", "/predict/batch"):
+        length = request.headers.get("content-length", "")
+        if request.url.path == "/predict":
+            limit, error = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES, f"Image too large. Maximum size is {MAX_UPLOAD_BYTES} bytes."
+        else:
+            limit, error = BATCH_MAX_BODY_BYTES, f"Batch too large. Maximum body size is {BATCH_MAX_BODY_BYTES} bytes."
+        if length.isdigit() and int(length) > limit:
+            return JSONResponse(status_code=413, content={"error": error})
+    return await call_next(request)
 
 # Add CORS middleware
 app.add_middleware(
@@ -29,11 +96,19 @@ DISEASE_LIBRARY = {
     "Sugarcane": ["Red Rot", "Smut", "Leaf Scald", "Healthy"]
 }
 
+# Output vocabulary for trained classifiers: one class per (crop, disease) pair
+LABELS = [(crop_type, disease) for crop_type in CROP_TYPES for disease in DISEASE_LIBRARY[crop_type]]
+
 def deterministic_pick(image_bytes):
     """
     Deterministically select disease and crop based on image hash
     """
-    hash_val = hashlib.sha256(image_bytes).hexdigest()
+    return pick_from_digest(hashlib.sha256(image_bytes).hexdigest())
+
+def pick_from_digest(hash_val):
+    """
+    Select disease and crop from an already computed SHA-256 hex digest
+    """
     hash_int = int(hash_val, 16)
     
     crop_index = hash_int % len(CROP_TYPES)
@@ -102,11 +177,6 @@ TREATMENT_LIBRARY = {
         "prevention": "Remove infected leaves. Improve air circulation. Use drip irrigation.",
         "recommendations": ["Remove infected foliage", "Increase spacing", "Apply fungicide every 10 days"]
     },
-    "Late Blight": {
-        "treatment": "Use systemic fungicides like Metalaxyl combined with protective fungicides.",
-        "prevention": "Use resistant varieties. Avoid overhead irrigation. Remove volunteering plants.",
-        "recommendations": ["Hill up soil", "Ensure good drainage", "Destroy infected tubers"]
-    },
     "Verticillium Wilt": {
         "treatment": "No cure. Remove infected plants. Use resistant varieties.",
         "prevention": "Use resistant varieties. Crop rotation (3-4 years). Soil sterilization.",
@@ -164,49 +234,527 @@ TREATMENT_LIBRARY = {
     }
 }
 
+# Treatments that differ by crop for the same disease name
+CROP_TREATMENTS = {
+    "Potato": {
+        "Late Blight": {
+            "treatment": "Use systemic fungicides like Metalaxyl combined with protective fungicides.",
+            "prevention": "Use resistant varieties. Avoid overhead irrigation. Remove volunteering plants.",
+            "recommendations": ["Hill up soil", "Ensure good drainage", "Destroy infected tubers"]
+        }
+    }
+}
+
+DEFAULT_TREATMENT = {
+    "treatment": "Consult agricultural expert for treatment.",
+    "prevention": "Maintain proper crop management practices.",
+    "recommendations": ["Monitor crop regularly", "Consult expert", "Keep records"]
+}
+
+# Every (crop, disease) response is compiled and pre-encoded once at startup
+response_index = ResponseIndex(CROP_TYPES, DISEASE_LIBRARY, TREATMENT_LIBRARY, CROP_TREATMENTS, DEFAULT_TREATMENT)
+
+def prepare_image(image_bytes, input_size=None):
+    """
+    Fully verify an image and, when the classifier needs pixels, decode it to
+    a model input. Runs inside the batch process pool, so it must stay a
+    picklable module-level function.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.verify()
+    if input_size is not None:
+        return load_pixels(image_bytes, input_size)
+    return None
+
+def validate_header(header):
+    """
+    Check that the leading bytes of an upload are a readable image header.
+
+    Image.open only parses the header, so this catches non-images, unsupported
+    formats and decompression bombs without decoding any pixel data.
+    """
+    with Image.open(io.BytesIO(header)) as image:
+        width, height = image.size
+        if width <= 0 or height <= 0:
+            raise ValueError("Image has no pixels")
+        return image.format
+
+def inspect_upload(source):
+    """
+    Stream an upload in chunks, hashing it incrementally and validating the
+    image header as soon as it has arrived. Returns the SHA-256 hex digest with
+    the seconds spent reading and hashing, and validating the header.
+    Raises ValueError for invalid images and OverflowError for oversized ones.
+
+    `source` is a binary file object, or the raw bytes when running in a
+    process pool where file objects cannot be passed.
+    """
+    started = time.perf_counter()
+    stream = io.BytesIO(source) if isinstance(source, bytes) else source
+    hasher = hashlib.sha256()
+    header = bytearray()
+    validated = False
+    verify_seconds = 0.0
+    size = 0
+
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise OverflowError(f"Image too large. Maximum size is {MAX_UPLOAD_BYTES} bytes.")
+        hasher.update(chunk)
+        if not validated:
+            header += chunk
+            if len(header) >= HEADER_BYTES:
+                verify_started = time.perf_counter()
+                validate_header(bytes(header))
+                verify_seconds = time.perf_counter() - verify_started
+                validated = True
+                header = None
+
+    if size == 0:
+        raise ValueError("Empty file")
+    if not validated:
+        verify_started = time.perf_counter()
+        validate_header(bytes(header))
+        verify_seconds = time.perf_counter() - verify_started
+    digest = hasher.hexdigest()
+    return digest, time.perf_counter() - started - verify_seconds, verify_seconds
+
+def hash_images(images):
+    """
+    SHA-256 hex digests for a list of image bytes (None entries are skipped)
+    """
+    return [hashlib.sha256(image_bytes).hexdigest() if image_bytes is not None else None for image_bytes in images]
+
+# Content-addressed cache of serialized responses, keyed by image SHA-256
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_ENTRIES", 10000)),
+    max_bytes=int(os.getenv("PREDICTION_CACHE_BYTES", 32 * 1024 * 1024)),
+    ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL", 3600)),
+)
+
+# Perceptual-hash index so recompressed or resized re-uploads reuse earlier results
+NEAR_DUPLICATE_CAPACITY = int(os.getenv("NEAR_DUPLICATE_CAPACITY", 10000))
+near_duplicate_index = HammingIndex(
+    capacity=NEAR_DUPLICATE_CAPACITY,
+    max_distance=int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", 6)),
+) if NEAR_DUPLICATE_CAPACITY > 0 else None
+
+# Opt-in append-only log of every fresh classification with per-crop, per-day aggregates for /stats
+PREDICTION_LOG = os.getenv("PREDICTION_LOG", "")
+prediction_log = None
+
+def open_prediction_log():
+    """
+    Open the log file set by PREDICTION_LOG, once. Called on startup, or by serve.py before forking
+    """
+    global prediction_log
+    if PREDICTION_LOG and prediction_log is None:
+        prediction_log = PredictionLog(
+            PREDICTION_LOG,
+            LABELS,
+            response_index.parse,
+            horizon_days=int(os.getenv("PREDICTION_LOG_HORIZON_DAYS", 400)),
+            flush_interval_s=float(os.getenv("PREDICTION_LOG_FLUSH_MS", 100)) / 1000,
+            max_batch=int(os.getenv("PREDICTION_LOG_BATCH", 8192)),
+        )
+    return prediction_log
+
+def close_prediction_log():
+    global prediction_log
+    if prediction_log is not None:
+        prediction_log.close()
+        prediction_log = None
+
+def load_classifier():
+    """
+    Use the NumPy model from CLASSIFIER_MODEL when configured, otherwise the hash placeholder
+    """
+    model_path = os.getenv("CLASSIFIER_MODEL")
+    if model_path:
+        return NumpyClassifier(model_path, LABELS)
+    return HashClassifier(pick_from_digest)
+
+classifier = load_classifier()
+
+# Concurrent /predict requests share one forward pass through the micro-batcher
+micro_batcher = MicroBatcher(
+    classifier.predict_batch,
+    max_batch_size=int(os.getenv("MICROBATCH_MAX_SIZE", 16)),
+    max_wait_ms=float(os.getenv("MICROBATCH_MAX_WAIT_MS", 5)),
+)
+
+async def classify(digest, source):
+    """
+    Predict crop and disease for one upload, batching model calls with other requests
+    """
+    if not classifier.needs_pixels:
+        return classifier.predict_batch([digest])[0]
+    pixels = await image_stage.run(load_pixels, source, classifier.input_size)
+    return await micro_batcher.submit(pixels)
+
+# Executor stage that keeps image hashing and validation off the event loop
+image_stage = WorkerStage(
+    mode=os.getenv("IMAGE_EXECUTOR", "thread"),
+    workers=int(os.getenv("IMAGE_EXECUTOR_WORKERS", os.cpu_count() or 1)),
+    queue_size=int(os.getenv("IMAGE_EXECUTOR_QUEUE", 64)),
+)
+
+def overloaded_response(e):
+    return JSONResponse(
+        status_code=503,
+        content={"error": str(e)},
+        headers={"Retry-After": "1"}
+    )
+
+async def limited_body(request, limit, error=None):
+    """
+    Yield the request body in chunks, raising OverflowError once more than `limit` bytes have arrived
+    """
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise OverflowError(error or f"Batch too large. Maximum body size is {limit} bytes.")
+        yield chunk
+
+async def read_image_upload(request):
+    """
+    Parse a /predict body and return its parts and the `file` part. The body is
+    read through limited_body, so an oversized upload without a Content-Length
+    stops streaming once it passes MAX_UPLOAD_BYTES instead of being read in full.
+    """
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise ValueError("Expected a multipart/form-data body with a `file` part.")
+    too_large = f"Image too large. Maximum size is {MAX_UPLOAD_BYTES} bytes."
+    body = limited_body(request, MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES, too_large)
+    try:
+        items = await read_multipart(request.headers, body, MAX_UPLOAD_BYTES, max_files=1)
+    except OverflowError as e:
+        if str(e).startswith("Too many"):
+            raise ValueError(str(e)) from e
+        raise
+    upload = next((value for name, value in items if name == "file" and not isinstance(value, str)), None)
+    if upload is None:
+        close_files(items)
+        raise ValueError("No file part named `file` in the upload.")
+    if upload.size > MAX_UPLOAD_BYTES:
+        close_files(items)
+        raise OverflowError(too_large)
+    upload.file.seek(0)
+    return items, upload
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request):
+    items = []
     try:
-        # Read image
-        image_bytes = await file.read()
-        
-        # Validate image
-        image = Image.open(io.BytesIO(image_bytes))
-        image.verify()
-        
-        # Get deterministic prediction
-        prediction = deterministic_pick(image_bytes)
-        
-        # Get treatment details
-        disease = prediction["disease"]
-        treatment_info = TREATMENT_LIBRARY.get(disease, {
-            "treatment": "Consult agricultural expert for treatment.",
-            "prevention": "Maintain proper crop management practices.",
-            "recommendations": ["Monitor crop regularly", "Consult expert", "Keep records"]
-        })
-        
-        # Combine response
-        response = {
-            "crop_type": prediction["crop_type"],
-            "disease": disease,
-            "confidence": round(prediction["confidence"], 2),
-            "description": f"Detected {disease} on {prediction['crop_type']} crop with {int(prediction['confidence'] * 100)}% confidence",
-            "treatment": treatment_info["treatment"],
-            "prevention": treatment_info["prevention"],
-            "recommendations": treatment_info["recommendations"]
-        }
-        
-        return response
-    
+        items, upload = await read_image_upload(request)
+        started = time.perf_counter()
+        received_at = getattr(request.state, "received_at", None)
+        if received_at is not None:
+            predict_metrics.observe("body_read", started - received_at)
+
+        # Hash the image and validate its header in the executor stage
+        if image_stage.mode == "process":
+            source = upload.read()
+        else:
+            source = upload.file
+        digest, hash_seconds, verify_seconds = await image_stage.run(inspect_upload, source)
+        predict_metrics.observe("hash", hash_seconds)
+        predict_metrics.observe("image_verify", verify_seconds)
+
+        # Retried uploads of the same photo are served from the cache
+        with predict_metrics.time("lookup"):
+            payload = prediction_cache.get(digest)
+        if payload is None:
+            # A near-duplicate of an earlier photo returns that photo's result
+            phash = None
+            if near_duplicate_index is not None:
+                with predict_metrics.time("phash"):
+                    phash = await image_stage.run(dhash, source)
+                with predict_metrics.time("lookup"):
+                    match = near_duplicate_index.lookup(phash)
+                if match is not None:
+                    payload = match[0]
+            if payload is None:
+                with predict_metrics.time("classify"):
+                    prediction = await classify(digest, source)
+                with predict_metrics.time("serialize"):
+                    payload = response_index.render(prediction)
+                if phash is not None:
+                    near_duplicate_index.add(phash, payload)
+                # Cache and near-duplicate hits repeat an earlier result, so only fresh classifications are logged
+                if prediction_log is not None:
+                    prediction_log.record(payload)
+            prediction_cache.put(digest, payload)
+
+        predict_metrics.observe("total", time.perf_counter() - started)
+        return Response(content=payload, media_type="application/json")
+
+    except StageOverloaded as e:
+        return overloaded_response(e)
+    except OverflowError as e:
+        return JSONResponse(
+            status_code=413,
+            content={"error": str(e)}
+        )
     except Exception as e:
         return JSONResponse(
             status_code=400,
             content={"error": str(e)}
         )
+    finally:
+        close_files(items)
+
+# Batch inference
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", os.cpu_count() or 1))
+
+# Batches beyond the cap are turned away before their bodies are read
+batch_limit = ConcurrencyLimit(BATCH_MAX_CONCURRENT, "Too many batches in progress. Please retry shortly.")
+
+batch_pool = None
+
+def get_batch_pool():
+    global batch_pool
+    if batch_pool is None:
+        batch_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+    return batch_pool
+
+def shutdown_batch_pool():
+    global batch_pool
+    if batch_pool is not None:
+        batch_pool.shutdown(wait=True, cancel_futures=True)
+        batch_pool = None
+
+async def read_batch_items(request):
+    """
+    Collect (filename, image_bytes) pairs from a multipart or NDJSON batch body.
+
+    Multipart bodies carry one `files` part per image. NDJSON bodies carry one
+    JSON object per line: {"filename": "...", "image": "<base64>"}. Items that
+    cannot be decoded or exceed MAX_UPLOAD_BYTES are returned with an error
+    message instead of bytes. The body is read as it streams in; more than
+    BATCH_MAX_BODY_BYTES or BATCH_MAX_IMAGES raises OverflowError.
+    """
+    content_type = request.headers.get("content-type", "")
+    items = []
+    too_large = f"Image too large. Maximum size is {MAX_UPLOAD_BYTES} bytes."
+    too_many = f"Batch too large. At most {BATCH_MAX_IMAGES} images are allowed."
+
+    def add(item):
+        if len(items) >= BATCH_MAX_IMAGES:
+            raise OverflowError(too_many)
+        items.append(item)
+
+    if content_type.startswith("multipart/form-data"):
+        # File parts are spooled to disk past 1 MB and cut off past MAX_UPLOAD_BYTES, so only accepted
+        # images are ever held in memory
+        try:
+            parts = await read_multipart(
+                request.headers,
+                limited_body(request, BATCH_MAX_BODY_BYTES),
+                MAX_UPLOAD_BYTES,
+                max_files=BATCH_MAX_IMAGES,
+                max_fields=BATCH_MAX_IMAGES,
+            )
+        except OverflowError as e:
+            if str(e).startswith("Too many files"):
+                raise OverflowError(too_many) from e
+            if str(e).startswith("Too many fields"):
+                raise ValueError(str(e)) from e
+            raise
+        try:
+            for name, upload in parts:
+                if name != "files":
+                    continue
+                if isinstance(upload, str):
+                    add((None, None, "Expected a file part"))
+                elif upload.size > MAX_UPLOAD_BYTES:
+                    add((upload.filename, None, too_large))
+                else:
+                    add((upload.filename, upload.read(), None))
+        finally:
+            close_files(parts)
+        return items
+
+    if content_type.startswith(("application/x-ndjson", "application/ndjson")):
+        def add_line(line):
+            if not line.strip():
+                return
+            try:
+                entry = json.loads(line)
+                image_bytes = base64.b64decode(entry["image"], validate=True)
+            except Exception as e:
+                add((None, None, f"Invalid NDJSON item: {e}"))
+                return
+            if len(image_bytes) > MAX_UPLOAD_BYTES:
+                add((entry.get("filename"), None, too_large))
+            else:
+                add((entry.get("filename"), image_bytes, None))
+
+        buffer = bytearray()
+        skipping = False  # inside a line that was already rejected as too long
+        async for chunk in limited_body(request, BATCH_MAX_BODY_BYTES):
+            buffer += chunk
+            while (newline := buffer.find(b"\n")) >= 0:
+                line = bytes(buffer[:newline])
+                del buffer[:newline + 1]
+                if skipping:
+                    skipping = False
+                else:
+                    add_line(line)
+            if skipping:
+                buffer.clear()
+            elif len(buffer) > NDJSON_MAX_LINE_BYTES:
+                add((None, None, too_large))
+                buffer.clear()
+                skipping = True
+        if not skipping:
+            add_line(bytes(buffer))
+        return items
+
+    raise ValueError("Unsupported content type. Use multipart/form-data or application/x-ndjson.")
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request):
+    """
+    Run /predict over many images in one round trip. Results keep the request
+    order and failed images carry an "error" field instead of a prediction.
+    """
+    try:
+        with batch_limit.slot():
+            return await run_batch(request)
+    except StageOverloaded as e:
+        return overloaded_response(e)
+
+async def run_batch(request):
+    started = time.perf_counter()
+    try:
+        items = await read_batch_items(request)
+    except OverflowError as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    if not items:
+        return JSONResponse(status_code=400, content={"error": "No images in batch."})
+
+    # Serve cached images directly, decode and verify the rest across the process pool
+    loop = asyncio.get_running_loop()
+    pool = get_batch_pool()
+    try:
+        digests = await image_stage.run(hash_images, [image_bytes if error is None else None for _, image_bytes, error in items])
+    except StageOverloaded as e:
+        return overloaded_response(e)
+    cached = [prediction_cache.get(digest) if digest else None for digest in digests]
+    futures = [
+        loop.run_in_executor(pool, prepare_image, image_bytes, classifier.input_size) if digest and payload is None else None
+        for (_, image_bytes, _), digest, payload in zip(items, digests, cached)
+    ]
+    prepared = iter(await asyncio.gather(*(f for f in futures if f is not None), return_exceptions=True))
+    outcomes = [next(prepared) if future is not None else None for future in futures]
+
+    # Classify every image that passed verification in one batched call
+    valid = [
+        index for index, (future, outcome) in enumerate(zip(futures, outcomes))
+        if future is not None and not isinstance(outcome, Exception)
+    ]
+    inputs = [outcomes[index] if classifier.needs_pixels else digests[index] for index in valid]
+    try:
+        predictions = await loop.run_in_executor(None, classifier.predict_batch, inputs) if inputs else []
+        predictions = dict(zip(valid, predictions))
+    except Exception as e:
+        predictions = {}
+        outcomes = [e if index in valid else outcome for index, outcome in enumerate(outcomes)]
+
+    # Splice the per-image bodies into the batch body without re-encoding them
+    results = []
+    failed = 0
+    for index, ((filename, _, error), payload, outcome) in enumerate(zip(items, cached, outcomes)):
+        if error is None and payload is None:
+            if isinstance(outcome, Exception):
+                error = str(outcome)
+            else:
+                payload = response_index.render(predictions[index])
+                prediction_cache.put(digests[index], payload)
+                if prediction_log is not None:
+                    prediction_log.record(payload)
+        head = encode({"index": index, "filename": filename})[:-1]
+        if error is not None:
+            failed += 1
+            results.append(head + b',"error":' + encode(error) + b"}")
+        else:
+            results.append(head + b"," + payload[1:])
+
+    elapsed = time.perf_counter() - started
+    summary = encode({
+        "count": len(results),
+        "failed": failed,
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "images_per_sec": round(len(results) / elapsed, 2) if elapsed > 0 else None
+    })
+    body = summary[:-1] + b',"results":[' + b",".join(results) + b"]}"
+    return Response(content=body, media_type="application/json")
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "service": "AI Crop Health Detection"}
+    return {
+        "status": "ok",
+        "service": "AI Crop Health Detection",
+        "cache": prediction_cache.stats(),
+        "executor": image_stage.stats(),
+        "batch": batch_limit.stats(),
+        "near_duplicates": near_duplicate_index.stats() if near_duplicate_index is not None else None,
+        "classifier": type(classifier).__name__,
+        "microbatch": micro_batcher.stats(),
+        "prediction_log": prediction_log.stats() if prediction_log is not None else None
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus text exposition of /predict stage latencies and service gauges
+    """
+    sections = [
+        predict_metrics.render(),
+        render_gauges("prediction_cache", prediction_cache.stats()),
+        render_gauges("image_executor", image_stage.stats()),
+        render_gauges("batch", batch_limit.stats()),
+        render_gauges("microbatch", micro_batcher.stats()),
+    ]
+    if near_duplicate_index is not None:
+        sections.append(render_gauges("near_duplicates", near_duplicate_index.stats()))
+    if prediction_log is not None:
+        sections.append(render_gauges("prediction_log", prediction_log.stats()))
+    return PlainTextResponse("".join(sections), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def prediction_stats(crop: str = None, since: str = None):
+    """
+    Detections per crop and disease from the prediction log's aggregates. Only fresh
+    classifications count; re-uploads served from the caches do not.
+    `since` (ISO date or datetime, or Unix seconds) limits them to recent days and adds a per-day breakdown.
+    """
+    if prediction_log is None:
+        return JSONResponse(status_code=404, content={"error": "Prediction log disabled. Set PREDICTION_LOG to enable it."})
+    try:
+        return prediction_log.summary(crop, parse_since(since) if since else None)
+    except KeyError:
+        return JSONResponse(status_code=400, content={"error": f"Unknown crop: {crop}. Use one of {', '.join(CROP_TYPES)}."})
+    except (ValueError, OverflowError):
+        return JSONResponse(status_code=400, content={"error": f"Invalid since: {since}. Use an ISO date or Unix seconds."})
+
+@app.get("/metrics/profile")
+async def metrics_profile(reset: bool = False):
+    """
+    Folded stacks from the sampling profiler (enable with PROFILE_SAMPLE_HZ)
+    """
+    if profiler is None:
+        return JSONResponse(status_code=404, content={"error": "Profiler disabled. Set PROFILE_SAMPLE_HZ to enable it."})
+    return PlainTextResponse(profiler.collapsed(reset=reset))
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,93 @@
+import io
+import threading
+
+import numpy as np
+from PIL import Image
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(values):
+        return _BYTE_BITS[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def dhash(source, hash_size=8):
+    """
+    64-bit difference hash of an image.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale thumbnail
+    and each bit records whether a pixel is brighter than its left neighbour,
+    so recompression and resizing flip few bits. `source` is raw bytes or a
+    seekable binary file object; JPEGs are decoded at reduced scale via draft().
+    """
+    stream = io.BytesIO(source) if isinstance(source, bytes) else source
+    stream.seek(0)
+    with Image.open(stream) as image:
+        image.draft("L", (hash_size * 8, hash_size * 8))
+        thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+class HammingIndex:
+    """
+    Fixed-capacity ring of 64-bit perceptual hashes with nearest-match lookup.
+
+    A lookup is one vectorized XOR and popcount over every stored hash. This
+    is faster than bucketing the hashes by bit ranges (multi-index hashing)
+    at any size a single process keeps: real dHashes cluster, and flat images
+    all hash to 0, so buckets grow long and a probe ends up verifying a large
+    share of the index anyway. When full, the oldest entry is overwritten.
+    """
+
+    def __init__(self, capacity=10000, max_distance=6):
+        if not 0 <= max_distance < 64:
+            raise ValueError("max_distance must be between 0 and 63")
+        self.capacity = max(1, capacity)
+        self.max_distance = max_distance
+        self._hashes = np.zeros(self.capacity, dtype=np.uint64)
+        self._payloads = [None] * self.capacity
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, payload):
+        """Store `payload` under the 64-bit hash `value`."""
+        with self._lock:
+            slot = self._next
+            self._next = (slot + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            self._hashes[slot] = value
+            self._payloads[slot] = payload
+
+    def lookup(self, value):
+        """Return (payload, distance) of the closest stored hash within max_distance, or None."""
+        with self._lock:
+            if self._size:
+                distances = popcount(self._hashes[:self._size] ^ np.uint64(value))
+                best = int(distances.argmin())
+                if distances[best] <= self.max_distance:
+                    self.hits += 1
+                    return self._payloads[best], int(distances[best])
+            self.misses += 1
+            return None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "capacity": self.capacity,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
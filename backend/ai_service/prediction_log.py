@@ -0,0 +1,389 @@
+from datetime import datetime, timezone
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+# One prediction: UTC seconds, crop index, disease index within the crop, confidence in 1/10000
+RECORD = np.dtype([("timestamp", "<u4"), ("crop", "u1"), ("disease", "u1"), ("confidence", "<u2")])
+CONFIDENCE_SCALE = 10000
+DAY_SECONDS = 86400
+MAX_TIMESTAMP = 2**32 - 1
+
+MAGIC = b"PREDLOG1"
+# magic, record size, labels, horizon days, label checksum, committed records, aggregated records, capacity
+HEADER = struct.Struct("<8sIII4xQQQQ")
+HEADER_BYTES = mmap.PAGESIZE
+COUNT_OFFSET = 32
+MIN_CAPACITY = 1 << 20
+
+
+class PredictionLog:
+    """
+    Append-only log of /predict results in a memory-mapped file, with
+    incrementally maintained per-day aggregates.
+
+    record() only queues the response body; a writer thread parses queued
+    bodies in batches every `flush_interval_s` (or once `max_batch` are
+    waiting), appends them as fixed-width RECORDs and folds them into the
+    aggregates stored in the same file: all-time counts per (crop, disease)
+    and a ring of `horizon_days` daily buckets. summary() reads only the
+    aggregates, so it costs O(labels) for all time and O(days x labels) for a
+    date range, however many records the log holds.
+
+    The file is mapped shared and guarded by a process-shared lock, so one
+    log opened before forking serves every pre-forked worker; each worker
+    runs its own writer thread. On open, aggregates that lag the committed
+    records (a crash between the two writes) are rebuilt from the records.
+    """
+
+    def __init__(self, path, labels, parse, horizon_days=400, flush_interval_s=0.1, max_batch=8192,
+                 max_pending=1_000_000):
+        self.path = path
+        self.parse = parse
+        self.horizon_days = horizon_days
+        self.flush_interval_s = flush_interval_s
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.crops = list(dict.fromkeys(crop_type for crop_type, _ in labels))
+        self.diseases = {crop_type: [d for c, d in labels if c == crop_type] for crop_type in self.crops}
+        self.labels = [(crop_type, disease) for crop_type in self.crops for disease in self.diseases[crop_type]]
+        self._codes = {}  # (crop, disease) -> (crop index, disease index, flat label index)
+        offsets = []
+        for crop_index, crop_type in enumerate(self.crops):
+            offsets.append(len(self._codes))
+            for disease_index, disease in enumerate(self.diseases[crop_type]):
+                self._codes[(crop_type, disease)] = (crop_index, disease_index, len(self._codes))
+        self._label_offsets = np.array(offsets, dtype=np.int64)
+        self._checksum = int.from_bytes(hashlib.sha256(repr(self.labels).encode()).digest()[:4], "little")
+
+        n_labels, days = len(self.labels), horizon_days
+        # Aggregates: bucket day, daily counts, daily confidence sums, all-time counts and confidence sums
+        aggregate_bytes = 8 * (days + 2 * days * n_labels + 2 * n_labels)
+        self._records_offset = HEADER_BYTES + -(-aggregate_bytes // mmap.PAGESIZE) * mmap.PAGESIZE
+
+        self._lock = multiprocessing.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size == 0:
+            os.ftruncate(self._fd, self._records_offset + MIN_CAPACITY * RECORD.itemsize)
+            self._map()
+            self._buf[:self._records_offset] = bytes(self._records_offset)
+            HEADER.pack_into(self._buf, 0, MAGIC, RECORD.itemsize, n_labels, days, self._checksum,
+                             0, 0, MIN_CAPACITY)
+            self._bucket_day[:] = -1
+        else:
+            self._map()
+            magic, record_size, stored_labels, stored_days, checksum, *_ = HEADER.unpack_from(self._buf, 0)
+            if (magic, record_size, stored_labels, stored_days, checksum) != (
+                    MAGIC, RECORD.itemsize, n_labels, days, self._checksum):
+                self._unmap()
+                os.close(self._fd)
+                raise ValueError(f"{path} was written for other labels or settings; move it aside to start a new log.")
+            with self._lock:
+                count, aggregated, _ = self._counts()
+                if aggregated != count:
+                    logging.warning(f"Rebuilding prediction aggregates from {count} records in {path}")
+                    self._rebuild(count)
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+        self._closing = False
+        self.recorded = 0
+        self.dropped = 0
+        self.unlabeled = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+
+    # Mapping
+
+    def _map(self):
+        size = os.fstat(self._fd).st_size
+        self._mm = mmap.mmap(self._fd, size)
+        self._buf = memoryview(self._mm)
+        self._capacity = (size - self._records_offset) // RECORD.itemsize
+        n_labels, days = len(self.labels), self.horizon_days
+        offset = HEADER_BYTES
+
+        def view(count, shape=None):
+            nonlocal offset
+            array = np.frombuffer(self._mm, dtype=np.int64, count=count, offset=offset)
+            offset += count * 8
+            return array.reshape(shape) if shape else array
+
+        self._bucket_day = view(days)
+        self._day_counts = view(days * n_labels, (days, n_labels))
+        self._day_confidence = view(days * n_labels, (days, n_labels))
+        self._totals = view(n_labels)
+        self._total_confidence = view(n_labels)
+        self._records = np.frombuffer(self._mm, dtype=RECORD, count=self._capacity, offset=self._records_offset)
+
+    def _unmap(self):
+        # Views into the mapping must go before it can be closed
+        del self._bucket_day, self._day_counts, self._day_confidence, self._totals, self._total_confidence
+        del self._records
+        self._buf.release()
+        self._mm.close()
+
+    def _counts(self):
+        return struct.unpack_from("<QQQ", self._buf, COUNT_OFFSET)
+
+    def _set_counts(self, count, aggregated):
+        struct.pack_into("<QQ", self._buf, COUNT_OFFSET, count, aggregated)
+
+    def _reserve(self, n):
+        """Make room for `n` more records and return the committed count. Caller holds the lock."""
+        count, _, capacity = self._counts()
+        if count + n > capacity:
+            while count + n > capacity:
+                capacity *= 2
+            os.ftruncate(self._fd, self._records_offset + capacity * RECORD.itemsize)
+            struct.pack_into("<Q", self._buf, COUNT_OFFSET + 16, capacity)
+        if capacity > self._capacity:
+            # Grown here or by another process
+            self._unmap()
+            self._map()
+        return count
+
+    def recover(self):
+        """
+        Replace the process-shared lock, which a killed process may still
+        hold, and repair the aggregates as on open. Only safe while no other
+        process is using the log.
+        """
+        self._lock = multiprocessing.Lock()
+        with self._lock:
+            count, aggregated, capacity = self._counts()
+            if capacity > self._capacity:
+                self._unmap()
+                self._map()
+            if aggregated != count:
+                logging.warning(f"Rebuilding prediction aggregates from {count} records in {self.path}")
+                self._rebuild(count)
+
+    # Aggregates
+
+    def _aggregate(self, records):
+        """Fold `records` into the aggregates. Caller holds the lock."""
+        if not len(records):
+            return
+        n_labels, days_kept = len(self.labels), self.horizon_days
+        labels = self._label_offsets[records["crop"]] + records["disease"]
+        confidence = records["confidence"].astype(np.float64)
+        self._totals += np.bincount(labels, minlength=n_labels)
+        self._total_confidence += np.bincount(labels, weights=confidence, minlength=n_labels).astype(np.int64)
+
+        days = records["timestamp"].astype(np.int64) // DAY_SECONDS
+        first = days.min()
+        # A bucket moves to a newer day by starting from zero; in ascending order so the newest day wins
+        for day in np.flatnonzero(np.bincount(days - first)) + first:
+            bucket = day % days_kept
+            if self._bucket_day[bucket] < day:
+                self._bucket_day[bucket] = day
+                self._day_counts[bucket] = 0
+                self._day_confidence[bucket] = 0
+        buckets = days % days_kept
+        kept = self._bucket_day[buckets] == days
+        cells = buckets[kept] * n_labels + labels[kept]
+        size = days_kept * n_labels
+        self._day_counts += np.bincount(cells, minlength=size).reshape(days_kept, n_labels)
+        self._day_confidence += np.bincount(
+            cells, weights=confidence[kept], minlength=size
+        ).astype(np.int64).reshape(days_kept, n_labels)
+
+    def _rebuild(self, count, chunk=1 << 22):
+        self._bucket_day[:] = -1
+        for array in (self._day_counts, self._day_confidence, self._totals, self._total_confidence):
+            array[:] = 0
+        for start in range(0, count, chunk):
+            self._aggregate(self._records[start:min(count, start + chunk)])
+        self._set_counts(count, count)
+
+    # Writing
+
+    def append(self, records):
+        """Append a RECORD array and fold it into the aggregates."""
+        with self._lock:
+            count = self._reserve(len(records))
+            self._records[count:count + len(records)] = records
+            # Commit the records before aggregating them: a crash in between is repaired on the next open
+            self._set_counts(count + len(records), count)
+            self._aggregate(records)
+            self._set_counts(count + len(records), count + len(records))
+
+    def encode(self, batch):
+        """RECORD array for a list of (timestamp, response body); bodies with unknown labels are skipped."""
+        records = np.empty(len(batch), dtype=RECORD)
+        n = 0
+        for timestamp, payload in batch:
+            crop_type, disease, confidence = self.parse(payload)
+            code = self._codes.get((crop_type, disease))
+            if code is None:
+                continue
+            records[n] = (int(timestamp), code[0], code[1], round(confidence * CONFIDENCE_SCALE))
+            n += 1
+        return records[:n]
+
+    def record(self, payload, timestamp=None):
+        """Queue one /predict response body for the log. Never blocks on I/O."""
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append((time.time() if timestamp is None else timestamp, payload))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+                self._thread.start()
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                # Wake the writer to start a batch, or to write a full one now
+                self._cond.notify()
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            records = self.encode(batch)
+            self.append(records)
+        except Exception:
+            logging.exception(f"Dropped {len(batch)} predictions that could not be logged")
+            with self._cond:
+                self.dropped += len(batch)
+            return
+        with self._cond:
+            self.recorded += len(records)
+            self.unlabeled += len(batch) - len(records)
+            self.flushes += 1
+            self.flush_seconds += time.perf_counter() - started
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._closing and len(self._pending) < self.max_batch:
+                    # Let a batch build up
+                    self._cond.wait(self.flush_interval_s)
+                batch, self._pending = self._pending, []
+                if not batch and self._closing:
+                    return
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Write everything queued so far from the calling thread."""
+        with self._cond:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+        self._unmap()
+        os.close(self._fd)
+
+    # Reading
+
+    def summary(self, crop_type=None, since=None, now=None):
+        """
+        Detection counts and mean confidence per crop and disease, from the
+        aggregates. Without `since` (UTC seconds) the counts cover all
+        time; with it they start at the beginning of that day, at most
+        `horizon_days` back, and include a per-day breakdown.
+        """
+        crops = [crop_type] if crop_type is not None else self.crops
+        if crop_type is not None and crop_type not in self.diseases:
+            raise KeyError(crop_type)
+        days = None
+        with self._lock:
+            committed = self._counts()[0]
+            if since is None:
+                counts = self._totals.copy()
+                confidence = self._total_confidence.copy()
+            else:
+                today = int(time.time() if now is None else now) // DAY_SECONDS
+                first = max(int(since) // DAY_SECONDS, today - self.horizon_days + 1)
+                days = np.arange(first, today + 1, dtype=np.int64) if first <= today else np.empty(0, np.int64)
+                buckets = days % self.horizon_days
+                valid = self._bucket_day[buckets] == days
+                days, buckets = days[valid], buckets[valid]
+                daily = self._day_counts[buckets]
+                counts = daily.sum(axis=0)
+                confidence = self._day_confidence[buckets].sum(axis=0)
+
+        result = {"records": committed, "crops": {}}
+        if since is not None:
+            result["since"] = date_of(first)
+        for name in crops:
+            start = self._codes[(name, self.diseases[name][0])][2]
+            diseases = {}
+            for offset, disease in enumerate(self.diseases[name]):
+                n = int(counts[start + offset])
+                if n:
+                    diseases[disease] = {
+                        "count": n,
+                        "avg_confidence": round(int(confidence[start + offset]) / n / CONFIDENCE_SCALE, 4),
+                    }
+            result["crops"][name] = {"total": sum(d["count"] for d in diseases.values()), "diseases": diseases}
+        if days is not None:
+            result["days"] = {}
+            for day, row in zip(days.tolist(), daily):
+                per_crop = {}
+                for name in crops:
+                    start = self._codes[(name, self.diseases[name][0])][2]
+                    found = {
+                        disease: int(row[start + offset])
+                        for offset, disease in enumerate(self.diseases[name]) if row[start + offset]
+                    }
+                    if found:
+                        per_crop[name] = found
+                if per_crop:
+                    result["days"][date_of(day)] = per_crop
+        return result
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                "pending": len(self._pending),
+                "recorded": self.recorded,
+                "dropped": self.dropped,
+                "unlabeled": self.unlabeled,
+                "flushes": self.flushes,
+                "flush_seconds": round(self.flush_seconds, 4),
+            }
+        with self._lock:
+            count, _, capacity = self._counts()
+        stats.update({"records": count, "capacity": capacity, "file_bytes": self._records_offset + capacity * RECORD.itemsize})
+        return stats
+
+
+def date_of(day):
+    return datetime.fromtimestamp(day * DAY_SECONDS, timezone.utc).date().isoformat()
+
+
+def parse_since(value):
+    """
+    UTC seconds for a `since` query value: Unix seconds, an ISO date or an
+    ISO datetime. Raises ValueError for anything a RECORD timestamp cannot hold.
+    """
+    try:
+        since = float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        since = moment.timestamp()
+    # Also rejects nan and inf
+    if not 0 <= since <= MAX_TIMESTAMP:
+        raise ValueError(f"since is outside 1970-01-01 to {date_of(MAX_TIMESTAMP // DAY_SECONDS)}")
+    return since
@@ -0,0 +1,82 @@
+from collections import namedtuple
+from types import MappingProxyType
+import json
+
+
+def encode(value):
+    """Encode a value the same way JSONResponse does"""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+# Pre-encoded pieces of one /predict body. Everything except the confidence
+# and the percentage inside the description is fixed per (crop, disease), so
+# a response is rendered as:
+#   head + confidence + description_head + percent + tail
+CompiledResponse = namedtuple("CompiledResponse", ["crop_type", "disease", "head", "description_head", "tail"])
+
+CONFIDENCE_KEY = b',"confidence":'
+
+
+def compile_response(crop_type, disease, treatment_info):
+    head = encode({"crop_type": crop_type, "disease": disease})[:-1] + CONFIDENCE_KEY
+    description_head = b',"description":' + encode(f"Detected {disease} on {crop_type} crop with ")[:-1]
+    tail = encode({
+        "treatment": treatment_info["treatment"],
+        "prevention": treatment_info["prevention"],
+        "recommendations": treatment_info["recommendations"],
+    })
+    tail = b'% confidence",' + tail[1:]
+    return CompiledResponse(crop_type, disease, head, description_head, tail)
+
+
+class ResponseIndex:
+    """
+    Immutable (crop, disease) -> CompiledResponse index built once at startup.
+
+    Treatments are resolved per crop: `crop_treatments[crop][disease]` wins
+    over `treatments[disease]`, which wins over `default_treatment`.
+    """
+
+    __slots__ = ("_entries", "_default_treatment", "_labels")
+
+    def __init__(self, crop_types, disease_library, treatments, crop_treatments, default_treatment):
+        entries = {}
+        for crop_type in crop_types:
+            overrides = crop_treatments.get(crop_type, {})
+            for disease in disease_library[crop_type]:
+                treatment_info = overrides.get(disease) or treatments.get(disease) or default_treatment
+                entries[(crop_type, disease)] = compile_response(crop_type, disease, treatment_info)
+        self._entries = MappingProxyType(entries)
+        self._default_treatment = default_treatment
+        self._labels = MappingProxyType({entry.head: label for label, entry in entries.items()})
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, crop_type, disease):
+        entry = self._entries.get((crop_type, disease))
+        if entry is None:
+            # Labels outside the compiled vocabulary still get a valid response
+            entry = compile_response(crop_type, disease, self._default_treatment)
+        return entry
+
+    def render(self, prediction):
+        """Return the serialized /predict body for a classifier prediction."""
+        entry = self.get(prediction["crop_type"], prediction["disease"])
+        confidence = prediction["confidence"]
+        return b"".join((
+            entry.head,
+            repr(round(confidence, 2)).encode(),
+            entry.description_head,
+            str(int(confidence * 100)).encode(),
+            entry.tail,
+        ))
+
+    def parse(self, payload):
+        """Return (crop_type, disease, confidence) of a body produced by render()."""
+        end = payload.find(CONFIDENCE_KEY) + len(CONFIDENCE_KEY)
+        label = self._labels.get(payload[:end])
+        if label is None:
+            body = json.loads(payload)
+            return body["crop_type"], body["disease"], body["confidence"]
+        return label[0], label[1], float(payload[end:payload.index(b",", end)])
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Pre-forking launcher for the AI crop health service.
+
+    python serve.py --workers 4 --port 8001
+
+The parent imports the app once, so the disease and treatment tables and the
+compiled responses are built before forking and the workers share those pages
+copy-on-write (gc.freeze keeps the collector from writing to them). It binds
+the listening socket, forks the workers, which all accept on it, restarts
+any worker that dies and stops them all on SIGTERM or SIGINT.
+
+A worker killed by a signal (SIGKILL from the OOM killer, a crash) may have
+died holding one of the process-shared locks, which would then block every
+other worker for good. So in that case the parent stops all workers (killing
+those that do not exit in time), replaces the shared cache with a fresh one,
+gives the prediction log a new lock and repairs it, and starts a new pool.
+
+The prediction cache is replaced by a SharedPredictionCache in shared memory,
+so a photo classified by one worker is a cache hit in every other worker and
+the cache is held once, not once per process. The perceptual-hash index stays
+per worker. With PREDICTION_LOG set, the prediction log is opened before
+forking as well, so every worker appends to the same file and /stats counts
+all their predictions.
+
+    WORKERS                      worker processes (default: CPU count)
+    PREDICTION_CACHE_ENTRIES     shared cache slots, 0 to disable (default 10000)
+    PREDICTION_CACHE_SLOT_BYTES  largest cacheable response in bytes (default 1024)
+    PREDICTION_CACHE_TTL         entry lifetime in seconds (default 3600)
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+import main
+from shared_cache import SharedPredictionCache
+
+# A worker that exits sooner than this after starting is restarted after a pause
+MIN_WORKER_LIFETIME_S = 1.0
+# Workers get this long to finish in-flight requests before the parent kills them
+WORKER_SHUTDOWN_TIMEOUT_S = 15.0
+
+
+def bind_socket(host, port, backlog=2048):
+    # An explicit IPPROTO_TCP makes asyncio set TCP_NODELAY on accepted connections; with proto 0
+    # it does not, and Nagle plus delayed ACKs add ~40 ms to every keep-alive response
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock, log_level):
+    """Serve the app on the inherited socket until uvicorn exits. Runs in the child."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(main.app, log_level=log_level, timeout_graceful_shutdown=10)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(sock, log_level):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock, log_level)
+        except BaseException:
+            logging.exception("Worker failed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def create_cache():
+    entries = int(os.getenv("PREDICTION_CACHE_ENTRIES", 10000))
+    if entries <= 0:
+        return None
+    cache = SharedPredictionCache(
+        max_entries=entries,
+        slot_bytes=int(os.getenv("PREDICTION_CACHE_SLOT_BYTES", 1024)),
+        ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL", 3600)),
+    )
+    # The routes look the cache up through the module global
+    main.prediction_cache = cache
+    logging.info(f"Shared prediction cache: {cache.max_entries} slots, {cache.size_bytes / 1e6:.1f} MB")
+    return cache
+
+
+def terminate(children, timeout_s=WORKER_SHUTDOWN_TIMEOUT_S):
+    """SIGTERM every worker, SIGKILL those still running after `timeout_s`, and reap them all."""
+    for pid in list(children):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + timeout_s
+    while children and time.monotonic() < deadline:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.05)
+        else:
+            children.pop(pid, None)
+    for pid in list(children):
+        logging.warning(f"Worker {pid} did not stop in time, killing it")
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(pid, 0)
+        children.pop(pid)
+
+
+def serve(host, port, workers, log_level="info"):
+    cache = create_cache()
+
+    # Opened here, not in each worker's startup, so the workers share one mapping and lock
+    main.open_prediction_log()
+
+    sock = bind_socket(host, port)
+    # Everything allocated so far is long-lived; keep the collector from touching (and so copying) it
+    gc.collect()
+    gc.freeze()
+
+    children = {}  # pid -> start time
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children[spawn(sock, log_level)] = time.monotonic()
+    logging.info(f"Serving on {host}:{port} with {workers} workers")
+
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            started = children.pop(pid, None)
+            if started is None or stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if time.monotonic() - started < MIN_WORKER_LIFETIME_S:
+                time.sleep(MIN_WORKER_LIFETIME_S)
+            if code >= 0:
+                logging.warning(f"Worker {pid} exited with status {code}, restarting it")
+            else:
+                logging.error(f"Worker {pid} was killed by signal {-code} and may have held a shared lock; "
+                              f"restarting all workers with fresh shared state")
+                terminate(children)
+                if cache is not None:
+                    cache.close(unlink=True)
+                    cache = create_cache()
+                if main.prediction_log is not None:
+                    main.prediction_log.recover()
+            while not stopping and len(children) < workers:
+                children[spawn(sock, log_level)] = time.monotonic()
+    finally:
+        sock.close()
+        if cache is not None:
+            cache.close(unlink=True)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s serve[%(process)d] %(message)s")
+    serve(args.host, args.port, args.workers, args.log_level)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
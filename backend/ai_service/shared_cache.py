@@ -0,0 +1,148 @@
+from multiprocessing import shared_memory
+import multiprocessing
+import struct
+import time
+
+# Slot: SHA-256 digest, expires_at, last_used, payload length (0 = empty), then the payload
+SLOT_HEADER = struct.Struct("<32sddI4x")
+# Per-stripe counters: hits, misses, evictions, expirations, entries
+COUNTERS = struct.Struct("<5q")
+COUNTER_NAMES = ("hits", "misses", "evictions", "expirations", "entries")
+
+
+class SharedPredictionCache:
+    """
+    Fixed-size prediction cache in shared memory, for pre-forked workers.
+
+    Same interface as PredictionCache. The table is set-associative: a digest
+    maps to one set of `ways` slots and evicts the least recently used slot of
+    that set when the set is full. Every slot holds up to `slot_bytes` of
+    payload; larger payloads are not cached. Sets are guarded by a fixed pool
+    of `stripes` process-shared locks, so the cache must be created in the
+    parent before forking and the workers inherit both the mapping and the
+    locks. Counters live in the segment too, so stats() covers all workers.
+    """
+
+    def __init__(self, max_entries=10000, slot_bytes=1024, ttl_seconds=3600, ways=8, stripes=64):
+        self.ways = ways
+        self.sets = max(1, -(-max_entries // ways))
+        self.max_entries = self.sets * ways
+        self.slot_bytes = slot_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stripes = stripes
+        self._slot_size = SLOT_HEADER.size + -(-slot_bytes // 8) * 8
+        self._slots_offset = stripes * COUNTERS.size
+        size = self._slots_offset + self.max_entries * self._slot_size
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._shm.buf[:size] = bytes(size)
+        self._buf = self._shm.buf
+        self._locks = [multiprocessing.Lock() for _ in range(stripes)]
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def size_bytes(self):
+        return self._shm.size
+
+    def _locate(self, key):
+        set_index = int.from_bytes(key[:8], "little") % self.sets
+        return set_index, set_index % self.stripes
+
+    def _slot_offset(self, set_index, way):
+        return self._slots_offset + (set_index * self.ways + way) * self._slot_size
+
+    def _bump(self, stripe, field, delta=1):
+        # Caller holds the stripe lock
+        offset = stripe * COUNTERS.size + field * 8
+        value = int.from_bytes(self._buf[offset:offset + 8], "little", signed=True) + delta
+        self._buf[offset:offset + 8] = value.to_bytes(8, "little", signed=True)
+
+    def get(self, digest):
+        """Return the cached payload for `digest` (hex), or None on a miss."""
+        key = bytes.fromhex(digest)
+        set_index, stripe = self._locate(key)
+        now = time.monotonic()
+        with self._locks[stripe]:
+            for way in range(self.ways):
+                offset = self._slot_offset(set_index, way)
+                slot_key, expires_at, _, length = SLOT_HEADER.unpack_from(self._buf, offset)
+                if not length or slot_key != key:
+                    continue
+                if expires_at <= now:
+                    SLOT_HEADER.pack_into(self._buf, offset, b"", 0.0, 0.0, 0)
+                    self._bump(stripe, 3)
+                    self._bump(stripe, 4, -1)
+                    break
+                SLOT_HEADER.pack_into(self._buf, offset, key, expires_at, now, length)
+                start = offset + SLOT_HEADER.size
+                payload = bytes(self._buf[start:start + length])
+                self._bump(stripe, 0)
+                return payload
+            self._bump(stripe, 1)
+            return None
+
+    def put(self, digest, payload):
+        """Store `payload` (bytes) under `digest`, evicting the set's least recently used slot if needed."""
+        length = len(payload)
+        if not 0 < length <= self.slot_bytes:
+            return
+        key = bytes.fromhex(digest)
+        set_index, stripe = self._locate(key)
+        now = time.monotonic()
+        with self._locks[stripe]:
+            target, target_used, occupied = None, None, False
+            for way in range(self.ways):
+                offset = self._slot_offset(set_index, way)
+                slot_key, expires_at, last_used, slot_length = SLOT_HEADER.unpack_from(self._buf, offset)
+                if slot_length and slot_key == key:
+                    target, occupied = offset, True
+                    break
+                # Prefer an empty slot, then an expired one, then the least recently used
+                rank = -2.0 if not slot_length else (-1.0 if expires_at <= now else last_used)
+                if target is None or rank < target_used:
+                    target, target_used, occupied = offset, rank, bool(slot_length)
+            if not occupied:
+                self._bump(stripe, 4)
+            elif target_used is not None and target_used >= 0:
+                self._bump(stripe, 2)
+            SLOT_HEADER.pack_into(self._buf, target, key, now + self.ttl_seconds, now, length)
+            start = target + SLOT_HEADER.size
+            self._buf[start:start + length] = payload
+
+    def clear(self):
+        for stripe, lock in enumerate(self._locks):
+            with lock:
+                for set_index in range(stripe, self.sets, self.stripes):
+                    for way in range(self.ways):
+                        SLOT_HEADER.pack_into(self._buf, self._slot_offset(set_index, way), b"", 0.0, 0.0, 0)
+                offset = stripe * COUNTERS.size + 4 * 8
+                self._buf[offset:offset + 8] = bytes(8)
+
+    def stats(self):
+        totals = dict.fromkeys(COUNTER_NAMES, 0)
+        for stripe, lock in enumerate(self._locks):
+            with lock:
+                for name, value in zip(COUNTER_NAMES, COUNTERS.unpack_from(self._buf, stripe * COUNTERS.size)):
+                    totals[name] += value
+        lookups = totals["hits"] + totals["misses"]
+        return {
+            "entries": totals["entries"],
+            "bytes": self._shm.size,
+            "max_entries": self.max_entries,
+            "slot_bytes": self.slot_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": totals["hits"],
+            "misses": totals["misses"],
+            "evictions": totals["evictions"],
+            "expirations": totals["expirations"],
+            "hit_rate": round(totals["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self, unlink=False):
+        """Release this process's mapping; the creating process passes unlink=True once the workers are gone."""
+        self._buf.release()
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
@@ -0,0 +1,141 @@
+from tempfile import SpooledTemporaryFile
+
+from python_multipart import MultipartParser
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import parse_options_header
+
+# File parts stay in memory up to this size, then spill to a temporary file
+SPOOL_MAX_BYTES = 1024 * 1024
+# Form fields that are not files are small; anything larger is a malformed request
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadedFile:
+    """
+    One file part of a multipart body. `size` counts every byte the client sent,
+    while `file` holds at most `max_file_bytes` + 1 of them, so an oversized part
+    costs no more than that and still shows it was too large.
+    """
+
+    __slots__ = ("name", "filename", "content_type", "file", "size")
+
+    def __init__(self, name, filename, content_type):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.file = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+b")
+        self.size = 0
+
+    def read(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        self.file.close()
+
+
+class _Part:
+    __slots__ = ("headers", "field", "value", "upload")
+
+    def __init__(self):
+        self.headers = {}
+        self.field = b""
+        self.value = b""
+        self.upload = None
+
+
+async def read_multipart(headers, chunks, max_file_bytes, max_files, max_fields=16):
+    """
+    Parse a multipart/form-data body from the `chunks` async iterator as it arrives.
+
+    Returns [(name, value)] in body order, where value is a str for plain fields
+    and an UploadedFile for file parts; the caller closes the files. Raises
+    ValueError for a malformed body and OverflowError past `max_files` files or
+    `max_fields` fields. Errors raised by `chunks` (such as limited_body's
+    OverflowError) propagate, and the parse stops there.
+    """
+    _, params = parse_options_header(headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise ValueError("Missing boundary in multipart body.")
+
+    items = []
+    counts = {"files": 0, "fields": 0}
+    part = None
+
+    def on_part_begin():
+        nonlocal part
+        part = _Part()
+
+    def on_header_field(data, start, end):
+        part.field += data[start:end]
+
+    def on_header_value(data, start, end):
+        part.value += data[start:end]
+
+    def on_header_end():
+        part.headers[part.field.lower()] = part.value
+        part.field = b""
+        part.value = b""
+
+    def on_headers_finished():
+        disposition, options = parse_options_header(part.headers.get(b"content-disposition"))
+        if disposition != b"form-data" or b"name" not in options:
+            raise ValueError("Multipart part without a form-data name.")
+        name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" in options:
+            counts["files"] += 1
+            if counts["files"] > max_files:
+                raise OverflowError(f"Too many files. At most {max_files} are allowed.")
+            content_type = part.headers.get(b"content-type", b"").decode("latin-1")
+            part.upload = UploadedFile(name, options[b"filename"].decode("utf-8", "replace"), content_type)
+            items.append((name, part.upload))
+        else:
+            counts["fields"] += 1
+            if counts["fields"] > max_fields:
+                raise OverflowError(f"Too many fields. At most {max_fields} are allowed.")
+            part.value = bytearray()
+            items.append((name, None))
+
+    def on_part_data(data, start, end):
+        upload = part.upload
+        if upload is None:
+            part.value += data[start:end]
+            if len(part.value) > MAX_FIELD_BYTES:
+                raise ValueError(f"Form field too large. Maximum size is {MAX_FIELD_BYTES} bytes.")
+            return
+        keep = min(end - start, max_file_bytes + 1 - upload.size)
+        upload.size += end - start
+        if keep > 0:
+            upload.file.write(data[start:start + keep])
+
+    def on_part_end():
+        if part.upload is None:
+            items[-1] = (items[-1][0], bytes(part.value).decode("utf-8", "replace"))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+    try:
+        async for chunk in chunks:
+            parser.write(chunk)
+        parser.finalize()
+    except MultipartParseError as e:
+        close_files(items)
+        raise ValueError(f"Malformed multipart body: {e}") from e
+    except BaseException:
+        close_files(items)
+        raise
+    return items
+
+
+def close_files(items):
+    for _, value in items:
+        if isinstance(value, UploadedFile):
+            value.close()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Check that the modules copied between ChatBoat and the AI crop health service are identical.
+
+The two services are deployed from their own directories and share no package,
+so a module both need is kept as one file per service. This exits with status 1
+and prints a diff when a copy has drifted from the others.
+
+    python check_shared.py
+"""
+import difflib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Groups of files that must stay byte-identical, relative to the repository root
+SHARED = [
+    ("backend/ai_service/metrics.py", "ChatBoat/utils/metrics.py"),
+]
+
+
+def check(groups=SHARED):
+    """Return a list of diffs, one per copy that differs from the first file of its group."""
+    problems = []
+    for reference, *copies in groups:
+        with open(os.path.join(ROOT, reference), encoding="utf-8") as f:
+            expected = f.read()
+        for copy in copies:
+            with open(os.path.join(ROOT, copy), encoding="utf-8") as f:
+                actual = f.read()
+            if actual != expected:
+                problems.append("".join(difflib.unified_diff(
+                    expected.splitlines(keepends=True), actual.splitlines(keepends=True), reference, copy,
+                )))
+    return problems
+
+
+def main():
+    problems = check()
+    for diff in problems:
+        sys.stdout.write(diff)
+    if problems:
+        print(f"{len(problems)} shared module copies differ; edit them together.", file=sys.stderr)
+        return 1
+    print(f"{sum(len(group) for group in SHARED)} shared module files are in sync.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test and benchmark harness for ChatBoat and the AI crop health service.
+
+Drives the endpoints at a fixed concurrency (closed loop) or at a fixed request
+rate (open loop), with generated photo-sized JPEGs, and reports throughput,
+p50/p95/p99 latency, an error breakdown and the services' peak RSS. With
+--start the services are launched locally and ChatBoat talks to the Gemini
+stub (ChatBoat/utils/genai_stub.py) instead of the real API.
+
+    # Start both services against the stub and run every scenario
+    python loadtest.py --start --concurrency 32 --duration 30 --output run.json
+
+    # Open-loop 20 req/s against already running services, compared with a baseline
+    python loadtest.py --scenarios chat,upload --rate 20 --duration 60 --compare run.json
+
+    # One request per endpoint, like the old smoke test
+    python loadtest.py --start --scenarios home,chat,upload --requests 1 --concurrency 1
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+from PIL import Image, ImageDraw, ImageFilter
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+QUESTIONS = {
+    "en": [
+        "What fertilizer should I use for wheat?",
+        "How do I stop leaf curl in cotton?",
+        "When should I irrigate rice in the tillering stage?",
+        "How to control aphids on mustard without chemicals?",
+        "Which tomato varieties resist late blight?",
+    ],
+    "hi": [
+        "गेहूं के लिए कौन सा उर्वरक डालें?",
+        "कपास में पत्ती मुड़ने की बीमारी कैसे रोकें?",
+        "धान में सिंचाई कब करनी चाहिए?",
+    ],
+}
+
+# name -> (service, method, path)
+SCENARIOS = {
+    "home": ("chatboat", "GET", "/"),
+    "chat": ("chatboat", "POST", "/chat"),
+    "upload": ("chatboat", "POST", "/upload"),
+    "health": ("ai", "GET", "/health"),
+    "predict": ("ai", "POST", "/predict"),
+    "predict-batch": ("ai", "POST", "/predict/batch"),
+}
+
+
+def make_leaf_photo(width, height, seed, quality=85):
+    """A leaf-like JPEG: green gradient, leaf shapes, lesions and sensor noise, so it compresses like a photo."""
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    image = Image.blend(image, Image.new("RGB", (width, height), (40, 110 + rng.randrange(40), 30)), 0.7)
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        rx, ry = rng.randrange(width // 8, width // 3), rng.randrange(height // 12, height // 5)
+        draw.ellipse((x - rx, y - ry, x + rx, y + ry), fill=(30 + rng.randrange(40), 120 + rng.randrange(80), 30))
+    for _ in range(60):
+        x, y, r = rng.randrange(width), rng.randrange(height), rng.randrange(4, max(5, width // 60))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=(120 + rng.randrange(60), 80, 20))
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    image = Image.blend(image, noise, 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def build_request(scenario, rng, images, args):
+    """Keyword arguments for requests.request() for one request of a scenario."""
+    language = rng.choice(("en", "en", "hi"))
+    if scenario == "chat":
+        message = rng.choice(QUESTIONS[language])
+        # Vary case, spacing and punctuation the way typed questions do
+        message = rng.choice((message, message.lower(), message.rstrip("?"), "  " + message.replace(" ", "  ")))
+        return {"json": {"message": message, "language": language}}
+    if scenario == "upload":
+        return {
+            "files": {"file": ("leaf.jpg", rng.choice(images), "image/jpeg")},
+            "data": {"query": rng.choice(("general", "pest", "fertilizer")), "language": language},
+        }
+    if scenario == "predict":
+        return {"files": {"file": ("leaf.jpg", rng.choice(images), "image/jpeg")}}
+    if scenario == "predict-batch":
+        return {"files": [("files", (f"leaf{i}.jpg", rng.choice(images), "image/jpeg")) for i in range(args.batch_size)]}
+    return {}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def peak_rss_mb(pid):
+    """Peak resident set size of a process in MB (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, TypeError):
+        pass
+    return None
+
+
+def process_io(pid):
+    """Syscall counters and open descriptors of a process from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/io") as handle:
+            counters = dict(line.split(": ") for line in handle.read().splitlines())
+        return {
+            "read_syscalls": int(counters["syscr"]),
+            "write_syscalls": int(counters["syscw"]),
+            "disk_write_bytes": int(counters["write_bytes"]),
+            "open_fds": len(os.listdir(f"/proc/{pid}/fd")),
+        }
+    except (OSError, TypeError, KeyError):
+        return None
+
+
+def run_scenario(scenario, base_url, images, args):
+    """
+    Run one scenario and return its statistics.
+
+    Closed loop: `concurrency` workers send back to back. Open loop (--rate):
+    request k is due at start + k / rate and its latency is measured from
+    that due time, so a slow server is not hidden by workers that stopped
+    sending (coordinated omission).
+    """
+    _, method, path = SCENARIOS[scenario]
+    url = base_url.rstrip("/") + path
+    if args.stream and scenario in ("chat", "upload"):
+        url += f"?stream={args.stream}"
+    lock = threading.Lock()
+    counter = iter(range(sys.maxsize))
+    latencies, first_bytes, errors = [], [], {}
+    started = time.perf_counter()
+    deadline = started + args.duration if args.requests is None else None
+
+    def next_request():
+        with lock:
+            k = next(counter)
+        if args.requests is not None and k >= args.requests:
+            return None
+        due = started + k / args.rate if args.rate else time.perf_counter()
+        if deadline is not None and due >= deadline:
+            return None
+        return due
+
+    def worker(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while True:
+            due = next_request()
+            if due is None:
+                return
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            kwargs = build_request(scenario, rng, images, args)
+            outcome = None
+            first_byte = None
+            try:
+                with session.request(method, url, timeout=args.timeout, stream=True, **kwargs) as response:
+                    tail = b""
+                    for chunk in response.iter_content(chunk_size=None):
+                        if first_byte is None:
+                            first_byte = time.perf_counter() - due
+                        tail = (tail + chunk)[-256:]
+                if response.status_code >= 400:
+                    outcome = f"HTTP {response.status_code}"
+                elif args.stream and b'"error"' in tail:
+                    outcome = "stream error"
+            except requests.RequestException as e:
+                outcome = type(e).__name__
+            elapsed = time.perf_counter() - due
+            with lock:
+                latencies.append(elapsed)
+                if first_byte is not None:
+                    first_bytes.append(first_byte)
+                if outcome is not None:
+                    errors[outcome] = errors.get(outcome, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    failed = sum(errors.values())
+    return {
+        "requests": len(latencies),
+        "ok": len(latencies) - failed,
+        "errors": failed,
+        "error_breakdown": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "ok_throughput_rps": round((len(latencies) - failed) / wall, 2) if wall else None,
+        "latency_ms": {
+            name: round(value * 1000, 2) if value is not None else None
+            for name, value in (
+                ("p50", percentile(latencies, 50)),
+                ("p95", percentile(latencies, 95)),
+                ("p99", percentile(latencies, 99)),
+                ("max", max(latencies) if latencies else None),
+                ("mean", sum(latencies) / len(latencies) if latencies else None),
+            )
+        },
+        # Time to the first body bytes; with --stream, when the first model chunk reaches the client
+        "ttfb_ms": {
+            name: round(value * 1000, 2) if value is not None else None
+            for name, value in (
+                ("p50", percentile(first_bytes, 50)),
+                ("p95", percentile(first_bytes, 95)),
+                ("p99", percentile(first_bytes, 99)),
+            )
+        },
+    }
+
+
+def start_service(name, port, args):
+    """Launch ChatBoat (against the Gemini stub) or the AI service and wait until it answers."""
+    if name == "chatboat":
+        if args.chatboat_server == "asgi":
+            command = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"]
+        else:
+            command = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--no-reload", "--no-debugger"]
+        cwd = os.path.join(ROOT, "ChatBoat")
+        env = {
+            "GENAI_STUB": "1",
+            "GENAI_STUB_LATENCY_MS": str(args.stub_latency_ms),
+            "GENAI_STUB_UPLOAD_LATENCY_MS": str(args.stub_upload_latency_ms),
+            "GENAI_STUB_ERROR_RATE": str(args.stub_error_rate),
+            "GENAI_STUB_ERROR_CODES": args.stub_error_codes,
+            "LOG_LEVEL": "WARNING",
+        }
+        probe = "/"
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"]
+        cwd = os.path.join(ROOT, "backend", "ai_service")
+        env = {}
+        probe = "/health"
+
+    process = subprocess.Popen(command, cwd=cwd, env={**os.environ, **env})
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with code {process.returncode}")
+        try:
+            requests.get(url + probe, timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{name} did not start on port {port}")
+
+
+def compare(results, baseline_path, threshold):
+    """Print deltas against a saved run and return the regressions beyond `threshold` (a fraction)."""
+    with open(baseline_path) as handle:
+        baseline = json.load(handle)["results"]
+    regressions = []
+    print(f"\nComparison with {baseline_path}:")
+    for scenario, current in results.items():
+        previous = baseline.get(scenario)
+        if previous is None:
+            continue
+        error_rate = current["errors"] / max(1, current["requests"])
+        previous_error_rate = previous["errors"] / max(1, previous["requests"])
+        checks = (
+            # metric, before, now, relative change that counts as worse
+            ("throughput_rps", previous["throughput_rps"], current["throughput_rps"], lambda change: change < -threshold),
+            ("p99_ms", previous["latency_ms"]["p99"], current["latency_ms"]["p99"], lambda change: change > threshold),
+        )
+        for metric, before, now, is_worse in checks:
+            if not before or now is None:
+                continue
+            change = (now - before) / before
+            flag = "  REGRESSION" if is_worse(change) else ""
+            print(f"  {scenario:>14} {metric:>14}: {before:10.2f} -> {now:10.2f} ({change:+.1%}){flag}")
+            if flag:
+                regressions.append((scenario, metric))
+        flag = "  REGRESSION" if error_rate - previous_error_rate > threshold else ""
+        print(f"  {scenario:>14} {'error_rate':>14}: {previous_error_rate:10.2%} -> {error_rate:10.2%}{flag}")
+        if flag:
+            regressions.append((scenario, "error_rate"))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--chatboat-url", default="http://localhost:5001")
+    parser.add_argument("--ai-url", default="http://localhost:8001")
+    parser.add_argument("--start", action="store_true", help="launch the services locally (ChatBoat uses the Gemini stub)")
+    parser.add_argument("--chatboat-port", type=int, default=5701)
+    parser.add_argument("--chatboat-server", choices=("flask", "asgi"), default="flask",
+                        help="with --start, serve ChatBoat with the threaded Flask server or uvicorn (asgi.py)")
+    parser.add_argument("--ai-port", type=int, default=8701)
+    parser.add_argument("--pid", action="append", default=[], metavar="SERVICE=PID",
+                        help="report peak RSS for an externally started service, e.g. chatboat=1234")
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--rate", type=float, help="open-loop request rate per second (default: closed loop)")
+    load.add_argument("--duration", type=float, default=20.0, help="seconds per scenario")
+    load.add_argument("--requests", type=int, help="requests per scenario (overrides --duration)")
+    load.add_argument("--timeout", type=float, default=60.0)
+    load.add_argument("--stream", choices=("sse", "ndjson"), help="request streamed chat/upload responses")
+    load.add_argument("--seed", type=int, default=1)
+
+    payload = parser.add_argument_group("images")
+    payload.add_argument("--image-sizes", default="1280x960,4032x3024", help="comma separated WxH of generated JPEGs")
+    payload.add_argument("--images-per-size", type=int, default=4)
+    payload.add_argument("--batch-size", type=int, default=16, help="images per predict-batch request")
+
+    stub = parser.add_argument_group("Gemini stub (with --start)")
+    stub.add_argument("--stub-latency-ms", type=float, default=1500)
+    stub.add_argument("--stub-upload-latency-ms", type=float, default=300)
+    stub.add_argument("--stub-error-rate", type=float, default=0.0)
+    stub.add_argument("--stub-error-codes", default="429,503")
+
+    report = parser.add_argument_group("results")
+    report.add_argument("--output", help="write results as JSON to this path")
+    report.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    report.add_argument("--regression-threshold", type=float, default=0.10,
+                        help="relative change in throughput/p99 (or absolute error rate) treated as a regression")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    images = []
+    if {"upload", "predict", "predict-batch"} & set(scenarios):
+        for size in args.image_sizes.split(","):
+            width, height = (int(v) for v in size.lower().split("x"))
+            images += [make_leaf_photo(width, height, seed) for seed in range(args.images_per_size)]
+        print(f"Generated {len(images)} JPEGs ({args.image_sizes}), "
+              f"{sum(map(len, images)) / len(images) / 1e6:.2f} MB average")
+
+    urls = {"chatboat": args.chatboat_url, "ai": args.ai_url}
+    pids = dict(entry.split("=", 1) for entry in args.pid)
+    processes = []
+    try:
+        if args.start:
+            for service, port in (("chatboat", args.chatboat_port), ("ai", args.ai_port)):
+                if any(SCENARIOS[s][0] == service for s in scenarios):
+                    process, urls[service] = start_service(service, port, args)
+                    processes.append(process)
+                    pids[service] = process.pid
+
+        results = {}
+        for scenario in scenarios:
+            service = SCENARIOS[scenario][0]
+            mode = f"{args.rate} req/s open loop" if args.rate else "closed loop"
+            print(f"\n{scenario}: {urls[service]}{SCENARIOS[scenario][2]}, {args.concurrency} workers, {mode}")
+            io_before = process_io(pids.get(service))
+            stats = run_scenario(scenario, urls[service], images, args)
+            stats["service_peak_rss_mb"] = peak_rss_mb(pids.get(service))
+            io_after = process_io(pids.get(service))
+            if io_before and io_after and stats["requests"]:
+                # Per-request syscalls include the socket traffic, so compare runs of the same scenario
+                stats["service_io"] = {
+                    "read_syscalls_per_request": round((io_after["read_syscalls"] - io_before["read_syscalls"]) / stats["requests"], 1),
+                    "write_syscalls_per_request": round((io_after["write_syscalls"] - io_before["write_syscalls"]) / stats["requests"], 1),
+                    "disk_write_bytes": io_after["disk_write_bytes"] - io_before["disk_write_bytes"],
+                    "open_fds_growth": io_after["open_fds"] - io_before["open_fds"],
+                }
+            results[scenario] = stats
+            latency = stats["latency_ms"]
+            print(
+                f"  {stats['requests']} requests in {stats['wall_seconds']}s: {stats['throughput_rps']} req/s "
+                f"({stats['ok_throughput_rps']} ok/s) | p50 {latency['p50']} ms p95 {latency['p95']} ms "
+                f"p99 {latency['p99']} ms max {latency['max']} ms | peak RSS {stats['service_peak_rss_mb']} MB"
+            )
+            ttfb = stats["ttfb_ms"]
+            print(f"  time to first byte: p50 {ttfb['p50']} ms p95 {ttfb['p95']} ms p99 {ttfb['p99']} ms")
+            if "service_io" in stats:
+                io = stats["service_io"]
+                print(f"  syscalls/request: {io['read_syscalls_per_request']} read, {io['write_syscalls_per_request']} write | "
+                      f"disk writes {io['disk_write_bytes']} B | open fds {io['open_fds_growth']:+d}")
+            if stats["error_breakdown"]:
+                print(f"  errors: {stats['error_breakdown']}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        except OSError:
+            commit = None
+        with open(args.output, "w") as handle:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "commit": commit or None,
+                    "host": platform.node(),
+                    "python": platform.python_version(),
+                    "cpus": os.cpu_count(),
+                    "args": vars(args),
+                },
+                "results": results,
+            }, handle, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.regression_threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.regression_threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())